@@ -0,0 +1,294 @@
+"""
+Cache delle risposte di catalogo camere e ricerca disponibilità
+
+Il backend predefinito è una LRU in memoria con scadenza (CACHE_DIMENSIONE
+voci, default 1024; CACHE_TTL_SECONDI secondi, default 300). Ogni voce
+appartiene a un gruppo ('camere' o 'disponibilita') e può avere un periodo
+[da, a): i commit che scrivono prenotazioni invalidano solo le ricerche con
+periodo sovrapposto alle date toccate, quelli che scrivono camere l'intero
+catalogo. Un altro backend (ad esempio Redis) deve implementare BackendCache
+e va aggiunto a crea_cache.
+
+La cache è per processo. La versione dei dati (riga versione_dati) è quella
+letta dalla sessione della richiesta (vedi versione_sessione), condivisa con
+l'ETag: se è più recente di quella della cache per commit di altri processi
+(altri worker, comandi da riga di comando), di cui non si conoscono le date
+toccate, la cache è svuotata. Un valore calcolato su una versione precedente
+a quella della cache (commit durante il calcolo, replica in ritardo) non è
+salvato.
+"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event, inspect
+from backend.database import SessionLocal, versione_sessione, versione_sessione_async
+from backend.models import Camera, Prenotazione
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")
+CACHE_DIMENSIONE = int(os.getenv("CACHE_DIMENSIONE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL_SECONDI", "300"))
+
+GRUPPO_CAMERE = "camere"
+GRUPPO_DISPONIBILITA = "disponibilita"
+
+# Periodo [da, a) delle date coinvolte
+Periodo = Tuple[date, date]
+
+
+def chiave_cache(operazione: str, **parametri) -> str:
+    """
+    Chiave normalizzata: operazione e parametri ordinati, senza i valori None
+
+    Args:
+        operazione: Nome dell'operazione (es. "camere/disponibili")
+        parametri: Parametri della richiesta
+
+    Returns:
+        Chiave testuale, uguale per richieste equivalenti
+    """
+    normalizzati = {
+        nome: valore.value if isinstance(valore, Enum) else valore
+        for nome, valore in parametri.items() if valore is not None
+    }
+    return f"{operazione}:{json.dumps(normalizzati, sort_keys=True, default=str, separators=(',', ':'))}"
+
+
+class BackendCache(ABC):
+    """Interfaccia dei backend di cache"""
+
+    @abstractmethod
+    def leggi(self, chiave: str) -> Optional[Any]:
+        """Valore della chiave, oppure None se assente o scaduto"""
+
+    @abstractmethod
+    def scrivi(self, chiave: str, valore: Any, gruppo: str, periodo: Optional[Periodo] = None):
+        """Salva un valore nel gruppo, eventualmente legato a un periodo di date"""
+
+    @abstractmethod
+    def invalida(self, gruppo: str, periodo: Optional[Periodo] = None) -> int:
+        """
+        Elimina le voci del gruppo con periodo sovrapposto (tutte se periodo è None)
+
+        Le voci senza periodo sono eliminate solo dalle invalidazioni dell'intero gruppo.
+
+        Returns:
+            Numero di voci eliminate
+        """
+
+    @abstractmethod
+    def statistiche(self) -> Dict[str, int]:
+        """Contatori di hit, miss, evizioni, scadenze e invalidazioni"""
+
+
+class CacheLRU(BackendCache):
+    """LRU in memoria con scadenza, protetta da lock"""
+
+    def __init__(self, dimensione: int = CACHE_DIMENSIONE, ttl: float = CACHE_TTL):
+        self.dimensione = dimensione
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # chiave -> (scadenza, gruppo, periodo, valore)
+        self._voci: "OrderedDict[str, tuple]" = OrderedDict()
+        self._contatori = {"hit": 0, "miss": 0, "evizioni": 0, "scadute": 0, "invalidate": 0}
+
+    def leggi(self, chiave: str) -> Optional[Any]:
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                self._contatori["miss"] += 1
+                return None
+            if voce[0] <= time.monotonic():
+                del self._voci[chiave]
+                self._contatori["scadute"] += 1
+                self._contatori["miss"] += 1
+                return None
+            self._voci.move_to_end(chiave)
+            self._contatori["hit"] += 1
+            return voce[3]
+
+    def scrivi(self, chiave: str, valore: Any, gruppo: str, periodo: Optional[Periodo] = None):
+        with self._lock:
+            self._voci[chiave] = (time.monotonic() + self.ttl, gruppo, periodo, valore)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.dimensione:
+                self._voci.popitem(last=False)
+                self._contatori["evizioni"] += 1
+
+    def invalida(self, gruppo: str, periodo: Optional[Periodo] = None) -> int:
+        with self._lock:
+            superate = [
+                chiave for chiave, (_, gruppo_voce, periodo_voce, _) in self._voci.items()
+                if gruppo_voce == gruppo and (
+                    periodo is None or (
+                        periodo_voce is not None
+                        and periodo_voce[0] < periodo[1]
+                        and periodo_voce[1] > periodo[0]
+                    )
+                )
+            ]
+            for chiave in superate:
+                del self._voci[chiave]
+            self._contatori["invalidate"] += len(superate)
+            return len(superate)
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._contatori, "voci": len(self._voci), "dimensione": self.dimensione}
+
+
+def crea_cache(backend: str = CACHE_BACKEND) -> BackendCache:
+    """Crea il backend di cache configurato"""
+    if backend == "memoria":
+        return CacheLRU()
+    raise ValueError(f"Backend di cache non supportato: {backend}")
+
+
+cache = crea_cache()
+
+# Versione dei dati a cui sono aggiornate le voci in cache
+_versione_cache: Optional[int] = None
+_lock_versione = threading.Lock()
+
+
+def allinea_versione(versione: int):
+    """
+    Svuota la cache se la versione dei dati non è quella delle voci
+
+    I commit di questo processo portano avanti la versione della cache dopo
+    le loro invalidazioni (vedi _applica_invalidazioni): una versione diversa
+    indica scritture di altri processi.
+    """
+    global _versione_cache
+    with _lock_versione:
+        # Versione precedente: letta prima di un commit già applicato, o da una replica in ritardo
+        if _versione_cache is not None and versione <= _versione_cache:
+            return
+        _versione_cache = versione
+        cache.invalida(GRUPPO_CAMERE)
+        cache.invalida(GRUPPO_DISPONIBILITA)
+
+
+def _salva_se_aggiornato(chiave: str, valore: Any, gruppo: str, periodo: Optional[Periodo], versione: int):
+    """Salva il valore se calcolato su dati non precedenti alla versione della cache"""
+    # Sotto il lock delle invalidazioni: un commit di questo processo avvenuto
+    # durante il calcolo ha già portato avanti la versione della cache
+    with _lock_versione:
+        if _versione_cache is None or versione >= _versione_cache:
+            cache.scrivi(chiave, valore, gruppo, periodo)
+
+
+def leggi_o_calcola(
+    chiave: str,
+    calcola: Callable[[], Any],
+    gruppo: str,
+    db,
+    periodo: Optional[Periodo] = None
+) -> Any:
+    """
+    Restituisce il valore in cache o lo calcola e lo salva
+
+    La versione dei dati è quella letta dalla sessione della richiesta, prima
+    del calcolo: se un commit con scritture avviene durante il calcolo, o se
+    la sessione legge una replica in ritardo, il valore non è salvato.
+
+    Args:
+        chiave: Chiave normalizzata (vedi chiave_cache)
+        calcola: Funzione senza argomenti che produce il valore con 'db'
+        gruppo: Gruppo della voce
+        db: Sessione della richiesta
+        periodo: Periodo di date da cui dipende il valore (opzionale)
+    """
+    versione = versione_sessione(db)[1]
+    allinea_versione(versione)
+    valore = cache.leggi(chiave)
+    if valore is not None:
+        return valore
+
+    valore = calcola()
+    _salva_se_aggiornato(chiave, valore, gruppo, periodo, versione)
+    return valore
+
+
+async def leggi_o_calcola_async(
+    chiave: str,
+    calcola: Callable[[], Awaitable[Any]],
+    gruppo: str,
+    db,
+    periodo: Optional[Periodo] = None
+) -> Any:
+    """Come leggi_o_calcola, con una sessione async e un calcolo async (solo con DATABASE_ASYNC)"""
+    versione = (await versione_sessione_async(db))[1]
+    allinea_versione(versione)
+    valore = cache.leggi(chiave)
+    if valore is not None:
+        return valore
+
+    valore = await calcola()
+    _salva_se_aggiornato(chiave, valore, gruppo, periodo, versione)
+    return valore
+
+
+def _periodi_prenotazione(prenotazione) -> List[Periodo]:
+    """Periodi occupati da una prenotazione prima e dopo le modifiche non salvate"""
+    stato = inspect(prenotazione)
+    check_in = stato.attrs.data_check_in.history
+    check_out = stato.attrs.data_check_out.history
+    periodi = [(prenotazione.data_check_in, prenotazione.data_check_out)]
+    if check_in.deleted or check_out.deleted:
+        periodi.append((
+            (check_in.deleted or [prenotazione.data_check_in])[0],
+            (check_out.deleted or [prenotazione.data_check_out])[0]
+        ))
+    return [periodo for periodo in periodi if None not in periodo]
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _registra_periodi(session, flush_context):
+    invalidazioni = session.info.setdefault("invalidazioni_cache", [])
+    for oggetto in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(oggetto, Camera):
+            invalidazioni.append((GRUPPO_CAMERE, None))
+            invalidazioni.append((GRUPPO_DISPONIBILITA, None))
+        elif isinstance(oggetto, Prenotazione):
+            invalidazioni.extend(
+                (GRUPPO_DISPONIBILITA, periodo) for periodo in _periodi_prenotazione(oggetto)
+            )
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _registra_istruzioni(stato):
+    # Le istruzioni su camera_notte accompagnano sempre una prenotazione
+    # salvata con il flush; UPDATE e DELETE diretti non indicano le date
+    if not (stato.is_insert or stato.is_update or stato.is_delete):
+        return
+    tabella = stato.statement.table.name
+    invalidazioni = stato.session.info.setdefault("invalidazioni_cache", [])
+    if tabella == "camere":
+        invalidazioni.append((GRUPPO_CAMERE, None))
+        invalidazioni.append((GRUPPO_DISPONIBILITA, None))
+    elif tabella == "prenotazioni":
+        invalidazioni.append((GRUPPO_DISPONIBILITA, None))
+
+
+@event.listens_for(SessionLocal, "after_commit", insert=True)
+def _applica_invalidazioni(session):
+    # Prima del listener di database.py, che consuma la nuova versione dei dati
+    global _versione_cache
+    versione = session.info.get("versione_dati")
+    with _lock_versione:
+        for gruppo, periodo in dict.fromkeys(session.info.pop("invalidazioni_cache", [])):
+            cache.invalida(gruppo, periodo)
+        # Solo se nessun altro processo ha scritto dall'ultima versione vista
+        if versione is not None and _versione_cache == versione - 1:
+            _versione_cache = versione
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _annulla_invalidazioni(session):
+    session.info.pop("invalidazioni_cache", None)
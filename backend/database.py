@@ -1,29 +1,307 @@
 """
 Configurazione del Database
 """
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Integer, String, Table, create_engine, event, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
+import random
+import time
+import uuid
+from typing import Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/hotel.db")
 
+# Thread del threadpool di FastAPI per endpoint e dependency sincroni
+# (impostato all'avvio dell'app); il pool dell'engine è dimensionato su questo
+THREADPOOL_THREAD = int(os.getenv("THREADPOOL_THREAD", "40"))
+
 # Crea la directory data se non esiste
 os.makedirs("data", exist_ok=True)
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=False
-)
+# Profilo prestazioni SQLite applicato a ogni nuova connessione: WAL (i
+# lettori non bloccano la scrittura), sync NORMAL (fsync ai checkpoint e non
+# a ogni commit), cache di pagine e mmap più grandi, tabelle temporanee in
+# memoria, attesa sui lock e vincoli di chiave esterna. SQLITE_PROFILO=
+# predefinito lascia le impostazioni di SQLite.
+SQLITE_PROFILO = os.getenv("SQLITE_PROFILO", "prestazioni")
+SQLITE_PRAGMA = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negativo: dimensione in KiB (64 MiB)
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+
+def applica_pragma(motore, pragma: dict):
+    """
+    Esegue i PRAGMA indicati su ogni nuova connessione SQLite dell'engine
+    
+    Args:
+        motore: Engine SQLAlchemy (ignorato se non SQLite)
+        pragma: Dizionario nome -> valore
+    """
+    if motore.dialect.name != "sqlite":
+        return
+    
+    @event.listens_for(motore, "connect")
+    def _imposta_pragma(connessione_dbapi, record):
+        cursore = connessione_dbapi.cursor()
+        try:
+            for nome, valore in pragma.items():
+                cursore.execute(f"PRAGMA {nome}={valore}")
+        finally:
+            cursore.close()
+
+
+def _opzioni_pool(url: str) -> dict:
+    """
+    Opzioni del pool per l'engine sincrono
+    
+    Il pool ha una connessione per thread del threadpool (vedi
+    THREADPOOL_THREAD): ogni richiesta usa solo la connessione della sua
+    sessione, anche per la versione dei dati (vedi versione_sessione). Con un
+    pool più piccolo le richieste concorrenti si bloccano a vicenda: i thread
+    attendono una connessione tenuta da sessioni che per serializzare la
+    risposta e chiudersi attendono un thread. Le connessioni oltre il pool
+    (max_overflow predefinito) servono a chi non usa il threadpool. SQLite in
+    memoria usa una connessione per thread e non ha limiti.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": THREADPOOL_THREAD}
+
+
+def crea_motore(url: str):
+    """
+    Engine sincrono con le opzioni del database primario (pool e PRAGMA SQLite)
+    
+    Args:
+        url: URL del database
+        
+    Returns:
+        Engine SQLAlchemy
+    """
+    motore = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {},
+        echo=False,
+        **_opzioni_pool(url)
+    )
+    if SQLITE_PROFILO == "prestazioni":
+        applica_pragma(motore, SQLITE_PRAGMA)
+    return motore
+
+
+engine = crea_motore(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Modalità async: le letture più frequenti (ricerca, dashboard, elenchi) usano
+# un AsyncEngine (aiosqlite o asyncpg) e sono eseguite sull'event loop invece
+# che nel threadpool; le scritture restano sincrone
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "0").lower() in ("1", "true", "si")
+DRIVER_ASYNC = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def url_async(url: str) -> str:
+    """
+    URL del database con il driver async corrispondente
+    
+    Args:
+        url: URL sincrono (es. sqlite:///./data/hotel.db)
+        
+    Returns:
+        URL con il driver async (es. sqlite+aiosqlite:///./data/hotel.db)
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in DRIVER_ASYNC:
+        raise ValueError(f"Modalità async non supportata per il database: {backend}")
+    return url.set(drivername=f"{backend}+{DRIVER_ASYNC[backend]}").render_as_string(hide_password=False)
+
+
+def crea_motore_async(url: str):
+    """
+    AsyncEngine con il driver async corrispondente all'URL e i PRAGMA SQLite
+    
+    Args:
+        url: URL del database (sincrono o già con il driver async)
+        
+    Returns:
+        AsyncEngine SQLAlchemy
+    """
+    # Import solo in modalità async: aiosqlite/asyncpg sono dipendenze opzionali
+    from sqlalchemy.ext.asyncio import create_async_engine
+    
+    motore = create_async_engine(url_async(url), echo=False)
+    if SQLITE_PROFILO == "prestazioni":
+        applica_pragma(motore.sync_engine, SQLITE_PRAGMA)
+    return motore
+
+
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    
+    async_engine = crea_motore_async(os.getenv("DATABASE_URL_ASYNC") or DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# Versione dei dati condivisa da tutti i processi (worker, comandi da riga
+# di comando): una sola riga, incrementata nella stessa transazione di ogni
+# commit che scrive camere, ospiti, prenotazioni o statistiche. Cache in
+# memoria, ETag e repliche la confrontano per riconoscere i dati superati;
+# 'istanza' distingue un database ricreato, la cui versione riparte da zero.
+#
+# La riga unica serializza i commit con scritture, ed è voluto: la versione
+# deve diventare visibile insieme ai dati del commit e in ordine di commit.
+# Un contatore non transazionale (sequenza PostgreSQL, tabella di log con
+# max(id)) la renderebbe visibile prima dei dati, o fuori ordine: un lettore
+# salverebbe in cache con la versione nuova una risposta senza quei dati.
+# L'incremento è l'ultima istruzione della transazione (before_commit): su
+# PostgreSQL il lock della riga è tenuto solo per la durata del COMMIT, su
+# SQLite i commit sono già serializzati dal lock del database e il costo è
+# una pagina in più scritta per commit (scripts/benchmark_versione.py, 8
+# thread con commit di un solo INSERT: circa 1.700 commit/s contro 2.800).
+tabella_versione_dati = Table(
+    "versione_dati",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("versione", Integer, nullable=False, default=0),
+    Column("istanza", String(32), nullable=False)
+)
+TABELLE_VERSIONATE = {"camere", "ospiti", "prenotazioni", "camera_notte", "statistiche_giornaliere"}
+
+
+# Istanza e versione dei dati: una lettura per chiave primaria
+_QUERY_VERSIONE = select(tabella_versione_dati.c.istanza, tabella_versione_dati.c.versione).where(
+    tabella_versione_dati.c.id == 1
+)
+
+
+def _leggi_versione(connessione=None) -> Tuple[str, int]:
+    """Istanza e versione dei dati lette dal database (dal primario senza connessione)"""
+    if connessione is None:
+        with engine.connect() as connessione:
+            riga = connessione.execute(_QUERY_VERSIONE).first()
+    else:
+        riga = connessione.execute(_QUERY_VERSIONE).first()
+    return tuple(riga) if riga is not None else ("", 0)
+
+
+async def _leggi_versione_async(connessione=None) -> Tuple[str, int]:
+    """Come _leggi_versione, con una connessione o sessione async (senza: async_engine)"""
+    if connessione is None:
+        async with async_engine.connect() as connessione:
+            riga = (await connessione.execute(_QUERY_VERSIONE)).first()
+    else:
+        riga = (await connessione.execute(_QUERY_VERSIONE)).first()
+    return tuple(riga) if riga is not None else ("", 0)
+
+
+def versione_dati(connessione=None) -> int:
+    """
+    Versione corrente dei dati, incrementata da ogni commit con scritture
+
+    Una lettura per chiave primaria della riga di versione_dati.
+
+    Args:
+        connessione: Connessione o sessione da cui leggere (default il primario)
+    """
+    return _leggi_versione(connessione)[1]
+
+
+async def versione_dati_async(connessione=None) -> int:
+    """Versione corrente dei dati letta sull'event loop (solo con DATABASE_ASYNC)"""
+    return (await _leggi_versione_async(connessione))[1]
+
+
+# Chiave di Session.info con istanza e versione lette dalla sessione
+_VERSIONE_SESSIONE = "versione_letta"
+
+
+def versione_sessione(db: Session) -> Tuple[str, int]:
+    """
+    Istanza e versione dei dati lette con la sessione, una volta per transazione
+
+    È la versione del database della sessione (primario o replica), letta
+    prima delle query della richiesta: i dati letti dopo non sono più
+    vecchi. ETag, cache e statistiche della stessa richiesta la condividono
+    senza altre letture né altre connessioni.
+
+    Args:
+        db: Sessione della richiesta
+
+    Returns:
+        Tupla (istanza, versione)
+    """
+    if _VERSIONE_SESSIONE not in db.info:
+        db.info[_VERSIONE_SESSIONE] = _leggi_versione(db)
+    return db.info[_VERSIONE_SESSIONE]
+
+
+async def versione_sessione_async(db) -> Tuple[str, int]:
+    """Come versione_sessione, con una sessione async (solo con DATABASE_ASYNC)"""
+    if _VERSIONE_SESSIONE not in db.info:
+        db.info[_VERSIONE_SESSIONE] = await _leggi_versione_async(db)
+    return db.info[_VERSIONE_SESSIONE]
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _scrittura_con_flush(session, flush_context):
+    oggetti = (*session.new, *session.dirty, *session.deleted)
+    if any(getattr(oggetto, "__tablename__", None) in TABELLE_VERSIONATE for oggetto in oggetti):
+        session.info["scritture"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _scrittura_con_istruzione(stato):
+    if stato.is_insert or stato.is_update or stato.is_delete:
+        if stato.statement.table.name in TABELLE_VERSIONATE:
+            stato.session.info["scritture"] = True
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _incrementa_versione(session):
+    # Il commit esegue il flush dopo questo listener: il flush anticipato
+    # registra le scritture ancora in sospeso
+    session.flush()
+    if session.info.get("scritture"):
+        # Nuova versione (None se la riga manca) per i listener after_commit
+        session.info["versione_dati"] = session.connection().execute(
+            update(tabella_versione_dati)
+            .where(tabella_versione_dati.c.id == 1)
+            .values(versione=tabella_versione_dati.c.versione + 1)
+            .returning(tabella_versione_dati.c.versione)
+        ).scalar()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _fine_scritture(session):
+    session.info.pop("scritture", None)
+    session.info.pop("versione_dati", None)
+    session.info.pop(_VERSIONE_SESSIONE, None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _annulla_scritture(session):
+    session.info.pop("scritture", None)
+    session.info.pop("versione_dati", None)
+    session.info.pop(_VERSIONE_SESSIONE, None)
+
 
 def get_db():
     """Dependency per ottenere una sessione del database"""
@@ -34,9 +312,94 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency per ottenere una sessione async del database (solo con DATABASE_ASYNC)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def errore_di_lock(errore: OperationalError) -> bool:
+    """True se l'errore è dovuto a un lock conteso (SQLite busy, deadlock, serializzazione)"""
+    messaggio = str(errore.orig).lower()
+    return any(testo in messaggio for testo in (
+        "database is locked",
+        "deadlock",
+        "could not serialize",
+        "lock not available",
+        "could not obtain lock"
+    ))
+
+
+def esegui_con_ritentativi(db: Session, operazione, tentativi: int = 5, attesa_iniziale: float = 0.05):
+    """
+    Esegue una transazione di scrittura ritentando in caso di lock conteso
+    
+    A ogni errore la transazione viene annullata, così il lock è rilasciato
+    subito; sui lock contesi l'operazione è ripetuta con attesa esponenziale
+    e jitter, fino a 'tentativi' volte.
+    
+    Args:
+        db: Sessione database
+        operazione: Funzione senza argomenti che esegue la transazione
+        tentativi: Numero massimo di esecuzioni
+        attesa_iniziale: Attesa in secondi prima del primo nuovo tentativo
+        
+    Returns:
+        Il valore restituito da operazione
+    """
+    for tentativo in range(tentativi):
+        try:
+            return operazione()
+        except OperationalError as errore:
+            db.rollback()
+            if not errore_di_lock(errore) or tentativo == tentativi - 1:
+                raise
+            time.sleep(attesa_iniziale * 2 ** tentativo * random.uniform(0.5, 1.5))
+        except Exception:
+            db.rollback()
+            raise
+
+
 def init_database():
     """Inizializza il database creando tutte le tabelle"""
     from backend.models import Base
+    from backend.inventario import inventario_da_inizializzare, ricostruisci_inventario
+    from backend.migrazioni import applica_migrazioni
+    from backend.ricerca_ospiti import inizializza_ricerca_ospiti
+    from backend.statistiche_giornaliere import ricostruisci_statistiche, statistiche_da_inizializzare
     Base.metadata.create_all(bind=engine)
+    
+    # Riga della versione dei dati, creata una volta per database
+    try:
+        with engine.begin() as connessione:
+            if connessione.execute(select(tabella_versione_dati.c.id)).first() is None:
+                connessione.execute(insert(tabella_versione_dati).values(
+                    id=1, versione=0, istanza=uuid.uuid4().hex[:8]
+                ))
+    except IntegrityError:
+        # Creata da un altro processo avviato insieme a questo
+        pass
+    
+    # Modifiche allo schema delle tabelle esistenti
+    migrazioni = applica_migrazioni(engine)
+    if migrazioni:
+        print(f"✅ Migrazioni applicate: {', '.join(migrazioni)}")
+    inizializza_ricerca_ospiti(engine)
+    
+    # Popola camera_notte sui database creati prima dell'inventario notti
+    db = SessionLocal()
+    try:
+        if inventario_da_inizializzare(db):
+            conflitti = ricostruisci_inventario(db)
+            db.commit()
+            print(f"✅ Inventario camera_notte popolato ({len(conflitti)} prenotazioni in conflitto)")
+        
+        # Popola statistiche_giornaliere sui database creati prima della tabella
+        if statistiche_da_inizializzare(db):
+            righe = ricostruisci_statistiche(db)
+            db.commit()
+            print(f"✅ Statistiche giornaliere popolate ({righe} righe)")
+    finally:
+        db.close()
     print("✅ Database inizializzato con successo!")
 
@@ -0,0 +1,172 @@
+"""
+Calcolo vettoriale della disponibilità camere × giorni con NumPy
+"""
+import base64
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import Session
+from backend.models import Camera, Prenotazione, TipoCamera
+from backend.utils import calcola_prezzo_totale, filtro_sovrapposizione, filtro_stati_attivi
+
+
+def matrice_occupazione(
+    db: Session,
+    da: date,
+    a: date,
+    tipo: Optional[TipoCamera] = None
+) -> Tuple[List[tuple], np.ndarray]:
+    """
+    Costruisce la matrice di occupazione camere × giorni nel periodo [da, a)
+
+    Le prenotazioni attive sovrapposte al periodo sono lette con una sola
+    query, raggruppate per camera: per ogni camera una stringa con le date
+    ISO di check-in e check-out dei soggiorni concatenate (20 caratteri per
+    soggiorno), così il driver crea un oggetto per camera invece di tre per
+    prenotazione e NumPy converte tutte le date da un unico buffer. Ogni
+    soggiorno è poi riportato sulla matrice con un array alle differenze
+    (+1 al check-in, -1 al check-out) e una somma cumulativa.
+
+    Args:
+        db: Sessione database
+        da: Primo giorno del periodo
+        a: Giorno finale escluso
+        tipo: Tipo di camera (opzionale)
+
+    Returns:
+        Tupla (camere, matrice): camere come (id, numero, tipo, prezzo_per_notte)
+        ordinate per id e matrice booleana camere × giorni, True se occupata
+    """
+    giorni = (a - da).days
+
+    query_camere = select(Camera.id, Camera.numero, Camera.tipo, Camera.prezzo_per_notte).order_by(Camera.id)
+    # Date come testo ISO AAAA-MM-GG (su PostgreSQL con il DateStyle ISO predefinito)
+    soggiorno = cast(Prenotazione.data_check_in, String) + cast(Prenotazione.data_check_out, String)
+    query_prenotazioni = select(
+        Prenotazione.camera_id,
+        func.aggregate_strings(soggiorno, "")
+    ).where(
+        filtro_stati_attivi(),
+        filtro_sovrapposizione(da, a)
+    ).group_by(Prenotazione.camera_id)
+    if tipo is not None:
+        query_camere = query_camere.where(Camera.tipo == tipo)
+        query_prenotazioni = query_prenotazioni.join(Camera).where(Camera.tipo == tipo)
+
+    # Esecuzione Core sulla connessione: niente caricamento ORM riga per riga
+    connessione = db.connection()
+    camere = connessione.execute(query_camere).all()
+    prenotazioni = connessione.execute(query_prenotazioni).all()
+
+    occupazione = np.zeros((len(camere), giorni), dtype=bool)
+    if not camere or not prenotazioni:
+        return camere, occupazione
+
+    ids_camere = np.fromiter((c[0] for c in camere), dtype=np.int64, count=len(camere))
+    camera_ids, soggiorni = zip(*prenotazioni)
+    per_camera = np.fromiter((len(s) for s in soggiorni), dtype=np.int64, count=len(soggiorni)) // 20
+    righe = np.repeat(np.searchsorted(ids_camere, np.asarray(camera_ids, dtype=np.int64)), per_camera)
+
+    # Coppie (check-in, check-out) come datetime64, un soggiorno per riga
+    date_soggiorni = np.frombuffer("".join(soggiorni).encode("ascii"), dtype="S10").astype("datetime64[D]")
+    origine = np.datetime64(da, "D")
+    inizio, fine = np.clip(
+        (date_soggiorni.reshape(-1, 2) - origine).astype(np.int64), 0, giorni
+    ).T
+
+    differenze = np.zeros((len(camere), giorni + 1), dtype=np.int32)
+    np.add.at(differenze, (righe, inizio), 1)
+    np.add.at(differenze, (righe, fine), -1)
+    np.cumsum(differenze[:, :-1], axis=1, out=differenze[:, :-1])
+    occupazione = differenze[:, :-1] > 0
+
+    return camere, occupazione
+
+
+def codifica_bitmap(occupazione: np.ndarray) -> List[str]:
+    """
+    Codifica ogni riga della matrice come bitmap base64
+
+    Un bit per giorno, il primo giorno nel bit più significativo del primo
+    byte; l'ultimo byte è completato con zeri.
+
+    Args:
+        occupazione: Matrice booleana camere × giorni
+
+    Returns:
+        Una stringa base64 per camera
+    """
+    righe = np.packbits(occupazione, axis=1)
+    return [base64.b64encode(riga.tobytes()).decode("ascii") for riga in righe]
+
+
+def codifica_segmenti(occupazione: np.ndarray) -> List[List[List[int]]]:
+    """
+    Codifica ogni riga della matrice come segmenti occupati (run-length)
+
+    Args:
+        occupazione: Matrice booleana camere × giorni
+
+    Returns:
+        Per ogni camera la lista di [giorno_iniziale, numero_giorni] occupati
+    """
+    bordi = np.diff(np.pad(occupazione.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    segmenti = []
+    for riga in bordi:
+        inizi = np.flatnonzero(riga == 1)
+        fini = np.flatnonzero(riga == -1)
+        segmenti.append(np.column_stack((inizi, fini - inizi)).tolist())
+    return segmenti
+
+
+def finestre_libere(
+    db: Session,
+    da: date,
+    a: date,
+    notti: int,
+    tipo: Optional[TipoCamera] = None,
+    limite: int = 20
+) -> List[Tuple[int, date, float]]:
+    """
+    Trova i soggiorni di 'notti' notti liberi nel periodo [da, a), ordinati per prezzo
+
+    Una finestra scorrevole sulla matrice di occupazione: con la somma
+    cumulativa per camera, le notti occupate di ogni finestra sono una
+    differenza tra due colonne, e le finestre libere sono quelle a zero.
+
+    Args:
+        db: Sessione database
+        da: Primo check-in possibile
+        a: Ultimo check-out possibile
+        notti: Durata del soggiorno in notti
+        tipo: Tipo di camera (opzionale)
+        limite: Numero massimo di risultati
+
+    Returns:
+        Lista di (camera_id, data_check_in, prezzo_totale), dal prezzo più
+        basso e, a parità di prezzo, dal check-in più vicino
+    """
+    camere, occupazione = matrice_occupazione(db, da, a, tipo)
+    if not camere or occupazione.shape[1] < notti:
+        return []
+
+    cumulata = np.zeros((len(camere), occupazione.shape[1] + 1), dtype=np.int32)
+    np.cumsum(occupazione, axis=1, out=cumulata[:, 1:])
+    libere = (cumulata[:, notti:] - cumulata[:, :-notti]) == 0
+
+    righe, inizi = np.nonzero(libere)
+    if righe.size == 0:
+        return []
+
+    # Il prezzo dipende solo dalla camera: calcolato una volta per camera
+    prezzi = np.array([
+        calcola_prezzo_totale(prezzo_per_notte, da, da + timedelta(days=notti))
+        for _, _, _, prezzo_per_notte in camere
+    ])
+    ordine = np.lexsort((inizi, prezzi[righe]))[:limite]
+
+    return [
+        (camere[riga][0], da + timedelta(days=int(inizio)), float(prezzi[riga]))
+        for riga, inizio in zip(righe[ordine], inizi[ordine])
+    ]
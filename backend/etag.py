@@ -0,0 +1,63 @@
+"""
+ETag e GET condizionali per gli endpoint di catalogo e dashboard
+
+L'ETag non è un hash della risposta: combina l'istanza e la versione dei
+dati, lette dalla riga versione_dati (incrementata nella transazione di ogni
+commit che scrive camere, ospiti o prenotazioni, da qualsiasi processo), e la
+data di oggi, da cui dipendono arrivi, partenze e occupazione. La versione è
+letta con la sessione della richiesta (vedi versione_sessione), quindi dal
+database da cui la risposta è letta, replica compresa: l'endpoint e la cache
+riusano la stessa lettura. Se l'header If-None-Match contiene l'ETag
+corrente la richiesta termina con 304 dopo la sola lettura della versione,
+senza eseguire le query dell'endpoint né serializzare. Gli endpoint async
+usano etag_dati_async.
+"""
+from datetime import date
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from backend.database import versione_sessione, versione_sessione_async
+from backend.repliche import get_async_db_lettura, get_db_lettura
+
+
+def _etag(istanza: str, versione: int) -> str:
+    """ETag di istanza e versione dei dati e della data di oggi"""
+    return f'"{istanza}-{versione}-{date.today().isoformat()}"'
+
+
+def _imposta_etag(request: Request, response: Response, etag: str) -> str:
+    """Termina con 304 se il client ha già l'ETag, altrimenti lo imposta sulla risposta"""
+    richiesti = {valore.strip() for valore in request.headers.get("if-none-match", "").split(",")}
+    if etag in richiesti or "*" in richiesti:
+        raise HTTPException(304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return etag
+
+
+def etag_dati(request: Request, response: Response, db: Session = Depends(get_db_lettura)) -> str:
+    """
+    Dependency per le GET condizionali
+
+    Usa la stessa sessione dell'endpoint (FastAPI risolve get_db_lettura una
+    volta per richiesta).
+
+    Args:
+        request: Richiesta HTTP
+        response: Risposta su cui impostare l'ETag
+        db: Sessione di lettura della richiesta
+
+    Returns:
+        L'ETag impostato sulla risposta
+
+    Raises:
+        HTTPException: 304 se If-None-Match contiene l'ETag corrente
+    """
+    # Letto prima delle query: se un commit avviene nel frattempo, la
+    # risposta è più recente dell'ETag e la richiesta successiva la rilegge
+    return _imposta_etag(request, response, _etag(*versione_sessione(db)))
+
+
+async def etag_dati_async(request: Request, response: Response, db=Depends(get_async_db_lettura)) -> str:
+    """Dependency per le GET condizionali degli endpoint async (solo con DATABASE_ASYNC), vedi etag_dati"""
+    return _imposta_etag(request, response, _etag(*await versione_sessione_async(db)))
@@ -0,0 +1,308 @@
+"""
+Export delle prenotazioni in streaming (CSV, NDJSON, Parquet e Arrow IPC)
+
+Le righe sono lette a blocchi di BLOCCO_EXPORT con yield_per e ogni blocco
+è codificato e inviato prima di leggere il successivo: la memoria usata non
+dipende dal numero di prenotazioni esportate.
+
+I formati colonnari convertono ogni blocco letto dal database direttamente
+in un record batch Arrow tipizzato (date, enum codificati a dizionario,
+prezzi decimali). Export su file da riga di comando:
+    python -m backend.export --formato parquet --da 2025-01-01 --a 2025-12-31 prenotazioni.parquet
+"""
+import csv
+import io
+import json
+from datetime import date
+from typing import Iterator, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import Date, Engine, Enum, Select, String, select, type_coerce
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.models import Camera, Ospite, Prenotazione, StatoPrenotazione, TipoCamera
+
+BLOCCO_EXPORT = 1000
+# Blocchi più grandi per i formati colonnari: ogni blocco è un row group Parquet
+BLOCCO_COLONNARE = 10000
+
+# Colonne esportate: prenotazione, camera e ospite
+COLONNE_EXPORT = {
+    "id": Prenotazione.id,
+    "data_check_in": Prenotazione.data_check_in,
+    "data_check_out": Prenotazione.data_check_out,
+    "stato": Prenotazione.stato,
+    "numero_ospiti": Prenotazione.numero_ospiti,
+    "prezzo_totale": Prenotazione.prezzo_totale,
+    "camera_id": Camera.id,
+    "camera_numero": Camera.numero,
+    "camera_tipo": Camera.tipo,
+    "camera_piano": Camera.piano,
+    "ospite_id": Ospite.id,
+    "ospite_nome": Ospite.nome,
+    "ospite_cognome": Ospite.cognome,
+    "ospite_documento": Ospite.documento,
+    "ospite_nazionalita": Ospite.nazionalita,
+    "ospite_email": Ospite.email,
+    "ospite_telefono": Ospite.telefono,
+}
+
+
+def query_export(
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    colonne: Optional[list] = None
+) -> Select:
+    """
+    Prenotazioni con check-in nell'intervallo [da, a] unite a camera e ospite
+
+    Args:
+        da: Primo giorno di check-in incluso (opzionale)
+        a: Ultimo giorno di check-in incluso (opzionale)
+        colonne: Espressioni da selezionare (default le colonne di COLONNE_EXPORT)
+
+    Returns:
+        Select ordinata per check-in e id
+    """
+    query = (
+        select(*(colonne or COLONNE_EXPORT.values()))
+        .select_from(Prenotazione)
+        .join(Camera, Camera.id == Prenotazione.camera_id)
+        .join(Ospite, Ospite.id == Prenotazione.ospite_id)
+        .order_by(Prenotazione.data_check_in, Prenotazione.id)
+    )
+    if da:
+        query = query.where(Prenotazione.data_check_in >= da)
+    if a:
+        query = query.where(Prenotazione.data_check_in <= a)
+    return query
+
+
+def _valore(valore):
+    """Valore esportabile: date in ISO, enum con il loro valore testuale"""
+    if isinstance(valore, date):
+        return valore.isoformat()
+    return getattr(valore, "value", valore)
+
+
+def _sessione(motore: Optional[Engine]) -> Session:
+    """Sessione sul primario, o sull'engine indicato (ad esempio una replica in lettura)"""
+    return SessionLocal() if motore is None else Session(bind=motore)
+
+
+def _blocchi(da: Optional[date], a: Optional[date], motore: Optional[Engine] = None) -> Iterator[list]:
+    """
+    Righe dell'export a blocchi, con una sessione propria
+
+    La sessione è aperta dal generatore e non dalla richiesta, così resta
+    valida per tutta la durata dello streaming.
+    """
+    db = _sessione(motore)
+    try:
+        risultato = db.execute(query_export(da, a).execution_options(yield_per=BLOCCO_EXPORT))
+        for blocco in risultato.partitions():
+            yield [[_valore(v) for v in riga] for riga in blocco]
+    finally:
+        db.close()
+
+
+def righe_csv(
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    motore: Optional[Engine] = None
+) -> Iterator[str]:
+    """Export CSV: intestazione e poi un blocco di righe per ogni lettura"""
+    buffer = io.StringIO()
+    scrittore = csv.writer(buffer)
+    scrittore.writerow(COLONNE_EXPORT)
+    yield buffer.getvalue()
+
+    for blocco in _blocchi(da, a, motore):
+        buffer.seek(0)
+        buffer.truncate()
+        scrittore.writerows(blocco)
+        yield buffer.getvalue()
+
+
+def righe_ndjson(
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    motore: Optional[Engine] = None
+) -> Iterator[str]:
+    """Export NDJSON: un oggetto JSON per riga"""
+    nomi = list(COLONNE_EXPORT)
+    for blocco in _blocchi(da, a, motore):
+        yield "".join(
+            json.dumps(dict(zip(nomi, riga)), ensure_ascii=False) + "\n"
+            for riga in blocco
+        )
+
+
+# Schema Arrow delle colonne di COLONNE_EXPORT
+SCHEMA_ARROW = pa.schema([
+    ("id", pa.int64()),
+    ("data_check_in", pa.date32()),
+    ("data_check_out", pa.date32()),
+    ("stato", pa.dictionary(pa.int8(), pa.string())),
+    ("numero_ospiti", pa.int32()),
+    ("prezzo_totale", pa.decimal128(12, 2)),
+    ("camera_id", pa.int64()),
+    ("camera_numero", pa.string()),
+    ("camera_tipo", pa.dictionary(pa.int8(), pa.string())),
+    ("camera_piano", pa.int32()),
+    ("ospite_id", pa.int64()),
+    ("ospite_nome", pa.string()),
+    ("ospite_cognome", pa.string()),
+    ("ospite_documento", pa.string()),
+    ("ospite_nazionalita", pa.string()),
+    ("ospite_email", pa.string()),
+    ("ospite_telefono", pa.string()),
+])
+
+# Enum del database (salvati per nome) -> dizionario fisso con i valori,
+# uguale in tutti i batch
+_DIZIONARI = {
+    "stato": StatoPrenotazione,
+    "camera_tipo": TipoCamera,
+}
+
+
+def _colonna_arrow(nome: str, valori: tuple, tipo: pa.DataType) -> pa.Array:
+    """Converte i valori grezzi di una colonna nel tipo Arrow dello schema"""
+    if nome in _DIZIONARI:
+        enumerazione = _DIZIONARI[nome]
+        indici = pc.index_in(pa.array(valori, pa.string()), value_set=pa.array([e.name for e in enumerazione]))
+        return pa.DictionaryArray.from_arrays(
+            indici.cast(pa.int8()), pa.array([e.value for e in enumerazione])
+        )
+    if pa.types.is_date(tipo):
+        # Testo da SQLite, datetime.date dai driver PostgreSQL: entrambi arrivano a date32
+        return pa.array(valori).cast(tipo)
+    if pa.types.is_decimal(tipo):
+        return pc.round(pa.array(valori, pa.float64()), tipo.scale).cast(tipo, safe=False)
+    return pa.array(valori, tipo)
+
+
+def record_batch_prenotazioni(
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    motore: Optional[Engine] = None
+) -> Iterator[pa.RecordBatch]:
+    """
+    Prenotazioni unite a camera e ospite come record batch Arrow
+
+    Date ed enum sono letti senza conversione per riga (le date come testo
+    su SQLite, come datetime.date sugli altri database) e convertiti per
+    colonna da Arrow: ogni blocco passa dalle tuple del cursore alle colonne senza
+    oggetti o dizionari per riga.
+
+    Args:
+        da: Primo giorno di check-in incluso (opzionale)
+        a: Ultimo giorno di check-in incluso (opzionale)
+        motore: Engine da cui leggere, ad esempio una replica (default: il primario)
+
+    Returns:
+        Iteratore di record batch con schema SCHEMA_ARROW
+    """
+    grezze = query_export(da, a, [
+        type_coerce(colonna, String) if isinstance(colonna.type, (Date, Enum)) else colonna
+        for colonna in COLONNE_EXPORT.values()
+    ])
+
+    db = _sessione(motore)
+    try:
+        risultato = db.connection().execution_options(yield_per=BLOCCO_COLONNARE).execute(grezze)
+        for blocco in risultato.partitions():
+            colonne = zip(*blocco)
+            yield pa.RecordBatch.from_arrays(
+                [
+                    _colonna_arrow(campo.name, valori, campo.type)
+                    for campo, valori in zip(SCHEMA_ARROW, colonne)
+                ],
+                schema=SCHEMA_ARROW
+            )
+    finally:
+        db.close()
+
+
+class _BufferStreaming(io.RawIOBase):
+    """File in sola scrittura che accumula i byte scritti fino al prelievo"""
+
+    def __init__(self):
+        self._parti = []
+        self._posizione = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dati):
+        self._parti.append(bytes(dati))
+        self._posizione += len(dati)
+        return len(dati)
+
+    def tell(self):
+        return self._posizione
+
+    def preleva(self) -> bytes:
+        dati = b"".join(self._parti)
+        self._parti.clear()
+        return dati
+
+
+def scrivi_colonnare(
+    formato: str,
+    destinazione,
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    motore: Optional[Engine] = None
+) -> Iterator[None]:
+    """
+    Scrive l'export Parquet ('parquet', un row group per blocco) o Arrow IPC
+    stream ('arrow') su un file aperto in scrittura binaria
+
+    È un generatore che avanza di un blocco alla volta, così chi legge la
+    destinazione può inviarne il contenuto tra un blocco e l'altro.
+    """
+    if formato == "parquet":
+        scrittore = pq.ParquetWriter(destinazione, SCHEMA_ARROW, compression="zstd")
+    else:
+        scrittore = pa.ipc.new_stream(destinazione, SCHEMA_ARROW)
+    try:
+        for batch in record_batch_prenotazioni(da, a, motore):
+            scrittore.write_batch(batch)
+            yield
+    finally:
+        scrittore.close()
+    # Ultimo passo dopo la chiusura: il footer Parquet è scritto da close()
+    yield
+
+
+def byte_colonnari(
+    formato: str,
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    motore: Optional[Engine] = None
+) -> Iterator[bytes]:
+    """Export Parquet o Arrow IPC come sequenza di blocchi di byte, per lo streaming HTTP"""
+    buffer = _BufferStreaming()
+    for _ in scrivi_colonnare(formato, buffer, da, a, motore):
+        dati = buffer.preleva()
+        if dati:
+            yield dati
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export colonnare delle prenotazioni")
+    parser.add_argument("file", help="File di destinazione")
+    parser.add_argument("--formato", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--da", type=date.fromisoformat, help="Primo giorno di check-in (AAAA-MM-GG)")
+    parser.add_argument("--a", type=date.fromisoformat, help="Ultimo giorno di check-in (AAAA-MM-GG)")
+    argomenti = parser.parse_args()
+
+    with open(argomenti.file, "wb") as file:
+        for _ in scrivi_colonnare(argomenti.formato, file, argomenti.da, argomenti.a):
+            pass
+    print(f"✅ Export {argomenti.formato} scritto in {argomenti.file}")
@@ -0,0 +1,183 @@
+"""
+Chiavi di idempotenza per le operazioni di scrittura sulle prenotazioni
+
+Il client invia l'header Idempotency-Key; la prima esecuzione riuscita salva
+la risposta nella stessa transazione delle scritture, e ogni nuovo tentativo
+con la stessa chiave riceve la risposta salvata senza rieseguire l'operazione.
+Le risposte scadono dopo IDEMPOTENZA_TTL_ORE ore (default 24).
+
+Pulizia manuale delle risposte scadute:
+    python -m backend.idempotenza
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.models import RispostaIdempotente
+
+IDEMPOTENZA_TTL = timedelta(hours=float(os.getenv("IDEMPOTENZA_TTL_ORE", "24")))
+INTERVALLO_PULIZIA = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def adesso_utc() -> datetime:
+    """Istante corrente in UTC senza fuso, come le date salvate in creata_il"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def impronta_richiesta(dati: Any = None) -> str:
+    """Impronta SHA-256 del corpo della richiesta, per riconoscere chiavi riusate"""
+    testo = json.dumps(jsonable_encoder(dati), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(testo.encode("utf-8")).hexdigest()
+
+
+def risposta_salvata(
+    db: Session,
+    chiave: str,
+    operazione: str,
+    impronta: str
+) -> Optional[JSONResponse]:
+    """
+    Cerca la risposta salvata per una chiave non scaduta
+
+    Args:
+        db: Sessione database
+        chiave: Valore dell'header Idempotency-Key
+        operazione: Metodo e percorso della richiesta
+        impronta: Impronta del corpo della richiesta
+
+    Returns:
+        La risposta salvata, oppure None se la chiave non è mai stata usata
+
+    Raises:
+        HTTPException: 422 se la chiave è stata usata per un'altra richiesta
+    """
+    salvata = db.scalar(select(RispostaIdempotente).where(
+        RispostaIdempotente.chiave == chiave,
+        RispostaIdempotente.creata_il >= adesso_utc() - IDEMPOTENZA_TTL
+    ))
+    if salvata is None:
+        return None
+
+    if salvata.operazione != operazione or salvata.impronta != impronta:
+        raise HTTPException(422, "Idempotency-Key già usata per una richiesta diversa")
+
+    return JSONResponse(
+        content=json.loads(salvata.corpo),
+        status_code=salvata.status_code,
+        headers={"Idempotency-Replayed": "true"}
+    )
+
+
+def esegui_idempotente(
+    db: Session,
+    chiave: Optional[str],
+    operazione: str,
+    impronta: str,
+    esegui: Callable[[], Any]
+) -> Tuple[Any, bool]:
+    """
+    Esegue un'operazione di scrittura una sola volta per chiave e ne fa il commit
+
+    'esegui' effettua le scritture senza commit e restituisce il corpo della
+    risposta; la risposta è salvata nella stessa transazione. Se l'operazione
+    fallisce perché un tentativo precedente con la stessa chiave è stato
+    completato nel frattempo, viene restituita la risposta di quel tentativo.
+
+    Args:
+        db: Sessione database
+        chiave: Valore dell'header Idempotency-Key (None se assente)
+        operazione: Metodo e percorso della richiesta
+        impronta: Impronta del corpo della richiesta
+        esegui: Funzione senza argomenti che esegue l'operazione
+
+    Returns:
+        Tupla (risposta, ripetuta): ripetuta è True se la risposta è quella salvata
+    """
+    if chiave is None:
+        risposta = esegui()
+        db.commit()
+        return risposta, False
+
+    salvata = risposta_salvata(db, chiave, operazione, impronta)
+    if salvata is not None:
+        return salvata, True
+
+    try:
+        risposta = esegui()
+        # Una chiave scaduta ancora presente viene sostituita
+        db.execute(delete(RispostaIdempotente).where(RispostaIdempotente.chiave == chiave))
+        db.add(RispostaIdempotente(
+            chiave=chiave,
+            operazione=operazione,
+            impronta=impronta,
+            status_code=200,
+            corpo=json.dumps(jsonable_encoder(risposta)),
+            creata_il=adesso_utc()
+        ))
+        db.commit()
+        return risposta, False
+    except (HTTPException, IntegrityError):
+        db.rollback()
+        salvata = risposta_salvata(db, chiave, operazione, impronta)
+        if salvata is not None:
+            return salvata, True
+        raise
+
+
+def pulisci_risposte_scadute(db: Session) -> int:
+    """
+    Elimina le risposte salvate oltre la scadenza
+
+    Args:
+        db: Sessione database
+
+    Returns:
+        Numero di risposte eliminate
+    """
+    risultato = db.execute(delete(RispostaIdempotente).where(
+        RispostaIdempotente.creata_il < adesso_utc() - IDEMPOTENZA_TTL
+    ))
+    db.commit()
+    return risultato.rowcount
+
+
+async def pulizia_periodica(sessione_factory, intervallo: float = INTERVALLO_PULIZIA):
+    """
+    Elimina le risposte scadute all'avvio e poi a intervalli regolari
+
+    Un errore (ad esempio database bloccato o non raggiungibile) è registrato
+    nel log e la pulizia riprova all'intervallo successivo.
+    """
+    while True:
+        db = sessione_factory()
+        try:
+            await run_in_threadpool(pulisci_risposte_scadute, db)
+        except Exception:
+            logger.exception("Pulizia delle risposte idempotenti scadute non riuscita")
+        finally:
+            db.close()
+        await asyncio.sleep(intervallo)
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal, init_database
+
+    init_database()
+    session = SessionLocal()
+    try:
+        eliminate = pulisci_risposte_scadute(session)
+        print(f"✅ Eliminate {eliminate} risposte idempotenti scadute")
+    finally:
+        session.close()
@@ -0,0 +1,275 @@
+"""
+Indice in memoria della disponibilità delle camere
+
+Per ogni camera mantiene la lista ordinata per check-in delle prenotazioni
+attive (confermate o con check-in effettuato). Le verifiche di sovrapposizione
+diventano una ricerca binaria senza accessi al database.
+
+L'indice è opzionale: si abilita con la variabile d'ambiente
+INDICE_DISPONIBILITA=1, viene caricato all'avvio dell'API e aggiornato dagli
+endpoint che scrivono prenotazioni.
+
+Più worker o processi (CLI, seed, altre istanze) scrivono senza aggiornare
+l'indice di questo processo: l'indice ricorda la versione dei dati da cui è
+stato caricato, e prima di ogni verifica (allinea) la confronta con quella
+letta dalla sessione della richiesta, ricaricandosi se il database è più
+avanti. Le scritture locali fanno avanzare la versione dell'indice solo se
+il loro commit è il successivo (come la cache, vedi backend/cache.py), e
+ogni altro commit fa ricaricare l'indice alla verifica seguente; con
+scritture frequenti da altri processi l'indice si ricarica spesso e conviene
+lasciarlo disattivato.
+
+Verifica di coerenza con la tabella prenotazioni (API in esecuzione):
+    python -m backend.indice_disponibilita [--ripara]
+"""
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from backend.database import SessionLocal, versione_sessione
+from backend.models import Prenotazione, STATI_ATTIVI
+
+INDICE_DISPONIBILITA = os.getenv("INDICE_DISPONIBILITA", "0").lower() in ("1", "true", "si")
+
+# (data_check_in, data_check_out, prenotazione_id)
+Intervallo = Tuple[date, date, int]
+
+
+class IndiceDisponibilita:
+    """Intervalli semiaperti [check-in, check-out) delle prenotazioni attive, per camera"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._intervalli: Dict[int, List[Intervallo]] = {}
+        self._camera_di: Dict[int, int] = {}
+        # Istanza e versione dei dati riflesse dall'indice
+        self.versione: Optional[Tuple[str, int]] = None
+        self.attivo = False
+
+    def carica(self, db: Session):
+        """
+        Ricostruisce l'indice dalla tabella prenotazioni e lo attiva
+
+        Args:
+            db: Sessione database
+        """
+        # Letta prima delle prenotazioni: i dati non sono più vecchi della versione
+        versione = versione_sessione(db)
+        righe = db.execute(
+            select(
+                Prenotazione.id,
+                Prenotazione.camera_id,
+                Prenotazione.data_check_in,
+                Prenotazione.data_check_out
+            ).where(Prenotazione.stato.in_(STATI_ATTIVI))
+        ).all()
+
+        intervalli: Dict[int, List[Intervallo]] = {}
+        camera_di: Dict[int, int] = {}
+        for prenotazione_id, camera_id, check_in, check_out in righe:
+            intervalli.setdefault(camera_id, []).append((check_in, check_out, prenotazione_id))
+            camera_di[prenotazione_id] = camera_id
+        for lista in intervalli.values():
+            lista.sort()
+
+        with self._lock:
+            self._intervalli = intervalli
+            self._camera_di = camera_di
+            self.versione = versione
+            self.attivo = True
+
+    def allinea(self, db: Session):
+        """
+        Ricarica l'indice se il database ha una versione dei dati più recente
+
+        Da chiamare prima di disponibile: copre le scritture di altri worker
+        e processi. Una sessione su una replica più indietro non ricarica.
+
+        Args:
+            db: Sessione database della richiesta
+        """
+        istanza, versione = versione_sessione(db)
+        with self._lock:
+            attuale = self.versione
+        if attuale is None or attuale[0] != istanza or attuale[1] < versione:
+            self.carica(db)
+
+    def registra_commit(self, db: Optional[Session]):
+        """
+        Fa avanzare la versione dell'indice al commit appena fatto con la sessione
+
+        Solo se è il commit successivo alla versione dell'indice e le sue
+        scritture sono già applicate (o non cambiano le prenotazioni attive);
+        altrimenti la prossima allinea ricarica l'indice.
+
+        Args:
+            db: Sessione che ha fatto il commit (None: nessun effetto)
+        """
+        versione = db.info.get(_VERSIONE_COMMIT) if db is not None else None
+        with self._lock:
+            if versione is not None and self.versione is not None and self.versione[1] == versione - 1:
+                self.versione = (self.versione[0], versione)
+
+    def rimuovi(self, prenotazione_id: int, db: Optional[Session] = None):
+        """
+        Rimuove una prenotazione dall'indice, se presente
+
+        Args:
+            prenotazione_id: ID della prenotazione
+            db: Sessione che ha fatto il commit della scrittura (opzionale)
+        """
+        with self._lock:
+            self.registra_commit(db)
+            camera_id = self._camera_di.pop(prenotazione_id, None)
+            if camera_id is None:
+                return
+            lista = self._intervalli[camera_id]
+            for posizione, intervallo in enumerate(lista):
+                if intervallo[2] == prenotazione_id:
+                    del lista[posizione]
+                    break
+
+    def aggiorna(self, prenotazione: Prenotazione):
+        """
+        Allinea l'indice allo stato corrente di una prenotazione
+
+        Da chiamare dopo il commit di ogni scrittura: la prenotazione viene
+        rimossa e reinserita solo se è ancora attiva.
+
+        Args:
+            prenotazione: Prenotazione appena salvata
+        """
+        if not self.attivo:
+            return
+        with self._lock:
+            self.rimuovi(prenotazione.id, object_session(prenotazione))
+            if prenotazione.stato in STATI_ATTIVI:
+                insort(
+                    self._intervalli.setdefault(prenotazione.camera_id, []),
+                    (prenotazione.data_check_in, prenotazione.data_check_out, prenotazione.id)
+                )
+                self._camera_di[prenotazione.id] = prenotazione.camera_id
+
+    def disponibile(
+        self,
+        camera_id: int,
+        data_check_in: date,
+        data_check_out: date,
+        escludi_prenotazione_id: Optional[int] = None
+    ) -> bool:
+        """
+        Verifica la disponibilità di una camera con una ricerca binaria
+
+        Le prenotazioni attive di una camera non si sovrappongono, quindi sono
+        ordinate anche per check-out: basta risalire dalla prima prenotazione
+        che inizia dopo il check-out richiesto finché i soggiorni terminano
+        dopo il check-in richiesto.
+
+        Args:
+            camera_id: ID della camera da verificare
+            data_check_in: Data di check-in desiderata
+            data_check_out: Data di check-out desiderata
+            escludi_prenotazione_id: ID prenotazione da escludere (per modifiche)
+
+        Returns:
+            True se disponibile, False altrimenti
+        """
+        with self._lock:
+            lista = self._intervalli.get(camera_id, [])
+            posizione = bisect_left(lista, (data_check_out,))
+            while posizione > 0:
+                posizione -= 1
+                check_in, check_out, prenotazione_id = lista[posizione]
+                if check_out <= data_check_in:
+                    return True
+                if prenotazione_id != escludi_prenotazione_id:
+                    return False
+            return True
+
+    def verifica(self, db: Session) -> Dict[str, List[Dict]]:
+        """
+        Confronta l'indice con la tabella prenotazioni
+
+        Args:
+            db: Sessione database
+
+        Returns:
+            Dizionario con le prenotazioni 'mancanti' (attive nel database ma
+            non nell'indice) e 'superflue' (nell'indice ma non attive nel
+            database, o con date diverse)
+        """
+        righe = db.execute(
+            select(
+                Prenotazione.id,
+                Prenotazione.camera_id,
+                Prenotazione.data_check_in,
+                Prenotazione.data_check_out
+            ).where(Prenotazione.stato.in_(STATI_ATTIVI))
+        ).all()
+        nel_database = {tuple(riga) for riga in righe}
+
+        with self._lock:
+            nell_indice = {
+                (prenotazione_id, camera_id, check_in, check_out)
+                for camera_id, lista in self._intervalli.items()
+                for check_in, check_out, prenotazione_id in lista
+            }
+
+        def _descrivi(voci):
+            return [
+                {
+                    "prenotazione_id": prenotazione_id,
+                    "camera_id": camera_id,
+                    "data_check_in": str(check_in),
+                    "data_check_out": str(check_out)
+                }
+                for prenotazione_id, camera_id, check_in, check_out in sorted(voci)
+            ]
+
+        return {
+            "mancanti": _descrivi(nel_database - nell_indice),
+            "superflue": _descrivi(nell_indice - nel_database)
+        }
+
+
+indice = IndiceDisponibilita()
+
+# Chiave di Session.info con la versione dell'ultimo commit della sessione
+_VERSIONE_COMMIT = "versione_indice"
+
+
+@event.listens_for(SessionLocal, "after_commit", insert=True)
+def _versione_commit(session):
+    # Prima del listener di database.py, che consuma la nuova versione dei dati
+    session.info[_VERSIONE_COMMIT] = session.info.get("versione_dati")
+
+
+if __name__ == "__main__":
+    import sys
+    import requests
+    from frontend.config import API_URL
+
+    ripara = "--ripara" in sys.argv
+    risposta = requests.get(
+        f"{API_URL}/admin/indice-disponibilita/verifica",
+        params={"ripara": ripara}
+    )
+    risposta.raise_for_status()
+    esito = risposta.json()
+
+    if not esito["attivo"]:
+        print("⚠️  Indice di disponibilità non attivo (INDICE_DISPONIBILITA=0)")
+        sys.exit(0)
+
+    for voce in esito["mancanti"]:
+        print(f"❌ Mancante nell'indice: {voce}")
+    for voce in esito["superflue"]:
+        print(f"❌ Superflua nell'indice: {voce}")
+
+    if esito["mancanti"] or esito["superflue"]:
+        print("🔄 Indice ricaricato dal database" if esito["riparato"] else "⚠️  Indice non coerente")
+        sys.exit(0 if esito["riparato"] else 1)
+    print("✅ Indice coerente con la tabella prenotazioni")
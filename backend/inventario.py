@@ -0,0 +1,186 @@
+"""
+Inventario notti delle camere (tabella camera_notte)
+
+Ogni prenotazione attiva occupa una riga per notte di soggiorno. Il vincolo
+di unicità su (camera_id, notte) impedisce il doppio booking direttamente nel
+database, anche con richieste concorrenti.
+
+Ricostruzione dell'inventario dalla tabella prenotazioni:
+    python -m backend.inventario
+"""
+from datetime import date, timedelta
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.orm import Session
+from backend.models import CameraNotte, Prenotazione, STATI_ATTIVI
+
+
+def notti_soggiorno(data_check_in: date, data_check_out: date) -> List[date]:
+    """
+    Elenca le notti di un soggiorno [check-in, check-out)
+
+    Args:
+        data_check_in: Data di check-in
+        data_check_out: Data di check-out
+
+    Returns:
+        Lista delle date delle notti
+    """
+    return [
+        data_check_in + timedelta(days=giorno)
+        for giorno in range((data_check_out - data_check_in).days)
+    ]
+
+
+def occupa_notti(db: Session, *prenotazioni: Prenotazione):
+    """
+    Inserisce le notti di una o più prenotazioni con un solo INSERT
+
+    Le prenotazioni devono avere già un ID (flush eseguito). Se una notte è
+    già occupata il database solleva IntegrityError.
+
+    Args:
+        db: Sessione database
+        prenotazioni: Prenotazioni confermate
+    """
+    db.execute(insert(CameraNotte), [
+        {
+            "camera_id": prenotazione.camera_id,
+            "notte": notte,
+            "prenotazione_id": prenotazione.id
+        }
+        for prenotazione in prenotazioni
+        for notte in notti_soggiorno(prenotazione.data_check_in, prenotazione.data_check_out)
+    ])
+
+
+def libera_notti(db: Session, *prenotazione_ids: int, dal: Optional[date] = None):
+    """
+    Rimuove con un solo DELETE le notti occupate da una o più prenotazioni
+
+    Args:
+        db: Sessione database
+        prenotazione_ids: ID delle prenotazioni
+        dal: Se indicato, libera solo le notti da questa data in poi
+    """
+    query = delete(CameraNotte).where(CameraNotte.prenotazione_id.in_(prenotazione_ids))
+    if dal is not None:
+        query = query.where(CameraNotte.notte >= dal)
+    db.execute(query)
+
+
+def notti_libere(
+    db: Session,
+    camera_id: int,
+    data_check_in: date,
+    data_check_out: date,
+    escludi_prenotazione_id: Optional[int] = None
+) -> bool:
+    """
+    Verifica che nessuna notte del soggiorno sia occupata
+
+    Ricerca sulla chiave (camera_id, notte): un accesso all'indice per camera.
+
+    Args:
+        db: Sessione database
+        camera_id: ID della camera
+        data_check_in: Data di check-in desiderata
+        data_check_out: Data di check-out desiderata
+        escludi_prenotazione_id: ID prenotazione da escludere (per modifiche)
+
+    Returns:
+        True se tutte le notti sono libere
+    """
+    occupata = exists().where(
+        CameraNotte.camera_id == camera_id,
+        CameraNotte.notte >= data_check_in,
+        CameraNotte.notte < data_check_out
+    )
+    if escludi_prenotazione_id:
+        occupata = occupata.where(CameraNotte.prenotazione_id != escludi_prenotazione_id)
+    return not db.scalar(select(occupata))
+
+
+def notti_occupate(db: Session, camera_ids: List[int], da: date, a: date) -> Set[Tuple[int, date]]:
+    """
+    Notti occupate di più camere nel periodo [da, a) con una sola query
+
+    Args:
+        db: Sessione database
+        camera_ids: ID delle camere
+        da: Prima notte del periodo
+        a: Giorno finale escluso
+
+    Returns:
+        Insieme di coppie (camera_id, notte) occupate
+    """
+    return set(db.execute(
+        select(CameraNotte.camera_id, CameraNotte.notte).where(
+            CameraNotte.camera_id.in_(camera_ids),
+            CameraNotte.notte >= da,
+            CameraNotte.notte < a
+        )
+    ).tuples())
+
+
+def ricostruisci_inventario(db: Session) -> List[int]:
+    """
+    Ricostruisce la tabella camera_notte dalle prenotazioni attive
+
+    Le prenotazioni sono elaborate in ordine di ID: se una notte è già stata
+    assegnata a una prenotazione precedente, la notte in conflitto non viene
+    inserita e la prenotazione è segnalata. Non esegue il commit.
+
+    Args:
+        db: Sessione database
+
+    Returns:
+        ID delle prenotazioni con notti in conflitto
+    """
+    righe = db.execute(
+        select(
+            Prenotazione.id,
+            Prenotazione.camera_id,
+            Prenotazione.data_check_in,
+            Prenotazione.data_check_out
+        ).where(Prenotazione.stato.in_(STATI_ATTIVI)).order_by(Prenotazione.id)
+    ).all()
+
+    occupate = set()
+    notti = []
+    conflitti = []
+    for prenotazione_id, camera_id, check_in, check_out in righe:
+        for notte in notti_soggiorno(check_in, check_out):
+            if (camera_id, notte) in occupate:
+                if not conflitti or conflitti[-1] != prenotazione_id:
+                    conflitti.append(prenotazione_id)
+                continue
+            occupate.add((camera_id, notte))
+            notti.append({"camera_id": camera_id, "notte": notte, "prenotazione_id": prenotazione_id})
+
+    db.execute(delete(CameraNotte))
+    if notti:
+        db.execute(insert(CameraNotte), notti)
+    return conflitti
+
+
+def inventario_da_inizializzare(db: Session) -> bool:
+    """True se camera_notte è vuota ma esistono prenotazioni attive"""
+    if db.scalar(select(exists().select_from(CameraNotte))):
+        return False
+    return bool(db.scalar(select(exists().where(Prenotazione.stato.in_(STATI_ATTIVI)))))
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal, init_database
+
+    init_database()
+    session = SessionLocal()
+    try:
+        conflitti = ricostruisci_inventario(session)
+        session.commit()
+        for prenotazione_id in conflitti:
+            print(f"⚠️  Prenotazione {prenotazione_id}: notti già occupate da un'altra prenotazione")
+        print("✅ Inventario camera_notte ricostruito")
+    finally:
+        session.close()
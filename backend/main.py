@@ -1,20 +1,108 @@
 # main.py - API REST con FastAPI
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+import asyncio
+from anyio import to_thread
+from fastapi import APIRouter, Cookie, FastAPI, HTTPException, Depends, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from datetime import date, datetime
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from models import (
-    Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione,
-    get_db, init_db
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, BeforeValidator, Field
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Annotated, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.orm import Session, joinedload
+from backend.database import (
+    DATABASE_ASYNC,
+    THREADPOOL_THREAD,
+    SessionLocal,
+    async_engine,
+    get_db,
+    init_database,
+    esegui_con_ritentativi
+)
+from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione
+from backend.utils import (
+    calcola_prezzo_totale,
+    verifica_disponibilita_camera,
+    cerca_camere_libere,
+    blocca_camere,
+    upsert_ospiti,
+    query_stato_occupazione,
+    codifica_cursore,
+    decodifica_cursore
+)
+from backend.indice_disponibilita import INDICE_DISPONIBILITA, indice
+from backend.inventario import occupa_notti, libera_notti, notti_occupate, notti_soggiorno
+from backend.idempotenza import esegui_idempotente, impronta_richiesta, pulizia_periodica
+from backend.statistiche import statistiche_dashboard, statistiche_dashboard_async
+from backend.etag import etag_dati, etag_dati_async
+from backend.repliche import (
+    COOKIE_SCRITTURA,
+    get_async_db_lettura,
+    get_db_lettura,
+    replica_lettura,
+    replica_locale,
+    repliche,
+    segna_scritture,
+    sincronizzazione_periodica
+)
+from backend.export import righe_csv, righe_ndjson, byte_colonnari
+from backend.report import GRANULARITA, serie_giornaliere, kpi_periodo
+from backend.statistiche_giornaliere import ricostruisci_statistiche
+from backend.cache import (
+    cache,
+    chiave_cache,
+    leggi_o_calcola,
+    leggi_o_calcola_async,
+    GRUPPO_CAMERE,
+    GRUPPO_DISPONIBILITA
+)
+from backend.ricerca_ospiti import (
+    cerca_ospiti,
+    query_ricerca_ospiti,
+    query_riepilogo_soggiorni,
+    riepilogo_da_righe,
+    riepilogo_soggiorni
+)
+from backend.disponibilita import (
+    matrice_occupazione,
+    codifica_bitmap,
+    codifica_segmenti,
+    finestre_libere
 )
 
 # Inizializza il database
-init_db()
+init_database()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Carica l'indice di disponibilità, avvia la pulizia delle chiavi di idempotenza e la replica locale"""
+    # Thread per endpoint e dependency sincroni: il pool dell'engine è dimensionato su questo numero
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_THREAD
+    if INDICE_DISPONIBILITA:
+        db = SessionLocal()
+        try:
+            indice.carica(db)
+        finally:
+            db.close()
+    
+    pulizia = asyncio.create_task(pulizia_periodica(SessionLocal))
+    sincronizzazione = asyncio.create_task(sincronizzazione_periodica()) if replica_locale else None
+    yield
+    pulizia.cancel()
+    if sincronizzazione is not None:
+        sincronizzazione.cancel()
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in repliche:
+        if replica.motore_async is not None:
+            await replica.motore_async.dispose()
 
-app = FastAPI(title="Sistema Gestione Hotel", version="1.0.0")
+
+app = FastAPI(title="Sistema Gestione Hotel", version="1.0.0", lifespan=lifespan)
 
 # Configurazione CORS per permettere richieste da Streamlit
 app.add_middleware(
@@ -23,13 +111,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cursore-Successivo", "ETag"],
 )
 
+# Read-your-writes con le repliche in lettura: cookie sulle risposte con scritture
+app.middleware("http")(segna_scritture)
+
+# Header con il cursore della pagina successiva degli elenchi paginati
+HEADER_CURSORE = "X-Cursore-Successivo"
+
+# Relazioni caricate insieme alla prenotazione con un JOIN, senza query per riga
+CARICA_RELAZIONI = (joinedload(Prenotazione.camera), joinedload(Prenotazione.ospite))
+
+# Gli enum del modello sono serializzati con il loro valore testuale
+ValoreEnum = Annotated[str, BeforeValidator(lambda v: v.value if isinstance(v, Enum) else v)]
+
 # Schemi Pydantic per validazione input/output
 class CameraResponse(BaseModel):
     id: int
     numero: str
-    tipo: str
+    tipo: ValoreEnum
     piano: int
     prezzo_per_notte: float
     servizi_inclusi: str
@@ -57,6 +158,15 @@ class OspiteResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class UltimoSoggiornoResponse(BaseModel):
+    camera_id: int
+    data_check_in: date
+    data_check_out: date
+
+class OspiteRicercaResponse(OspiteResponse):
+    numero_prenotazioni: int = 0
+    ultimo_soggiorno: Optional[UltimoSoggiornoResponse] = None
+
 class PrenotazioneCreate(BaseModel):
     camera_id: int
     ospite: OspiteCreate
@@ -77,7 +187,7 @@ class PrenotazioneResponse(BaseModel):
     data_check_out: date
     numero_ospiti: int
     prezzo_totale: float
-    stato: str
+    stato: ValoreEnum
     camera: CameraResponse
     ospite: OspiteResponse
     
@@ -89,64 +199,198 @@ class RicercaCamereRequest(BaseModel):
     data_check_out: date
     tipo: Optional[str] = None
 
-# Funzioni di utilità
-def calcola_prezzo_totale(prezzo_per_notte: float, data_check_in: date, data_check_out: date) -> float:
-    """Calcola il prezzo totale in base ai giorni di permanenza"""
-    giorni = (data_check_out - data_check_in).days
-    return prezzo_per_notte * giorni
-
-def verifica_disponibilita_camera(
-    db: Session, 
-    camera_id: int, 
-    data_check_in: date, 
-    data_check_out: date,
-    escludi_prenotazione_id: Optional[int] = None
-) -> bool:
-    """Verifica se una camera è disponibile per il periodo richiesto"""
-    query = db.query(Prenotazione).filter(
-        Prenotazione.camera_id == camera_id,
-        Prenotazione.stato.in_([
-            StatoPrenotazione.CONFERMATA,
-            StatoPrenotazione.CHECK_IN_EFFETTUATO
-        ]),
-        or_(
-            and_(
-                Prenotazione.data_check_in <= data_check_in,
-                Prenotazione.data_check_out > data_check_in
-            ),
-            and_(
-                Prenotazione.data_check_in < data_check_out,
-                Prenotazione.data_check_out >= data_check_out
-            ),
-            and_(
-                Prenotazione.data_check_in >= data_check_in,
-                Prenotazione.data_check_out <= data_check_out
-            )
+class OperazioneMultiplaRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
+
+class RicercaFlessibileRequest(BaseModel):
+    data_inizio: date
+    data_fine: date
+    notti: int = Field(..., ge=1, le=30)
+    tipo: Optional[str] = None
+    limite: int = Field(20, ge=1, le=200)
+
+class SoggiornoDisponibileResponse(BaseModel):
+    camera: CameraResponse
+    data_check_in: date
+    data_check_out: date
+    prezzo_totale: float
+
+# Query e conversioni delle letture, comuni agli endpoint sincroni e a quelli async
+def _query_camere(limite: Optional[int], cursore: Optional[str]):
+    """Query delle camere per ID dopo il cursore, con una camera oltre il limite"""
+    query = select(Camera).order_by(Camera.id)
+    if limite is not None:
+        query = query.limit(limite + 1)
+    if cursore:
+        try:
+            (ultimo_id,) = decodifica_cursore(cursore, 1)
+        except ValueError as errore:
+            raise HTTPException(400, str(errore))
+        if not isinstance(ultimo_id, int) or isinstance(ultimo_id, bool):
+            raise HTTPException(400, f"Cursore non valido: {cursore}")
+        query = query.where(Camera.id > ultimo_id)
+    return query
+
+def _pagina_camere(camere: List[Camera], limite: Optional[int]):
+    """Pagina di camere serializzate e cursore della pagina successiva (None se è l'ultima)"""
+    successivo = None
+    if limite is not None and len(camere) > limite:
+        camere = camere[:limite]
+        successivo = codifica_cursore(camere[-1].id)
+    return [CameraResponse.model_validate(c).model_dump() for c in camere], successivo
+
+def _ospiti_trovati(ospiti: List[Ospite], soggiorni: dict) -> List[OspiteRicercaResponse]:
+    """Ospiti trovati con il riepilogo dei loro soggiorni"""
+    return [
+        OspiteRicercaResponse(
+            **OspiteResponse.model_validate(ospite).model_dump(),
+            **soggiorni.get(ospite.id, {})
         )
-    )
+        for ospite in ospiti
+    ]
+
+def _query_prenotazioni(
+    stato: Optional[str],
+    camera_id: Optional[int],
+    ospite_id: Optional[int],
+    cognome: Optional[str],
+    check_in_da: Optional[date],
+    check_in_a: Optional[date],
+    check_out_da: Optional[date],
+    check_out_a: Optional[date],
+    limite: int,
+    cursore: Optional[str]
+):
+    """Query delle prenotazioni filtrate dopo il cursore, con una prenotazione oltre il limite"""
+    query = select(Prenotazione).options(*CARICA_RELAZIONI)
     
-    if escludi_prenotazione_id:
-        query = query.filter(Prenotazione.id != escludi_prenotazione_id)
+    if stato:
+        try:
+            query = query.where(Prenotazione.stato == StatoPrenotazione(stato))
+        except ValueError:
+            raise HTTPException(400, f"Stato prenotazione non valido: {stato}")
+    if camera_id is not None:
+        query = query.where(Prenotazione.camera_id == camera_id)
+    if ospite_id is not None:
+        query = query.where(Prenotazione.ospite_id == ospite_id)
+    if cognome:
+        query = query.where(Prenotazione.ospite.has(Ospite.cognome.ilike(f"{cognome}%")))
+    if check_in_da:
+        query = query.where(Prenotazione.data_check_in >= check_in_da)
+    if check_in_a:
+        query = query.where(Prenotazione.data_check_in <= check_in_a)
+    if check_out_da:
+        query = query.where(Prenotazione.data_check_out >= check_out_da)
+    if check_out_a:
+        query = query.where(Prenotazione.data_check_out <= check_out_a)
     
-    return query.count() == 0
+    if cursore:
+        try:
+            ultima_data, ultimo_id = decodifica_cursore(cursore, 2)
+            ultima_data = date.fromisoformat(ultima_data)
+            if not isinstance(ultimo_id, int) or isinstance(ultimo_id, bool):
+                raise TypeError(ultimo_id)
+        except (ValueError, TypeError):
+            raise HTTPException(400, f"Cursore non valido: {cursore}")
+        query = query.where(
+            tuple_(Prenotazione.data_check_in, Prenotazione.id) > (ultima_data, ultimo_id)
+        )
+    
+    return query.order_by(Prenotazione.data_check_in, Prenotazione.id).limit(limite + 1)
+
+def _pagina_prenotazioni(response: Response, prenotazioni: List[Prenotazione], limite: int):
+    """Pagina di prenotazioni serializzate; il cursore della successiva va nell'header"""
+    if len(prenotazioni) > limite:
+        prenotazioni = prenotazioni[:limite]
+        ultima = prenotazioni[-1]
+        response.headers[HEADER_CURSORE] = codifica_cursore(ultima.data_check_in, ultima.id)
+    return [PrenotazioneResponse.model_validate(p) for p in prenotazioni]
+
+def _query_prenotazione(prenotazione_id: int):
+    """Query di una prenotazione con camera e ospite"""
+    return select(Prenotazione).options(*CARICA_RELAZIONI).where(Prenotazione.id == prenotazione_id)
+
+def _query_arrivi_oggi():
+    """Query delle prenotazioni confermate con check-in oggi"""
+    return select(Prenotazione).options(*CARICA_RELAZIONI).where(
+        Prenotazione.data_check_in == date.today(),
+        Prenotazione.stato == StatoPrenotazione.CONFERMATA
+    )
+
+def _query_partenze_oggi():
+    """Query delle prenotazioni in corso con check-out oggi"""
+    return select(Prenotazione).options(*CARICA_RELAZIONI).where(
+        Prenotazione.data_check_out == date.today(),
+        Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO
+    )
+
+def _query_occupazione(piano: Optional[int], tipo: Optional[str]):
+    """Query dello stato di occupazione di oggi, con il tipo di camera validato"""
+    tipo_enum = None
+    if tipo:
+        try:
+            tipo_enum = TipoCamera(tipo)
+        except ValueError:
+            raise HTTPException(400, f"Tipo camera non valido: {tipo}")
+    return query_stato_occupazione(date.today(), piano, tipo_enum)
+
+def _stato_camere(righe) -> List[dict]:
+    """Stato di occupazione delle camere dalle righe di query_stato_occupazione"""
+    return [
+        {
+            "camera": {
+                "id": camera_id,
+                "numero": numero,
+                "tipo": tipo_camera.value,
+                "piano": piano_camera,
+                "prezzo_per_notte": prezzo_per_notte,
+                "servizi_inclusi": servizi_inclusi
+            },
+            "occupata": check_out is not None,
+            "ospite": f"{nome} {cognome}" if check_out is not None else None,
+            "check_out_previsto": str(check_out) if check_out is not None else None
+        }
+        for camera_id, numero, tipo_camera, piano_camera, prezzo_per_notte, servizi_inclusi,
+            nome, cognome, check_out in righe
+    ]
 
 # Endpoint API
 @app.get("/")
 def root():
     return {"messaggio": "API Sistema Gestione Hotel", "versione": "1.0.0"}
 
-@app.get("/camere", response_model=List[CameraResponse])
-def ottieni_camere(db: Session = Depends(get_db)):
-    """Ottiene l'elenco di tutte le camere"""
-    camere = db.query(Camera).all()
-    return [CameraResponse(
-        id=c.id,
-        numero=c.numero,
-        tipo=c.tipo.value,
-        piano=c.piano,
-        prezzo_per_notte=c.prezzo_per_notte,
-        servizi_inclusi=c.servizi_inclusi
-    ) for c in camere]
+@app.get("/camere", response_model=List[CameraResponse], dependencies=[Depends(etag_dati)])
+def ottieni_camere(
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=500),
+    cursore: Optional[str] = None,
+    db: Session = Depends(get_db_lettura)
+):
+    """
+    Ottiene l'elenco delle camere ordinate per ID
+    
+    Senza 'limite' né 'cursore' restituisce tutte le camere. Con uno dei due
+    restituisce una pagina (default 100 camere): se ci sono altre camere,
+    l'header X-Cursore-Successivo contiene il cursore da passare come
+    'cursore' per la pagina successiva.
+    """
+    if limite is None and cursore:
+        limite = 100
+    query = _query_camere(limite, cursore)
+    
+    def _pagina():
+        return _pagina_camere(db.scalars(query).all(), limite)
+    
+    camere, successivo = leggi_o_calcola(
+        chiave_cache("camere", limite=limite, cursore=cursore),
+        _pagina,
+        GRUPPO_CAMERE,
+        db
+    )
+    if successivo:
+        response.headers[HEADER_CURSORE] = successivo
+    
+    return camere
 
 @app.post("/camere/disponibili", response_model=List[CameraResponse])
 def cerca_camere_disponibili(
@@ -160,43 +404,99 @@ def cerca_camere_disponibili(
     if ricerca.data_check_in < date.today():
         raise HTTPException(400, "La data di check-in non può essere nel passato")
     
-    # Query per tutte le camere del tipo richiesto (se specificato)
-    query = db.query(Camera)
+    tipo_enum = None
     if ricerca.tipo:
         try:
             tipo_enum = TipoCamera(ricerca.tipo)
-            query = query.filter(Camera.tipo == tipo_enum)
         except ValueError:
             raise HTTPException(400, f"Tipo camera non valido: {ricerca.tipo}")
     
-    camere = query.all()
+    # Ricerche uguali sono servite dalla cache finché una scrittura non tocca le stesse date
+    return leggi_o_calcola(
+        chiave_cache(
+            "camere/disponibili",
+            data_check_in=ricerca.data_check_in,
+            data_check_out=ricerca.data_check_out,
+            tipo=tipo_enum
+        ),
+        lambda: [
+            CameraResponse.model_validate(camera).model_dump()
+            for camera in cerca_camere_libere(db, ricerca.data_check_in, ricerca.data_check_out, tipo_enum)
+        ],
+        GRUPPO_DISPONIBILITA,
+        db,
+        (ricerca.data_check_in, ricerca.data_check_out)
+    )
+
+@app.post("/camere/disponibili/flessibile", response_model=List[SoggiornoDisponibileResponse])
+def cerca_soggiorni_flessibili(
+    ricerca: RicercaFlessibileRequest,
+    db: Session = Depends(get_db)
+):
+    """Cerca i soggiorni di N notti liberi in un intervallo di date, dal più economico"""
+    data_inizio = max(ricerca.data_inizio, date.today())
     
-    # Filtra le camere disponibili
-    camere_disponibili = []
-    for camera in camere:
-        if verifica_disponibilita_camera(
-            db, 
-            camera.id, 
-            ricerca.data_check_in, 
-            ricerca.data_check_out
-        ):
-            camere_disponibili.append(CameraResponse(
-                id=camera.id,
-                numero=camera.numero,
-                tipo=camera.tipo.value,
-                piano=camera.piano,
-                prezzo_per_notte=camera.prezzo_per_notte,
-                servizi_inclusi=camera.servizi_inclusi
-            ))
+    if data_inizio >= ricerca.data_fine:
+        raise HTTPException(400, "La data finale deve essere successiva alla data iniziale")
+    
+    if (ricerca.data_fine - data_inizio).days > 366:
+        raise HTTPException(400, "L'intervallo di ricerca massimo è di 366 giorni")
+    
+    tipo_enum = None
+    if ricerca.tipo:
+        try:
+            tipo_enum = TipoCamera(ricerca.tipo)
+        except ValueError:
+            raise HTTPException(400, f"Tipo camera non valido: {ricerca.tipo}")
+    
+    finestre = finestre_libere(
+        db,
+        data_inizio,
+        ricerca.data_fine,
+        ricerca.notti,
+        tipo_enum,
+        ricerca.limite
+    )
+    
+    camere = {
+        c.id: c for c in db.query(Camera).filter(
+            Camera.id.in_({camera_id for camera_id, _, _ in finestre})
+        )
+    }
+    
+    return [SoggiornoDisponibileResponse(
+        camera=CameraResponse.model_validate(camere[camera_id]),
+        data_check_in=check_in,
+        data_check_out=check_in + timedelta(days=ricerca.notti),
+        prezzo_totale=prezzo_totale
+    ) for camera_id, check_in, prezzo_totale in finestre]
+
+@app.get("/ospiti/search", response_model=List[OspiteRicercaResponse])
+def ricerca_ospiti(
+    q: str = Query(..., min_length=1, max_length=100),
+    limite: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db_lettura)
+):
+    """
+    Cerca gli ospiti per prefisso di nome, cognome, documento o email
     
-    return camere_disponibili
+    Ogni parola cercata deve essere l'inizio di una parola di uno dei campi.
+    Per ogni ospite sono riportati il numero di prenotazioni e l'ultimo soggiorno.
+    """
+    ospiti = cerca_ospiti(db, q, limite)
+    return _ospiti_trovati(ospiti, riepilogo_soggiorni(db, [o.id for o in ospiti]))
 
 @app.post("/prenotazioni", response_model=PrenotazioneResponse)
 def crea_prenotazione(
     prenotazione: PrenotazioneCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
 ):
-    """Crea una nuova prenotazione verificando la disponibilità"""
+    """
+    Crea una nuova prenotazione verificando la disponibilità
+    
+    Con l'header Idempotency-Key i nuovi tentativi ricevono la risposta del primo.
+    """
     # Validazioni
     if prenotazione.data_check_in >= prenotazione.data_check_out:
         raise HTTPException(400, "La data di check-out deve essere successiva al check-in")
@@ -204,116 +504,299 @@ def crea_prenotazione(
     if prenotazione.data_check_in < date.today():
         raise HTTPException(400, "La data di check-in non può essere nel passato")
     
-    # Verifica esistenza camera
-    camera = db.query(Camera).filter(Camera.id == prenotazione.camera_id).first()
-    if not camera:
-        raise HTTPException(404, "Camera non trovata")
+    def _crea():
+        # Lock di scrittura prima della verifica: verifica e inserimento sono atomici
+        blocca_camere(db, [prenotazione.camera_id])
+        
+        # Verifica esistenza camera
+        camera = db.query(Camera).filter(Camera.id == prenotazione.camera_id).first()
+        if not camera:
+            raise HTTPException(404, "Camera non trovata")
+        
+        # Verifica disponibilità
+        if not verifica_disponibilita_camera(
+            db,
+            prenotazione.camera_id,
+            prenotazione.data_check_in,
+            prenotazione.data_check_out
+        ):
+            raise HTTPException(409, "Camera non disponibile per il periodo richiesto")
+        
+        # Crea o aggiorna l'ospite con una sola istruzione
+        ospite = upsert_ospiti(db, [prenotazione.ospite.model_dump()])[prenotazione.ospite.documento]
+        
+        # Calcola prezzo totale
+        prezzo_totale = calcola_prezzo_totale(
+            camera.prezzo_per_notte,
+            prenotazione.data_check_in,
+            prenotazione.data_check_out
+        )
+        
+        # Crea prenotazione
+        nuova_prenotazione = Prenotazione(
+            camera_id=prenotazione.camera_id,
+            ospite_id=ospite.id,
+            data_check_in=prenotazione.data_check_in,
+            data_check_out=prenotazione.data_check_out,
+            numero_ospiti=prenotazione.numero_ospiti,
+            prezzo_totale=prezzo_totale,
+            stato=StatoPrenotazione.CONFERMATA
+        )
+        
+        db.add(nuova_prenotazione)
+        db.flush()
+        
+        # Occupa le notti: il vincolo unico di camera_notte blocca i doppi booking concorrenti
+        try:
+            occupa_notti(db, nuova_prenotazione)
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(409, "Camera non disponibile per il periodo richiesto")
+        
+        # Risposta costruita prima del commit, quando gli oggetti sono ancora caricati
+        return PrenotazioneResponse.model_validate(nuova_prenotazione)
     
-    # Verifica disponibilità
-    if not verifica_disponibilita_camera(
+    risposta, ripetuta = esegui_con_ritentativi(db, lambda: esegui_idempotente(
         db,
-        prenotazione.camera_id,
-        prenotazione.data_check_in,
-        prenotazione.data_check_out
-    ):
-        raise HTTPException(409, "Camera non disponibile per il periodo richiesto")
-    
-    # Crea o trova ospite
-    ospite_esistente = db.query(Ospite).filter(
-        Ospite.documento == prenotazione.ospite.documento
-    ).first()
-    
-    if ospite_esistente:
-        ospite = ospite_esistente
-    else:
-        ospite = Ospite(**prenotazione.ospite.dict())
-        db.add(ospite)
+        idempotency_key,
+        "POST /prenotazioni",
+        impronta_richiesta(prenotazione),
+        _crea
+    ))
+    if not ripetuta and indice.attivo:
+        indice.aggiorna(db.get(Prenotazione, risposta.id))
+    
+    return risposta
+
+@app.post("/prenotazioni/bulk", response_model=List[PrenotazioneResponse])
+def crea_prenotazioni_multiple(
+    prenotazioni: List[PrenotazioneCreate],
+    db: Session = Depends(get_db)
+):
+    """
+    Crea più prenotazioni in una sola transazione (gruppi e tour operator)
+    
+    Tutto o niente: se anche una sola prenotazione non è valida o la camera non
+    è disponibile non viene creata nessuna prenotazione, e il dettaglio
+    dell'errore elenca l'esito per indice.
+    """
+    if not prenotazioni:
+        raise HTTPException(400, "Nessuna prenotazione da creare")
+    
+    if len(prenotazioni) > 200:
+        raise HTTPException(400, "Massimo 200 prenotazioni per richiesta")
+    
+    errori = []
+    for indice_richiesta, richiesta in enumerate(prenotazioni):
+        if richiesta.data_check_in >= richiesta.data_check_out:
+            errori.append({"indice": indice_richiesta, "errore": "La data di check-out deve essere successiva al check-in"})
+        elif richiesta.data_check_in < date.today():
+            errori.append({"indice": indice_richiesta, "errore": "La data di check-in non può essere nel passato"})
+    if errori:
+        raise HTTPException(400, {"messaggio": "Nessuna prenotazione creata", "errori": errori})
+    
+    camera_ids = sorted({richiesta.camera_id for richiesta in prenotazioni})
+    
+    def _crea_tutte():
+        blocca_camere(db, camera_ids)
+        
+        camere = {c.id: c for c in db.scalars(select(Camera).where(Camera.id.in_(camera_ids)))}
+        
+        # Disponibilità di tutto il gruppo con una sola query sulle notti occupate
+        occupate = notti_occupate(
+            db,
+            camera_ids,
+            min(richiesta.data_check_in for richiesta in prenotazioni),
+            max(richiesta.data_check_out for richiesta in prenotazioni)
+        )
+        errori = []
+        for indice_richiesta, richiesta in enumerate(prenotazioni):
+            if richiesta.camera_id not in camere:
+                errori.append({"indice": indice_richiesta, "errore": "Camera non trovata"})
+                continue
+            notti = {
+                (richiesta.camera_id, notte)
+                for notte in notti_soggiorno(richiesta.data_check_in, richiesta.data_check_out)
+            }
+            if notti & occupate:
+                errori.append({"indice": indice_richiesta, "errore": "Camera non disponibile per il periodo richiesto"})
+                continue
+            # Le notti assegnate nel gruppo non sono disponibili per le richieste successive
+            occupate |= notti
+        if errori:
+            raise HTTPException(409, {"messaggio": "Nessuna prenotazione creata", "errori": errori})
+        
+        ospiti = upsert_ospiti(db, [richiesta.ospite.model_dump() for richiesta in prenotazioni])
+        
+        nuove = [
+            Prenotazione(
+                camera_id=richiesta.camera_id,
+                ospite_id=ospiti[richiesta.ospite.documento].id,
+                data_check_in=richiesta.data_check_in,
+                data_check_out=richiesta.data_check_out,
+                numero_ospiti=richiesta.numero_ospiti,
+                prezzo_totale=calcola_prezzo_totale(
+                    camere[richiesta.camera_id].prezzo_per_notte,
+                    richiesta.data_check_in,
+                    richiesta.data_check_out
+                ),
+                stato=StatoPrenotazione.CONFERMATA
+            )
+            for richiesta in prenotazioni
+        ]
+        db.add_all(nuove)
         db.flush()
+        try:
+            occupa_notti(db, *nuove)
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(409, "Camere non disponibili per il periodo richiesto")
+        
+        # Risposte costruite prima del commit, quando gli oggetti sono ancora caricati
+        risposte = [PrenotazioneResponse.model_validate(p) for p in nuove]
+        
+        db.commit()
+        return nuove, risposte
     
-    # Calcola prezzo totale
-    prezzo_totale = calcola_prezzo_totale(
-        camera.prezzo_per_notte,
-        prenotazione.data_check_in,
-        prenotazione.data_check_out
-    )
+    nuove, risposte = esegui_con_ritentativi(db, _crea_tutte)
     
-    # Crea prenotazione
-    nuova_prenotazione = Prenotazione(
-        camera_id=prenotazione.camera_id,
-        ospite_id=ospite.id,
-        data_check_in=prenotazione.data_check_in,
-        data_check_out=prenotazione.data_check_out,
-        numero_ospiti=prenotazione.numero_ospiti,
-        prezzo_totale=prezzo_totale,
-        stato=StatoPrenotazione.CONFERMATA
+    if indice.attivo:
+        # Ricarica le prenotazioni scadute dal commit con una sola query
+        db.scalars(select(Prenotazione).where(Prenotazione.id.in_([p.id for p in risposte]))).all()
+        for prenotazione in nuove:
+            indice.aggiorna(prenotazione)
+    
+    return risposte
+
+def _transizione_multipla(
+    db: Session,
+    ids: List[int],
+    stato_richiesto: StatoPrenotazione,
+    nuovo_stato: StatoPrenotazione
+):
+    """
+    Cambia stato a più prenotazioni con una lettura e un solo UPDATE
+    
+    L'UPDATE ripete la condizione sullo stato di partenza e restituisce gli ID
+    effettivamente aggiornati, così una transizione concorrente non viene
+    sovrascritta.
+    
+    Returns:
+        Tupla (righe lette per ID, ID aggiornati)
+    """
+    righe = {
+        riga.id: riga for riga in db.execute(
+            select(Prenotazione.id, Prenotazione.stato, Prenotazione.prezzo_totale)
+            .where(Prenotazione.id.in_(ids))
+        )
+    }
+    candidate = [i for i in ids if i in righe and righe[i].stato == stato_richiesto]
+    
+    aggiornate = set()
+    if candidate:
+        aggiornate = set(db.scalars(
+            update(Prenotazione)
+            .where(Prenotazione.id.in_(candidate), Prenotazione.stato == stato_richiesto)
+            .values(stato=nuovo_stato)
+            .returning(Prenotazione.id)
+            .execution_options(synchronize_session=False)
+        ))
+    return righe, aggiornate
+
+def _esiti_multipli(ids, righe, aggiornate, operazione, messaggio_ok, importo=False):
+    """Esito per ogni ID di un'operazione multipla, nell'ordine richiesto"""
+    risultati = []
+    for prenotazione_id in dict.fromkeys(ids):
+        if prenotazione_id in aggiornate:
+            esito = {"prenotazione_id": prenotazione_id, "esito": "ok", "messaggio": messaggio_ok}
+            if importo:
+                esito["importo_totale"] = righe[prenotazione_id].prezzo_totale
+        elif prenotazione_id not in righe:
+            esito = {"prenotazione_id": prenotazione_id, "esito": "errore", "messaggio": "Prenotazione non trovata"}
+        else:
+            esito = {
+                "prenotazione_id": prenotazione_id,
+                "esito": "errore",
+                "messaggio": f"{operazione} non possibile. Stato attuale: {righe[prenotazione_id].stato.value}"
+            }
+        risultati.append(esito)
+    return {"completate": len(aggiornate), "risultati": risultati}
+
+@app.post("/prenotazioni/check-in")
+def effettua_check_in_multiplo(richiesta: OperazioneMultiplaRequest, db: Session = Depends(get_db)):
+    """Effettua il check-in di più prenotazioni, con esito per ogni ID"""
+    righe, aggiornate = _transizione_multipla(
+        db,
+        richiesta.ids,
+        StatoPrenotazione.CONFERMATA,
+        StatoPrenotazione.CHECK_IN_EFFETTUATO
     )
+    db.commit()
+    # Le prenotazioni restano attive: l'indice registra solo la nuova versione
+    indice.registra_commit(db)
     
-    db.add(nuova_prenotazione)
+    return _esiti_multipli(richiesta.ids, righe, aggiornate, "Check-in", "Check-in effettuato con successo")
+
+@app.post("/prenotazioni/check-out")
+def effettua_check_out_multiplo(richiesta: OperazioneMultiplaRequest, db: Session = Depends(get_db)):
+    """Effettua il check-out di più prenotazioni, con esito e importo per ogni ID"""
+    righe, aggiornate = _transizione_multipla(
+        db,
+        richiesta.ids,
+        StatoPrenotazione.CHECK_IN_EFFETTUATO,
+        StatoPrenotazione.CHECK_OUT_COMPLETATO
+    )
+    if aggiornate:
+        # In caso di partenza anticipata le notti restanti tornano disponibili
+        libera_notti(db, *aggiornate, dal=date.today())
     db.commit()
-    db.refresh(nuova_prenotazione)
-    
-    return PrenotazioneResponse(
-        id=nuova_prenotazione.id,
-        camera_id=nuova_prenotazione.camera_id,
-        ospite_id=nuova_prenotazione.ospite_id,
-        data_check_in=nuova_prenotazione.data_check_in,
-        data_check_out=nuova_prenotazione.data_check_out,
-        numero_ospiti=nuova_prenotazione.numero_ospiti,
-        prezzo_totale=nuova_prenotazione.prezzo_totale,
-        stato=nuova_prenotazione.stato.value,
-        camera=CameraResponse(
-            id=camera.id,
-            numero=camera.numero,
-            tipo=camera.tipo.value,
-            piano=camera.piano,
-            prezzo_per_notte=camera.prezzo_per_notte,
-            servizi_inclusi=camera.servizi_inclusi
-        ),
-        ospite=OspiteResponse(
-            id=ospite.id,
-            nome=ospite.nome,
-            cognome=ospite.cognome,
-            documento=ospite.documento,
-            nazionalita=ospite.nazionalita,
-            email=ospite.email,
-            telefono=ospite.telefono
-        )
+    
+    for prenotazione_id in aggiornate:
+        indice.rimuovi(prenotazione_id, db)
+    
+    return _esiti_multipli(
+        richiesta.ids, righe, aggiornate, "Check-out", "Check-out completato con successo", importo=True
     )
 
+@app.get("/prenotazioni", response_model=List[PrenotazioneResponse])
+def elenco_prenotazioni(
+    response: Response,
+    stato: Optional[str] = None,
+    camera_id: Optional[int] = None,
+    ospite_id: Optional[int] = None,
+    cognome: Optional[str] = None,
+    check_in_da: Optional[date] = None,
+    check_in_a: Optional[date] = None,
+    check_out_da: Optional[date] = None,
+    check_out_a: Optional[date] = None,
+    limite: int = Query(50, ge=1, le=500),
+    cursore: Optional[str] = None,
+    db: Session = Depends(get_db_lettura)
+):
+    """
+    Elenca le prenotazioni filtrate, ordinate per data di check-in
+    
+    Paginazione a cursore su (data_check_in, id): ogni pagina riparte dalla
+    chiave dell'ultima prenotazione letta, senza OFFSET. Gli intervalli di
+    date sono inclusivi; 'cognome' cerca per prefisso senza distinguere
+    maiuscole e minuscole. Se ci sono altre prenotazioni, l'header
+    X-Cursore-Successivo contiene il cursore della pagina successiva.
+    """
+    query = _query_prenotazioni(
+        stato, camera_id, ospite_id, cognome,
+        check_in_da, check_in_a, check_out_da, check_out_a,
+        limite, cursore
+    )
+    return _pagina_prenotazioni(response, db.scalars(query).all(), limite)
+
 @app.get("/prenotazioni/{prenotazione_id}", response_model=PrenotazioneResponse)
-def ottieni_prenotazione(prenotazione_id: int, db: Session = Depends(get_db)):
+def ottieni_prenotazione(prenotazione_id: int, db: Session = Depends(get_db_lettura)):
     """Ottiene i dettagli di una prenotazione specifica"""
-    prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
+    prenotazione = db.scalar(_query_prenotazione(prenotazione_id))
     if not prenotazione:
         raise HTTPException(404, "Prenotazione non trovata")
     
-    return PrenotazioneResponse(
-        id=prenotazione.id,
-        camera_id=prenotazione.camera_id,
-        ospite_id=prenotazione.ospite_id,
-        data_check_in=prenotazione.data_check_in,
-        data_check_out=prenotazione.data_check_out,
-        numero_ospiti=prenotazione.numero_ospiti,
-        prezzo_totale=prenotazione.prezzo_totale,
-        stato=prenotazione.stato.value,
-        camera=CameraResponse(
-            id=prenotazione.camera.id,
-            numero=prenotazione.camera.numero,
-            tipo=prenotazione.camera.tipo.value,
-            piano=prenotazione.camera.piano,
-            prezzo_per_notte=prenotazione.camera.prezzo_per_notte,
-            servizi_inclusi=prenotazione.camera.servizi_inclusi
-        ),
-        ospite=OspiteResponse(
-            id=prenotazione.ospite.id,
-            nome=prenotazione.ospite.nome,
-            cognome=prenotazione.ospite.cognome,
-            documento=prenotazione.ospite.documento,
-            nazionalita=prenotazione.ospite.nazionalita,
-            email=prenotazione.ospite.email,
-            telefono=prenotazione.ospite.telefono
-        )
-    )
+    return PrenotazioneResponse.model_validate(prenotazione)
 
 @app.put("/prenotazioni/{prenotazione_id}", response_model=PrenotazioneResponse)
 def modifica_prenotazione(
@@ -322,248 +805,480 @@ def modifica_prenotazione(
     db: Session = Depends(get_db)
 ):
     """Modifica una prenotazione esistente"""
-    prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
-    if not prenotazione:
-        raise HTTPException(404, "Prenotazione non trovata")
+    cambio_date = bool(aggiornamento.data_check_in or aggiornamento.data_check_out)
     
-    if prenotazione.stato == StatoPrenotazione.CANCELLATA:
-        raise HTTPException(400, "Non è possibile modificare una prenotazione cancellata")
-    
-    if prenotazione.stato == StatoPrenotazione.CHECK_OUT_COMPLETATO:
-        raise HTTPException(400, "Non è possibile modificare una prenotazione completata")
+    def _modifica():
+        prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
+        if not prenotazione:
+            raise HTTPException(404, "Prenotazione non trovata")
+        
+        if cambio_date:
+            # Lock sulla camera, poi rilettura della prenotazione sotto lock
+            blocca_camere(db, [prenotazione.camera_id])
+            db.refresh(prenotazione)
+        
+        if prenotazione.stato == StatoPrenotazione.CANCELLATA:
+            raise HTTPException(400, "Non è possibile modificare una prenotazione cancellata")
+        
+        if prenotazione.stato == StatoPrenotazione.CHECK_OUT_COMPLETATO:
+            raise HTTPException(400, "Non è possibile modificare una prenotazione completata")
+        
+        # Aggiorna date se fornite
+        nuova_check_in = aggiornamento.data_check_in or prenotazione.data_check_in
+        nuova_check_out = aggiornamento.data_check_out or prenotazione.data_check_out
+        
+        if nuova_check_in >= nuova_check_out:
+            raise HTTPException(400, "La data di check-out deve essere successiva al check-in")
+        
+        # Verifica disponibilità se le date sono cambiate
+        if cambio_date:
+            if not verifica_disponibilita_camera(
+                db,
+                prenotazione.camera_id,
+                nuova_check_in,
+                nuova_check_out,
+                escludi_prenotazione_id=prenotazione_id
+            ):
+                raise HTTPException(409, "Camera non disponibile per il nuovo periodo")
+            
+            # Ricalcola prezzo
+            camera = prenotazione.camera
+            prenotazione.prezzo_totale = calcola_prezzo_totale(
+                camera.prezzo_per_notte,
+                nuova_check_in,
+                nuova_check_out
+            )
+        
+        if aggiornamento.data_check_in:
+            prenotazione.data_check_in = aggiornamento.data_check_in
+        if aggiornamento.data_check_out:
+            prenotazione.data_check_out = aggiornamento.data_check_out
+        if aggiornamento.numero_ospiti:
+            prenotazione.numero_ospiti = aggiornamento.numero_ospiti
+        
+        # Riallinea le notti occupate (prolungamento, anticipo o accorciamento)
+        if cambio_date:
+            libera_notti(db, prenotazione.id)
+            try:
+                occupa_notti(db, prenotazione)
+            except IntegrityError:
+                db.rollback()
+                raise HTTPException(409, "Camera non disponibile per il nuovo periodo")
+        
+        db.commit()
+        return prenotazione
     
-    # Aggiorna date se fornite
-    nuova_check_in = aggiornamento.data_check_in or prenotazione.data_check_in
-    nuova_check_out = aggiornamento.data_check_out or prenotazione.data_check_out
+    prenotazione = esegui_con_ritentativi(db, _modifica)
+    # Ricarica dopo il commit con camera e ospite in una sola query
+    prenotazione = db.scalars(
+        select(Prenotazione).options(*CARICA_RELAZIONI).where(Prenotazione.id == prenotazione_id),
+        execution_options={"populate_existing": True}
+    ).one()
+    indice.aggiorna(prenotazione)
     
-    if nuova_check_in >= nuova_check_out:
-        raise HTTPException(400, "La data di check-out deve essere successiva al check-in")
+    return PrenotazioneResponse.model_validate(prenotazione)
+
+@app.post("/prenotazioni/{prenotazione_id}/check-in")
+def effettua_check_in(
+    prenotazione_id: int,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
+):
+    """Effettua il check-in per una prenotazione"""
+    def _check_in():
+        prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
+        if not prenotazione:
+            raise HTTPException(404, "Prenotazione non trovata")
+        
+        if prenotazione.stato != StatoPrenotazione.CONFERMATA:
+            raise HTTPException(400, f"Check-in non possibile. Stato attuale: {prenotazione.stato.value}")
+        
+        prenotazione.stato = StatoPrenotazione.CHECK_IN_EFFETTUATO
+        return {"messaggio": "Check-in effettuato con successo", "prenotazione_id": prenotazione_id}
     
-    # Verifica disponibilità se le date sono cambiate
-    if (aggiornamento.data_check_in or aggiornamento.data_check_out):
-        if not verifica_disponibilita_camera(
-            db,
-            prenotazione.camera_id,
-            nuova_check_in,
-            nuova_check_out,
-            escludi_prenotazione_id=prenotazione_id
-        ):
-            raise HTTPException(409, "Camera non disponibile per il nuovo periodo")
+    risposta, ripetuta = esegui_idempotente(
+        db,
+        idempotency_key,
+        f"POST /prenotazioni/{prenotazione_id}/check-in",
+        impronta_richiesta(),
+        _check_in
+    )
+    if not ripetuta:
+        indice.registra_commit(db)
+    return risposta
+
+@app.post("/prenotazioni/{prenotazione_id}/check-out")
+def effettua_check_out(
+    prenotazione_id: int,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
+):
+    """Effettua il check-out per una prenotazione"""
+    def _check_out():
+        prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
+        if not prenotazione:
+            raise HTTPException(404, "Prenotazione non trovata")
         
-        # Ricalcola prezzo
-        camera = prenotazione.camera
-        prenotazione.prezzo_totale = calcola_prezzo_totale(
-            camera.prezzo_per_notte,
-            nuova_check_in,
-            nuova_check_out
-        )
+        if prenotazione.stato != StatoPrenotazione.CHECK_IN_EFFETTUATO:
+            raise HTTPException(400, f"Check-out non possibile. Stato attuale: {prenotazione.stato.value}")
+        
+        prenotazione.stato = StatoPrenotazione.CHECK_OUT_COMPLETATO
+        # In caso di partenza anticipata le notti restanti tornano disponibili
+        libera_notti(db, prenotazione.id, dal=date.today())
+        
+        return {
+            "messaggio": "Check-out completato con successo",
+            "prenotazione_id": prenotazione_id,
+            "importo_totale": prenotazione.prezzo_totale
+        }
     
-    if aggiornamento.data_check_in:
-        prenotazione.data_check_in = aggiornamento.data_check_in
-    if aggiornamento.data_check_out:
-        prenotazione.data_check_out = aggiornamento.data_check_out
-    if aggiornamento.numero_ospiti:
-        prenotazione.numero_ospiti = aggiornamento.numero_ospiti
+    risposta, ripetuta = esegui_idempotente(
+        db,
+        idempotency_key,
+        f"POST /prenotazioni/{prenotazione_id}/check-out",
+        impronta_richiesta(),
+        _check_out
+    )
+    if not ripetuta and indice.attivo:
+        indice.aggiorna(db.get(Prenotazione, prenotazione_id))
     
-    db.commit()
-    db.refresh(prenotazione)
-    
-    return PrenotazioneResponse(
-        id=prenotazione.id,
-        camera_id=prenotazione.camera_id,
-        ospite_id=prenotazione.ospite_id,
-        data_check_in=prenotazione.data_check_in,
-        data_check_out=prenotazione.data_check_out,
-        numero_ospiti=prenotazione.numero_ospiti,
-        prezzo_totale=prenotazione.prezzo_totale,
-        stato=prenotazione.stato.value,
-        camera=CameraResponse(
-            id=prenotazione.camera.id,
-            numero=prenotazione.camera.numero,
-            tipo=prenotazione.camera.tipo.value,
-            piano=prenotazione.camera.piano,
-            prezzo_per_notte=prenotazione.camera.prezzo_per_notte,
-            servizi_inclusi=prenotazione.camera.servizi_inclusi
-        ),
-        ospite=OspiteResponse(
-            id=prenotazione.ospite.id,
-            nome=prenotazione.ospite.nome,
-            cognome=prenotazione.ospite.cognome,
-            documento=prenotazione.ospite.documento,
-            nazionalita=prenotazione.ospite.nazionalita,
-            email=prenotazione.ospite.email,
-            telefono=prenotazione.ospite.telefono
-        )
+    return risposta
+
+@app.delete("/prenotazioni/{prenotazione_id}")
+def cancella_prenotazione(
+    prenotazione_id: int,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=100)
+):
+    """Cancella una prenotazione"""
+    def _cancella():
+        prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
+        if not prenotazione:
+            raise HTTPException(404, "Prenotazione non trovata")
+        
+        if prenotazione.stato == StatoPrenotazione.CHECK_OUT_COMPLETATO:
+            raise HTTPException(400, "Non è possibile cancellare una prenotazione completata")
+        
+        prenotazione.stato = StatoPrenotazione.CANCELLATA
+        libera_notti(db, prenotazione.id)
+        return {"messaggio": "Prenotazione cancellata con successo"}
+    
+    risposta, ripetuta = esegui_idempotente(
+        db,
+        idempotency_key,
+        f"DELETE /prenotazioni/{prenotazione_id}",
+        impronta_richiesta(),
+        _cancella
     )
+    if not ripetuta and indice.attivo:
+        indice.aggiorna(db.get(Prenotazione, prenotazione_id))
+    
+    return risposta
 
-@app.post("/prenotazioni/{prenotazione_id}/check-in")
-def effettua_check_in(prenotazione_id: int, db: Session = Depends(get_db)):
-    """Effettua il check-in per una prenotazione"""
-    prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
-    if not prenotazione:
-        raise HTTPException(404, "Prenotazione non trovata")
+@app.get("/dashboard/arrivi-oggi", response_model=List[PrenotazioneResponse], dependencies=[Depends(etag_dati)])
+def arrivi_oggi(db: Session = Depends(get_db_lettura)):
+    """Ottiene le prenotazioni con check-in previsto per oggi"""
+    prenotazioni = db.scalars(_query_arrivi_oggi()).all()
     
-    if prenotazione.stato != StatoPrenotazione.CONFERMATA:
-        raise HTTPException(400, f"Check-in non possibile. Stato attuale: {prenotazione.stato.value}")
+    return [PrenotazioneResponse.model_validate(p) for p in prenotazioni]
+
+@app.get("/dashboard/partenze-oggi", response_model=List[PrenotazioneResponse], dependencies=[Depends(etag_dati)])
+def partenze_oggi(db: Session = Depends(get_db_lettura)):
+    """Ottiene le prenotazioni con check-out previsto per oggi"""
+    prenotazioni = db.scalars(_query_partenze_oggi()).all()
     
-    prenotazione.stato = StatoPrenotazione.CHECK_IN_EFFETTUATO
-    db.commit()
+    return [PrenotazioneResponse.model_validate(p) for p in prenotazioni]
+
+@app.get("/dashboard/occupazione", dependencies=[Depends(etag_dati)])
+def stato_occupazione(
+    piano: Optional[int] = None,
+    tipo: Optional[str] = None,
+    db: Session = Depends(get_db_lettura)
+):
+    """Ottiene lo stato di occupazione delle camere, filtrabile per piano e tipo"""
+    # Esecuzione Core sulla connessione: una query, nessun oggetto ORM
+    return _stato_camere(db.connection().execute(_query_occupazione(piano, tipo)))
+
+@app.get("/dashboard/statistiche", dependencies=[Depends(etag_dati)])
+def statistiche_generali(db: Session = Depends(get_db_lettura)):
+    """Ottiene le statistiche di occupazione e il ricavo di oggi"""
+    return statistiche_dashboard(db)
+
+@app.get("/disponibilita/matrice")
+def matrice_disponibilita(
+    da: date,
+    a: date,
+    tipo: Optional[str] = None,
+    formato: str = "bitmap",
+    db: Session = Depends(get_db_lettura)
+):
+    """
+    Stato di occupazione di ogni camera per ogni giorno del periodo [da, a)
     
-    return {"messaggio": "Check-in effettuato con successo", "prenotazione_id": prenotazione_id}
+    Formato 'bitmap': una stringa base64 per camera, un bit per giorno (1 = occupata).
+    Formato 'segmenti': per camera la lista di [giorno_iniziale, numero_giorni] occupati.
+    """
+    if da >= a:
+        raise HTTPException(400, "La data finale deve essere successiva alla data iniziale")
+    
+    if (a - da).days > 731:
+        raise HTTPException(400, "Il periodo massimo della matrice è di 731 giorni")
+    
+    if formato not in ("bitmap", "segmenti"):
+        raise HTTPException(400, f"Formato non valido: {formato}")
+    
+    tipo_enum = None
+    if tipo:
+        try:
+            tipo_enum = TipoCamera(tipo)
+        except ValueError:
+            raise HTTPException(400, f"Tipo camera non valido: {tipo}")
+    
+    camere, occupazione = matrice_occupazione(db, da, a, tipo_enum)
+    righe = codifica_bitmap(occupazione) if formato == "bitmap" else codifica_segmenti(occupazione)
+    
+    return {
+        "da": str(da),
+        "a": str(a),
+        "giorni": (a - da).days,
+        "formato": formato,
+        "camere": [
+            {"id": camera_id, "numero": numero, "tipo": tipo_camera.value, "occupazione": riga}
+            for (camera_id, numero, tipo_camera, _), riga in zip(camere, righe)
+        ]
+    }
 
-@app.post("/prenotazioni/{prenotazione_id}/check-out")
-def effettua_check_out(prenotazione_id: int, db: Session = Depends(get_db)):
-    """Effettua il check-out per una prenotazione"""
-    prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
-    if not prenotazione:
-        raise HTTPException(404, "Prenotazione non trovata")
+@app.get("/report/kpi", dependencies=[Depends(etag_dati)])
+def report_kpi(
+    da: date,
+    a: date,
+    granularita: str = "giorno",
+    tipo: Optional[str] = None,
+    db: Session = Depends(get_db_lettura)
+):
+    """
+    Indicatori di ricavo e occupazione per giorno, settimana o mese nel periodo [da, a]
     
-    if prenotazione.stato != StatoPrenotazione.CHECK_IN_EFFETTUATO:
-        raise HTTPException(400, f"Check-out non possibile. Stato attuale: {prenotazione.stato.value}")
+    Per ogni periodo: camere-notte disponibili, notti vendute, ricavo,
+    occupazione (%), ADR (ricavo per notte venduta), RevPAR (ricavo per
+    camera-notte disponibile), arrivi, partenze e cancellazioni (per data
+    di check-in). Letti dalle statistiche giornaliere precalcolate.
+    """
+    if da > a:
+        raise HTTPException(400, "La data finale deve essere successiva alla data iniziale")
     
-    prenotazione.stato = StatoPrenotazione.CHECK_OUT_COMPLETATO
-    db.commit()
+    if (a - da).days > 1096:
+        raise HTTPException(400, "Il periodo massimo del report è di 3 anni")
+    
+    if granularita not in GRANULARITA:
+        raise HTTPException(400, f"Granularità non valida: {granularita}")
+    
+    tipo_enum = None
+    if tipo:
+        try:
+            tipo_enum = TipoCamera(tipo)
+        except ValueError:
+            raise HTTPException(400, f"Tipo camera non valido: {tipo}")
     
     return {
-        "messaggio": "Check-out completato con successo",
-        "prenotazione_id": prenotazione_id,
-        "importo_totale": prenotazione.prezzo_totale
+        "da": str(da),
+        "a": str(a),
+        "granularita": granularita,
+        "tipo": tipo,
+        **kpi_periodo(serie_giornaliere(db, da, a, tipo_enum), granularita)
     }
 
-@app.delete("/prenotazioni/{prenotazione_id}")
-def cancella_prenotazione(prenotazione_id: int, db: Session = Depends(get_db)):
-    """Cancella una prenotazione"""
-    prenotazione = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
-    if not prenotazione:
-        raise HTTPException(404, "Prenotazione non trovata")
+@app.get("/export/prenotazioni")
+def esporta_prenotazioni(
+    formato: str = "csv",
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    ultima_scrittura: Optional[str] = Cookie(None, alias=COOKIE_SCRITTURA, include_in_schema=False)
+):
+    """
+    Esporta in streaming le prenotazioni con check-in nell'intervallo [da, a]
+    
+    Formato 'csv' o 'ndjson' (righe con i dati di camera e ospite), oppure
+    'parquet' o 'arrow' (stream Arrow IPC) con colonne tipizzate. Letto da
+    una replica entro il ritardo ammesso, se configurata: lo streaming apre una sessione
+    propria sull'engine scelto qui.
+    """
+    formati = {
+        "csv": (righe_csv, "text/csv; charset=utf-8"),
+        "ndjson": (righe_ndjson, "application/x-ndjson"),
+        "parquet": (lambda *argomenti: byte_colonnari("parquet", *argomenti), "application/vnd.apache.parquet"),
+        "arrow": (lambda *argomenti: byte_colonnari("arrow", *argomenti), "application/vnd.apache.arrow.stream"),
+    }
+    if formato not in formati:
+        raise HTTPException(400, f"Formato non valido: {formato}")
+    
+    if da and a and da > a:
+        raise HTTPException(400, "La data finale deve essere successiva alla data iniziale")
     
-    if prenotazione.stato == StatoPrenotazione.CHECK_OUT_COMPLETATO:
-        raise HTTPException(400, "Non è possibile cancellare una prenotazione completata")
+    genera, media_type = formati[formato]
+    replica = replica_lettura(ultima_scrittura)
+    nome_file = f"prenotazioni_{da or 'inizio'}_{a or 'fine'}.{formato}"
+    return StreamingResponse(
+        genera(da, a, replica.motore if replica else None),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_file}"'}
+    )
+
+@app.get("/admin/cache/statistiche")
+def statistiche_cache():
+    """Contatori della cache di catalogo e disponibilità"""
+    return cache.statistiche()
+
+@app.post("/admin/statistiche-giornaliere/ricostruisci")
+def ricostruisci_statistiche_giornaliere(
+    da: Optional[date] = None,
+    a: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """Ricalcola le statistiche giornaliere del periodo [da, a] dalle prenotazioni (default tutto lo storico)"""
+    if da and a and da > a:
+        raise HTTPException(400, "La data finale deve essere successiva alla data iniziale")
     
-    prenotazione.stato = StatoPrenotazione.CANCELLATA
+    righe = ricostruisci_statistiche(db, da, a)
     db.commit()
+    return {"righe": righe}
+
+@app.get("/admin/indice-disponibilita/verifica")
+def verifica_indice_disponibilita(ripara: bool = False, db: Session = Depends(get_db)):
+    """Confronta l'indice di disponibilità in memoria con la tabella prenotazioni"""
+    if not indice.attivo:
+        return {"attivo": False, "mancanti": [], "superflue": [], "riparato": False}
+    
+    differenze = indice.verifica(db)
+    riparato = False
+    if ripara and (differenze["mancanti"] or differenze["superflue"]):
+        indice.carica(db)
+        riparato = True
     
-    return {"messaggio": "Prenotazione cancellata con successo"}
+    return {"attivo": True, **differenze, "riparato": riparato}
 
-@app.get("/dashboard/arrivi-oggi", response_model=List[PrenotazioneResponse])
-def arrivi_oggi(db: Session = Depends(get_db)):
-    """Ottiene le prenotazioni con check-in previsto per oggi"""
-    oggi = date.today()
-    prenotazioni = db.query(Prenotazione).filter(
-        Prenotazione.data_check_in == oggi,
-        Prenotazione.stato == StatoPrenotazione.CONFERMATA
-    ).all()
-    
-    return [PrenotazioneResponse(
-        id=p.id,
-        camera_id=p.camera_id,
-        ospite_id=p.ospite_id,
-        data_check_in=p.data_check_in,
-        data_check_out=p.data_check_out,
-        numero_ospiti=p.numero_ospiti,
-        prezzo_totale=p.prezzo_totale,
-        stato=p.stato.value,
-        camera=CameraResponse(
-            id=p.camera.id,
-            numero=p.camera.numero,
-            tipo=p.camera.tipo.value,
-            piano=p.camera.piano,
-            prezzo_per_notte=p.camera.prezzo_per_notte,
-            servizi_inclusi=p.camera.servizi_inclusi
-        ),
-        ospite=OspiteResponse(
-            id=p.ospite.id,
-            nome=p.ospite.nome,
-            cognome=p.ospite.cognome,
-            documento=p.ospite.documento,
-            nazionalita=p.ospite.nazionalita,
-            email=p.ospite.email,
-            telefono=p.ospite.telefono
+# ========== LETTURE ASYNC (DATABASE_ASYNC=1) ==========
+# Stessi percorsi, parametri e risposte delle letture sincrone, con le stesse
+# query (funzioni _query_*) eseguite con await sulla sessione async: nessun
+# thread del threadpool per richiesta, anche per ETag e versione dei dati.
+# Definite solo in modalità async: richiedono greenlet e il driver async.
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    
+    letture_async = APIRouter()
+    
+    # Sull'event loop restano solo le conversioni delle righe in risposta,
+    # su pagine limitate (al più 500 righe)
+    
+    @letture_async.get("/camere", response_model=List[CameraResponse], dependencies=[Depends(etag_dati_async)])
+    async def ottieni_camere_async(
+        response: Response,
+        limite: Optional[int] = Query(None, ge=1, le=500),
+        cursore: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db_lettura)
+    ):
+        """Ottiene l'elenco delle camere ordinate per ID, tutte o a pagine"""
+        if limite is None and cursore:
+            limite = 100
+        query = _query_camere(limite, cursore)
+        
+        async def _pagina():
+            return _pagina_camere((await db.scalars(query)).all(), limite)
+        
+        camere, successivo = await leggi_o_calcola_async(
+            chiave_cache("camere", limite=limite, cursore=cursore),
+            _pagina,
+            GRUPPO_CAMERE,
+            db
         )
-    ) for p in prenotazioni]
-
-@app.get("/dashboard/partenze-oggi", response_model=List[PrenotazioneResponse])
-def partenze_oggi(db: Session = Depends(get_db)):
-    """Ottiene le prenotazioni con check-out previsto per oggi"""
-    oggi = date.today()
-    prenotazioni = db.query(Prenotazione).filter(
-        Prenotazione.data_check_out == oggi,
-        Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO
-    ).all()
-    
-    return [PrenotazioneResponse(
-        id=p.id,
-        camera_id=p.camera_id,
-        ospite_id=p.ospite_id,
-        data_check_in=p.data_check_in,
-        data_check_out=p.data_check_out,
-        numero_ospiti=p.numero_ospiti,
-        prezzo_totale=p.prezzo_totale,
-        stato=p.stato.value,
-        camera=CameraResponse(
-            id=p.camera.id,
-            numero=p.camera.numero,
-            tipo=p.camera.tipo.value,
-            piano=p.camera.piano,
-            prezzo_per_notte=p.camera.prezzo_per_notte,
-            servizi_inclusi=p.camera.servizi_inclusi
-        ),
-        ospite=OspiteResponse(
-            id=p.ospite.id,
-            nome=p.ospite.nome,
-            cognome=p.ospite.cognome,
-            documento=p.ospite.documento,
-            nazionalita=p.ospite.nazionalita,
-            email=p.ospite.email,
-            telefono=p.ospite.telefono
+        if successivo:
+            response.headers[HEADER_CURSORE] = successivo
+        
+        return camere
+    
+    @letture_async.get("/ospiti/search", response_model=List[OspiteRicercaResponse])
+    async def ricerca_ospiti_async(
+        q: str = Query(..., min_length=1, max_length=100),
+        limite: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_db_lettura)
+    ):
+        """Cerca gli ospiti per prefisso di nome, cognome, documento o email"""
+        query = query_ricerca_ospiti(q, limite)
+        if query is None:
+            return []
+        ospiti = (await db.scalars(query)).all()
+        soggiorni = {}
+        if ospiti:
+            righe = await db.execute(query_riepilogo_soggiorni([o.id for o in ospiti]))
+            soggiorni = riepilogo_da_righe(righe.all())
+        
+        return _ospiti_trovati(ospiti, soggiorni)
+    
+    @letture_async.get("/prenotazioni", response_model=List[PrenotazioneResponse])
+    async def elenco_prenotazioni_async(
+        response: Response,
+        stato: Optional[str] = None,
+        camera_id: Optional[int] = None,
+        ospite_id: Optional[int] = None,
+        cognome: Optional[str] = None,
+        check_in_da: Optional[date] = None,
+        check_in_a: Optional[date] = None,
+        check_out_da: Optional[date] = None,
+        check_out_a: Optional[date] = None,
+        limite: int = Query(50, ge=1, le=500),
+        cursore: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db_lettura)
+    ):
+        """Elenca le prenotazioni filtrate, ordinate per data di check-in"""
+        query = _query_prenotazioni(
+            stato, camera_id, ospite_id, cognome,
+            check_in_da, check_in_a, check_out_da, check_out_a,
+            limite, cursore
         )
-    ) for p in prenotazioni]
-
-@app.get("/dashboard/occupazione")
-def stato_occupazione(db: Session = Depends(get_db)):
-    """Ottiene lo stato di occupazione di tutte le camere"""
-    oggi = date.today()
-    camere = db.query(Camera).all()
-    
-    stato = []
-    for camera in camere:
-        prenotazione_attuale = db.query(Prenotazione).filter(
-            Prenotazione.camera_id == camera.id,
-            Prenotazione.data_check_in <= oggi,
-            Prenotazione.data_check_out > oggi,
-            Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO
-        ).first()
-        
-        if prenotazione_attuale:
-            stato.append({
-                "camera": CameraResponse(
-                    id=camera.id,
-                    numero=camera.numero,
-                    tipo=camera.tipo.value,
-                    piano=camera.piano,
-                    prezzo_per_notte=camera.prezzo_per_notte,
-                    servizi_inclusi=camera.servizi_inclusi
-                ),
-                "occupata": True,
-                "ospite": f"{prenotazione_attuale.ospite.nome} {prenotazione_attuale.ospite.cognome}",
-                "check_out_previsto": str(prenotazione_attuale.data_check_out)
-            })
-        else:
-            stato.append({
-                "camera": CameraResponse(
-                    id=camera.id,
-                    numero=camera.numero,
-                    tipo=camera.tipo.value,
-                    piano=camera.piano,
-                    prezzo_per_notte=camera.prezzo_per_notte,
-                    servizi_inclusi=camera.servizi_inclusi
-                ),
-                "occupata": False,
-                "ospite": None,
-                "check_out_previsto": None
-            })
+        return _pagina_prenotazioni(response, (await db.scalars(query)).all(), limite)
+    
+    @letture_async.get("/prenotazioni/{prenotazione_id}", response_model=PrenotazioneResponse)
+    async def ottieni_prenotazione_async(prenotazione_id: int, db: AsyncSession = Depends(get_async_db_lettura)):
+        """Ottiene i dettagli di una prenotazione specifica"""
+        prenotazione = await db.scalar(_query_prenotazione(prenotazione_id))
+        if not prenotazione:
+            raise HTTPException(404, "Prenotazione non trovata")
+        
+        return PrenotazioneResponse.model_validate(prenotazione)
+    
+    @letture_async.get("/dashboard/arrivi-oggi", response_model=List[PrenotazioneResponse], dependencies=[Depends(etag_dati_async)])
+    async def arrivi_oggi_async(db: AsyncSession = Depends(get_async_db_lettura)):
+        """Ottiene le prenotazioni con check-in previsto per oggi"""
+        prenotazioni = (await db.scalars(_query_arrivi_oggi())).all()
+        return [PrenotazioneResponse.model_validate(p) for p in prenotazioni]
+    
+    @letture_async.get("/dashboard/partenze-oggi", response_model=List[PrenotazioneResponse], dependencies=[Depends(etag_dati_async)])
+    async def partenze_oggi_async(db: AsyncSession = Depends(get_async_db_lettura)):
+        """Ottiene le prenotazioni con check-out previsto per oggi"""
+        prenotazioni = (await db.scalars(_query_partenze_oggi())).all()
+        return [PrenotazioneResponse.model_validate(p) for p in prenotazioni]
+    
+    @letture_async.get("/dashboard/occupazione", dependencies=[Depends(etag_dati_async)])
+    async def stato_occupazione_async(
+        piano: Optional[int] = None,
+        tipo: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_db_lettura)
+    ):
+        """Ottiene lo stato di occupazione delle camere, filtrabile per piano e tipo"""
+        return _stato_camere(await db.execute(_query_occupazione(piano, tipo)))
+    
+    @letture_async.get("/dashboard/statistiche", dependencies=[Depends(etag_dati_async)])
+    async def statistiche_generali_async(db: AsyncSession = Depends(get_async_db_lettura)):
+        """Ottiene le statistiche di occupazione e il ricavo di oggi"""
+        return await statistiche_dashboard_async(db)
     
-    return stato
+    # Sostituzione nella stessa posizione: l'ordine dei percorsi resta invariato
+    # (/prenotazioni/{prenotazione_id} dopo i percorsi fissi)
+    versioni_async = {(r.path, frozenset(r.methods)): r for r in letture_async.routes}
+    app.router.routes = [
+        versioni_async.get((r.path, frozenset(r.methods)), r) if isinstance(r, APIRoute) else r
+        for r in app.router.routes
+    ]
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,266 @@
+"""
+Migrazioni versionate dello schema del database
+
+Base.metadata.create_all crea le tabelle mancanti ma non modifica quelle
+esistenti: indici e colonne nuove su database già in uso sono migrazioni
+numerate in MIGRAZIONI, applicate in ordine da init_database. La tabella
+versioni_schema registra le migrazioni applicate; ognuna è eseguita nella
+stessa transazione della sua registrazione. Sui database nuovi create_all
+ha già creato lo schema aggiornato, quindi ogni migrazione deve poter essere
+ripetuta senza effetti (IF NOT EXISTS / IF EXISTS).
+
+Applicazione, stato e verifica dei piani di esecuzione (SQLite):
+    python -m backend.migrazioni
+    python -m backend.migrazioni --stato
+    python -m backend.migrazioni --verifica
+"""
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import Column, DateTime, MetaData, String, Table, event, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.models import Prenotazione, StatoPrenotazione
+
+versioni_schema = Table(
+    "versioni_schema",
+    MetaData(),
+    Column("versione", String(20), primary_key=True),
+    Column("descrizione", String(200), nullable=False),
+    Column("applicata_il", DateTime, nullable=False)
+)
+
+
+def _0001_indici_prenotazioni(connessione: Connection):
+    """
+    Indici composti per la sovrapposizione, gli arrivi e l'elenco per stato
+
+    L'indice sulla sovrapposizione per camera è parziale sulle prenotazioni
+    attive: le concluse e le cancellate, la maggior parte dello storico, non
+    vi entrano. Gli indici sul solo stato e sulla sola data di check-in sono
+    prefissi di (stato, data_check_in, id) e (data_check_in, id): eliminati,
+    ogni scrittura aggiorna un indice in meno.
+    """
+    for istruzione in (
+        "CREATE INDEX IF NOT EXISTS ix_prenotazioni_attive_camera "
+        "ON prenotazioni (camera_id, data_check_out, data_check_in) "
+        "WHERE stato IN ('CONFERMATA', 'CHECK_IN_EFFETTUATO')",
+        "CREATE INDEX IF NOT EXISTS ix_prenotazioni_stato_check_in "
+        "ON prenotazioni (stato, data_check_in, id)",
+        "DROP INDEX IF EXISTS ix_prenotazioni_stato",
+        "DROP INDEX IF EXISTS ix_prenotazioni_data_check_in",
+        # Statistiche per il pianificatore sugli indici nuovi
+        "ANALYZE prenotazioni"
+    ):
+        connessione.execute(text(istruzione))
+
+
+def _0002_indici_ricerca_ospiti(connessione: Connection):
+    """
+    Indici sui prefissi in minuscolo di nome, cognome, documento ed email (PostgreSQL)
+
+    Servono alla ricerca ospiti senza FTS5 (lower(colonna) LIKE 'prefisso%'):
+    text_pattern_ops permette il confronto per prefisso con qualsiasi
+    collation. Su SQLite la ricerca usa FTS5 e il LIKE non userebbe indici
+    su espressioni: nessun indice.
+    """
+    if connessione.dialect.name != "postgresql":
+        return
+    for colonna in ("nome", "cognome", "documento", "email"):
+        connessione.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_ospiti_{colonna}_minuscolo "
+            f"ON ospiti (lower({colonna}) text_pattern_ops)"
+        ))
+
+
+def _0003_indici_prenotazioni_mancanti(connessione: Connection):
+    """
+    Indici delle prenotazioni dichiarati nel modello dopo lo schema iniziale
+
+    create_all li crea solo sui database nuovi: (data_check_in, id) per la
+    paginazione a cursore e l'ordine dell'export, camera_id e ospite_id per
+    le prenotazioni di una camera e di un ospite (riepilogo della ricerca
+    ospiti). Senza, i database aggiornati dallo schema iniziale, che la
+    migrazione 0001 ha privato dell'indice su data_check_in, leggerebbero
+    tutta la tabella.
+    """
+    for istruzione in (
+        "CREATE INDEX IF NOT EXISTS ix_prenotazioni_check_in_id ON prenotazioni (data_check_in, id)",
+        "CREATE INDEX IF NOT EXISTS ix_prenotazioni_camera_id ON prenotazioni (camera_id)",
+        "CREATE INDEX IF NOT EXISTS ix_prenotazioni_ospite_id ON prenotazioni (ospite_id)",
+        "ANALYZE prenotazioni"
+    ):
+        connessione.execute(text(istruzione))
+
+
+# (versione, descrizione, funzione) in ordine di applicazione
+MIGRAZIONI: List[Tuple[str, str, Callable[[Connection], None]]] = [
+    ("0001", "Indici composti e parziali sulle prenotazioni", _0001_indici_prenotazioni),
+    ("0002", "Indici per la ricerca ospiti per prefisso (PostgreSQL)", _0002_indici_ricerca_ospiti),
+    ("0003", "Indici delle prenotazioni per cursore, camera e ospite", _0003_indici_prenotazioni_mancanti),
+]
+
+
+def versioni_applicate(motore: Engine) -> Dict[str, datetime]:
+    """Versioni registrate in versioni_schema, con la data di applicazione"""
+    with motore.begin() as connessione:
+        versioni_schema.create(connessione, checkfirst=True)
+        return dict(connessione.execute(select(versioni_schema.c.versione, versioni_schema.c.applicata_il)).all())
+
+
+def applica_migrazioni(motore: Engine) -> List[str]:
+    """
+    Applica in ordine le migrazioni non ancora registrate
+
+    Ogni migrazione e la sua registrazione sono una sola transazione, anche
+    su SQLite (BEGIN esplicito): se fallisce, nessuna modifica resta applicata.
+
+    Args:
+        motore: Engine del database
+
+    Returns:
+        Versioni applicate da questa chiamata
+    """
+    applicate = versioni_applicate(motore)
+    nuove = []
+    for versione, descrizione, migrazione in MIGRAZIONI:
+        if versione in applicate:
+            continue
+        try:
+            with motore.connect() as connessione:
+                if connessione.dialect.name == "sqlite":
+                    # pysqlite apre da sé la transazione solo prima di INSERT,
+                    # UPDATE e DELETE: senza BEGIN il DDL andrebbe in autocommit
+                    connessione.exec_driver_sql("BEGIN")
+                migrazione(connessione)
+                connessione.execute(insert(versioni_schema).values(
+                    versione=versione, descrizione=descrizione, applicata_il=datetime.now()
+                ))
+                connessione.commit()
+        except IntegrityError:
+            # Già registrata da un altro processo avviato insieme a questo
+            continue
+        nuove.append(versione)
+    return nuove
+
+
+# Query frequenti e indici sulle prenotazioni che ciascuna può usare. Per la
+# matrice il pianificatore sceglie secondo le statistiche (ANALYZE): i due
+# indici leggono entrambi solo le prenotazioni attive.
+INDICI_ATTESI = {
+    "ricerca disponibilità": ("ix_prenotazioni_attive_camera",),
+    "occupazione": ("ix_prenotazioni_attive_camera",),
+    "statistiche dashboard": ("ix_prenotazioni_attive_camera",),
+    "matrice disponibilità": ("ix_prenotazioni_stato_check_in", "ix_prenotazioni_attive_camera"),
+    "arrivi del giorno": ("ix_prenotazioni_stato_check_in",),
+    "elenco per stato": ("ix_prenotazioni_stato_check_in",),
+}
+
+
+def piani_di_esecuzione(db: Session, giorno: date) -> Dict[str, List[str]]:
+    """
+    Piani di esecuzione SQLite (EXPLAIN QUERY PLAN) delle query frequenti
+
+    Ogni query è eseguita con il codice dell'applicazione; le istruzioni SQL
+    inviate al driver, con i loro parametri, sono poi ripetute con EXPLAIN
+    QUERY PLAN.
+
+    Args:
+        db: Sessione su un database SQLite
+        giorno: Giorno di riferimento delle query
+
+    Returns:
+        Dizionario nome query -> righe del piano
+    """
+    from backend.disponibilita import matrice_occupazione
+    from backend.statistiche import calcola_statistiche
+    from backend.utils import query_camere_disponibili, query_stato_occupazione
+
+    query = {
+        "ricerca disponibilità": lambda: db.execute(query_camere_disponibili(giorno, giorno + timedelta(days=3))).all(),
+        "occupazione": lambda: db.execute(query_stato_occupazione(giorno)).all(),
+        "statistiche dashboard": lambda: calcola_statistiche(db, giorno),
+        "matrice disponibilità": lambda: matrice_occupazione(db, giorno, giorno + timedelta(days=30)),
+        "arrivi del giorno": lambda: db.scalars(select(Prenotazione).where(
+            Prenotazione.data_check_in == giorno,
+            Prenotazione.stato == StatoPrenotazione.CONFERMATA
+        )).all(),
+        "elenco per stato": lambda: db.scalars(
+            select(Prenotazione).where(Prenotazione.stato == StatoPrenotazione.CONFERMATA)
+            .order_by(Prenotazione.data_check_in, Prenotazione.id).limit(51)
+        ).all(),
+    }
+
+    connessione = db.connection()
+    piani = {}
+    for nome, esegui in query.items():
+        istruzioni = []
+
+        def registra(conn, cursore, istruzione, parametri, contesto, multiple):
+            istruzioni.append((istruzione, parametri))
+
+        event.listen(connessione, "before_cursor_execute", registra)
+        try:
+            esegui()
+        finally:
+            event.remove(connessione, "before_cursor_execute", registra)
+        piani[nome] = [
+            riga[-1]
+            for istruzione, parametri in istruzioni
+            for riga in connessione.exec_driver_sql(f"EXPLAIN QUERY PLAN {istruzione}", parametri).all()
+        ]
+    return piani
+
+
+def verifica_indici(db: Session, giorno: date = None) -> List[str]:
+    """
+    Controlla che le query frequenti usino gli indici di INDICI_ATTESI
+
+    Args:
+        db: Sessione su un database SQLite
+        giorno: Giorno di riferimento (default oggi)
+
+    Returns:
+        Un messaggio per ogni query che non usa i suoi indici (vuota se tutte li usano)
+    """
+    piani = piani_di_esecuzione(db, giorno or date.today())
+    return [
+        f"{nome}: atteso {' o '.join(INDICI_ATTESI[nome])}, piano: {'; '.join(piano)}"
+        for nome, piano in piani.items()
+        if not any(indice in riga for indice in INDICI_ATTESI[nome] for riga in piano)
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from backend.database import SessionLocal, engine, init_database
+
+    parser = argparse.ArgumentParser(description="Migrazioni dello schema del database")
+    parser.add_argument("--stato", action="store_true", help="Mostra le migrazioni applicate e quelle in attesa")
+    parser.add_argument("--verifica", action="store_true", help="Controlla gli indici usati dalle query frequenti (SQLite)")
+    argomenti = parser.parse_args()
+
+    if argomenti.stato:
+        applicate = versioni_applicate(engine)
+        for versione, descrizione, _ in MIGRAZIONI:
+            stato = f"applicata il {applicate[versione]:%Y-%m-%d %H:%M}" if versione in applicate else "in attesa"
+            print(f"{versione}  {descrizione}: {stato}")
+        sys.exit(0)
+
+    # init_database applica le migrazioni in attesa
+    init_database()
+    if argomenti.verifica:
+        if engine.dialect.name != "sqlite":
+            print("⚠️  Verifica dei piani disponibile solo su SQLite")
+            sys.exit(0)
+        session = SessionLocal()
+        try:
+            errori = verifica_indici(session)
+        finally:
+            session.close()
+        for errore in errori:
+            print(f"❌ {errore}")
+        if errori:
+            sys.exit(1)
+        print(f"✅ Le {len(INDICI_ATTESI)} query frequenti usano gli indici attesi")
@@ -1,7 +1,7 @@
 """
 Modelli del Database SQLAlchemy
 """
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Enum, Text, Index, PrimaryKeyConstraint, text
 from sqlalchemy.orm import relationship
 from backend.database import Base
 import enum
@@ -22,6 +22,24 @@ class StatoPrenotazione(enum.Enum):
     CANCELLATA = "cancellata"
 
 
+# Stati in cui una prenotazione occupa la camera
+STATI_ATTIVI = (
+    StatoPrenotazione.CONFERMATA,
+    StatoPrenotazione.CHECK_IN_EFFETTUATO
+)
+
+# Condizione degli indici parziali sulle prenotazioni attive (gli enum sono
+# salvati per nome); le query la ripetono con utils.filtro_stati_attivi
+CONDIZIONE_STATI_ATTIVI = "stato IN ({})".format(", ".join(f"'{stato.name}'" for stato in STATI_ATTIVI))
+
+# Stati in cui una prenotazione vende le sue notti: confermate, in corso e concluse
+STATI_VENDUTI = (
+    StatoPrenotazione.CONFERMATA,
+    StatoPrenotazione.CHECK_IN_EFFETTUATO,
+    StatoPrenotazione.CHECK_OUT_COMPLETATO
+)
+
+
 class Camera(Base):
     """Modello per le camere dell'hotel"""
     __tablename__ = 'camere'
@@ -62,15 +80,30 @@ class Ospite(Base):
 class Prenotazione(Base):
     """Modello per le prenotazioni"""
     __tablename__ = 'prenotazioni'
+    __table_args__ = (
+        # Ordine delle pagine dell'elenco prenotazioni (paginazione a cursore).
+        # Questo indice e quelli su camera_id e ospite_id sono della migrazione 0003
+        Index('ix_prenotazioni_check_in_id', 'data_check_in', 'id'),
+        # Indici della migrazione 0001 (backend/migrazioni.py).
+        # Sovrapposizione delle prenotazioni attive di una camera: ricerca
+        # disponibilità, occupazione e statistiche della dashboard
+        Index(
+            'ix_prenotazioni_attive_camera', 'camera_id', 'data_check_out', 'data_check_in',
+            sqlite_where=text(CONDIZIONE_STATI_ATTIVI), postgresql_where=text(CONDIZIONE_STATI_ATTIVI)
+        ),
+        # Arrivi del giorno, elenco filtrato per stato nell'ordine delle pagine
+        # e prenotazioni attive di tutte le camere (matrice di disponibilità)
+        Index('ix_prenotazioni_stato_check_in', 'stato', 'data_check_in', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    camera_id = Column(Integer, ForeignKey('camere.id'), nullable=False)
-    ospite_id = Column(Integer, ForeignKey('ospiti.id'), nullable=False)
-    data_check_in = Column(Date, nullable=False, index=True)
+    camera_id = Column(Integer, ForeignKey('camere.id'), nullable=False, index=True)
+    ospite_id = Column(Integer, ForeignKey('ospiti.id'), nullable=False, index=True)
+    data_check_in = Column(Date, nullable=False)
     data_check_out = Column(Date, nullable=False, index=True)
     numero_ospiti = Column(Integer, nullable=False)
     prezzo_totale = Column(Float, nullable=False)
-    stato = Column(Enum(StatoPrenotazione), nullable=False, default=StatoPrenotazione.CONFERMATA, index=True)
+    stato = Column(Enum(StatoPrenotazione), nullable=False, default=StatoPrenotazione.CONFERMATA)
     
     # Relazioni
     camera = relationship("Camera", back_populates="prenotazioni")
@@ -79,3 +112,64 @@ class Prenotazione(Base):
     def __repr__(self):
         return f"<Prenotazione(id={self.id}, camera={self.camera_id}, stato={self.stato.value})>"
 
+
+
+class CameraNotte(Base):
+    """
+    Inventario notti: una riga per ogni notte occupata di ogni camera
+    
+    La chiave (camera_id, notte) è unica, quindi due prenotazioni attive non
+    possono occupare la stessa notte: il database rifiuta il doppio inserimento.
+    """
+    __tablename__ = 'camera_notte'
+    __table_args__ = (
+        PrimaryKeyConstraint('camera_id', 'notte', name='pk_camera_notte'),
+    )
+    
+    camera_id = Column(Integer, ForeignKey('camere.id'), nullable=False)
+    notte = Column(Date, nullable=False)
+    prenotazione_id = Column(Integer, ForeignKey('prenotazioni.id'), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<CameraNotte(camera={self.camera_id}, notte={self.notte})>"
+
+
+class StatisticaGiornaliera(Base):
+    """
+    Statistiche precalcolate di un giorno per tipo di camera
+    
+    Camere vendute e ricavo si riferiscono alla notte del giorno (prezzo
+    ripartito in parti uguali sulle notti del soggiorno); arrivi, partenze e
+    cancellazioni sono contati per data di check-in o check-out. Aggiornate
+    a ogni scrittura delle prenotazioni, vedi backend.statistiche_giornaliere.
+    """
+    __tablename__ = 'statistiche_giornaliere'
+    __table_args__ = (
+        PrimaryKeyConstraint('giorno', 'tipo', name='pk_statistiche_giornaliere'),
+    )
+    
+    giorno = Column(Date, nullable=False)
+    tipo = Column(Enum(TipoCamera), nullable=False)
+    camere_vendute = Column(Integer, nullable=False, default=0)
+    ricavo = Column(Float, nullable=False, default=0)
+    arrivi = Column(Integer, nullable=False, default=0)
+    partenze = Column(Integer, nullable=False, default=0)
+    cancellazioni = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<StatisticaGiornaliera(giorno={self.giorno}, tipo={self.tipo.value})>"
+
+
+class RispostaIdempotente(Base):
+    """Risposta salvata di una richiesta con Idempotency-Key, restituita ai nuovi tentativi"""
+    __tablename__ = 'risposte_idempotenti'
+    
+    chiave = Column(String(100), primary_key=True)
+    operazione = Column(String(200), nullable=False)
+    impronta = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    corpo = Column(Text, nullable=False)
+    creata_il = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<RispostaIdempotente(chiave={self.chiave}, operazione={self.operazione})>"
@@ -0,0 +1,276 @@
+"""
+Instradamento delle sessioni tra database primario e repliche in lettura
+
+Le scritture usano sempre il primario (get_db). Gli endpoint GET usano
+get_db_lettura: una sessione su una replica, a rotazione, se il suo ritardo
+è entro il limite e il client non ha scritto di recente, altrimenti sul
+primario. Senza repliche configurate get_db_lettura equivale a get_db.
+
+Repliche:
+- DATABASE_URL_REPLICHE: URL separati da virgola di repliche mantenute dal
+  database (es. streaming replication PostgreSQL).
+- DATABASE_REPLICA_LOCALE: percorso di una copia del database SQLite
+  primario, per le prove in locale. Ogni REPLICA_INTERVALLO_SECONDI
+  (default 2), se la versione dei dati è cambiata, è riallineata con la
+  backup API di SQLite.
+
+Ritardo limitato: la riga versione_dati è replicata con gli altri dati, e il
+ritardo di una replica è la differenza tra la versione del primario e la
+sua. È misurato al più ogni REPLICHE_CONTROLLO_SECONDI (default 1), non a
+ogni lettura; la replica è usata finché l'ultima misura non supera
+REPLICHE_RITARDO_VERSIONI (default 20) commit. ETag e cache usano la
+versione letta dalla sessione della richiesta (vedi versione_sessione),
+quindi quella della replica: una risposta letta in ritardo ha l'ETag della
+sua versione e non è salvata in cache.
+
+Read-your-writes: le risposte alle richieste che hanno fatto commit con
+scritture impostano il cookie COOKIE_SCRITTURA, e per
+REPLICHE_FINESTRA_SECONDI (default 5) le letture dello stesso client usano
+il primario, anche se la scrittura è avvenuta in un altro processo.
+"""
+import asyncio
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+from fastapi import Cookie, Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from backend.database import (
+    DATABASE_ASYNC,
+    AsyncSessionLocal,
+    SessionLocal,
+    crea_motore,
+    crea_motore_async,
+    engine,
+    versione_dati,
+    versione_dati_async
+)
+
+DATABASE_URL_REPLICHE = [url.strip() for url in os.getenv("DATABASE_URL_REPLICHE", "").split(",") if url.strip()]
+DATABASE_REPLICA_LOCALE = os.getenv("DATABASE_REPLICA_LOCALE")
+REPLICA_INTERVALLO = float(os.getenv("REPLICA_INTERVALLO_SECONDI", "2"))
+REPLICHE_FINESTRA = float(os.getenv("REPLICHE_FINESTRA_SECONDI", "5"))
+REPLICHE_RITARDO_VERSIONI = int(os.getenv("REPLICHE_RITARDO_VERSIONI", "20"))
+REPLICHE_CONTROLLO = float(os.getenv("REPLICHE_CONTROLLO_SECONDI", "1"))
+
+COOKIE_SCRITTURA = "ultima_scrittura"
+
+# Sessioni sulle repliche: nessun listener di scrittura (versione, cache, statistiche)
+SessionReplica = sessionmaker(autocommit=False, autoflush=False)
+
+# Scritture della richiesta HTTP in corso (impostato da segna_scritture)
+_scritture_richiesta: ContextVar[Optional[dict]] = ContextVar("scritture_richiesta", default=None)
+
+
+class Replica:
+    """Engine (e AsyncEngine con DATABASE_ASYNC) di una replica in lettura e misura del suo ritardo"""
+
+    def __init__(self, url: str):
+        self.motore = crea_motore(url)
+        self.motore_async = crea_motore_async(url) if DATABASE_ASYNC else None
+        # Ultima misura del ritardo in versioni (None: replica non leggibile) e suo istante
+        self.ritardo: Optional[int] = None
+        self._misurato = float("-inf")
+        self._lock_misura = threading.Lock()
+
+    def versione(self) -> Optional[int]:
+        """Versione dei dati letta dalla replica (None se non raggiungibile o non ancora copiata)"""
+        try:
+            with self.motore.connect() as connessione:
+                return versione_dati(connessione)
+        except OperationalError:
+            return None
+
+    async def versione_async(self) -> Optional[int]:
+        """Come versione, con l'AsyncEngine della replica (solo con DATABASE_ASYNC)"""
+        try:
+            async with self.motore_async.connect() as connessione:
+                return await versione_dati_async(connessione)
+        except OperationalError:
+            return None
+
+    def _da_misurare(self) -> bool:
+        """True se l'ultima misura è scaduta e nessun altro la sta rinnovando (prende il lock)"""
+        return time.monotonic() - self._misurato >= REPLICHE_CONTROLLO and self._lock_misura.acquire(blocking=False)
+
+    def _registra(self, versione_primario: int, versione: Optional[int]):
+        self.ritardo = None if versione is None else max(0, versione_primario - versione)
+        self._misurato = time.monotonic()
+        self._lock_misura.release()
+
+    def utilizzabile(self) -> bool:
+        """
+        True se il ritardo misurato è entro REPLICHE_RITARDO_VERSIONI
+
+        La misura è rinnovata se scaduta; le letture concorrenti intanto usano
+        quella precedente.
+        """
+        if self._da_misurare():
+            try:
+                self._registra(versione_dati(), self.versione())
+            except Exception:
+                self._lock_misura.release()
+                raise
+        return self.ritardo is not None and self.ritardo <= REPLICHE_RITARDO_VERSIONI
+
+    async def utilizzabile_async(self) -> bool:
+        """Come utilizzabile, con le letture della versione sull'event loop (solo con DATABASE_ASYNC)"""
+        if self._da_misurare():
+            try:
+                self._registra(await versione_dati_async(), await self.versione_async())
+            except BaseException:
+                self._lock_misura.release()
+                raise
+        return self.ritardo is not None and self.ritardo <= REPLICHE_RITARDO_VERSIONI
+
+    def rinnova_misura(self):
+        """Fa misurare di nuovo il ritardo alla prossima lettura"""
+        self._misurato = float("-inf")
+
+
+class ReplicaLocale(Replica):
+    """Copia su file del database SQLite primario"""
+
+    def __init__(self, percorso: str):
+        if engine.dialect.name != "sqlite" or make_url(str(engine.url)).database in (None, "", ":memory:"):
+            raise ValueError("DATABASE_REPLICA_LOCALE richiede un database primario SQLite su file")
+        super().__init__(f"sqlite:///{percorso}")
+        self.percorso = percorso
+        self._lock = threading.Lock()
+
+    def sincronizza(self) -> bool:
+        """
+        Copia il primario sulla replica se la versione dei dati è cambiata
+
+        La copia è un'istantanea coerente del primario, riga versione_dati
+        compresa: i commit avvenuti durante la copia restano nel ritardo
+        fino alla copia successiva.
+
+        Returns:
+            True se la replica è stata copiata
+        """
+        with self._lock:
+            if self.versione() == versione_dati():
+                return False
+            sorgente = engine.raw_connection()
+            try:
+                destinazione = sqlite3.connect(self.percorso, timeout=30)
+                try:
+                    sorgente.driver_connection.backup(destinazione)
+                finally:
+                    destinazione.close()
+            finally:
+                sorgente.close()
+            self.rinnova_misura()
+            return True
+
+
+repliche: List[Replica] = [Replica(url) for url in DATABASE_URL_REPLICHE]
+replica_locale = ReplicaLocale(DATABASE_REPLICA_LOCALE) if DATABASE_REPLICA_LOCALE else None
+if replica_locale is not None:
+    repliche.append(replica_locale)
+
+_rotazione = itertools.count()
+
+
+@event.listens_for(SessionLocal, "after_commit", insert=True)
+def _registra_scrittura(session):
+    # Prima del listener di database.py, che consuma il segnale "scritture"
+    if session.info.get("scritture"):
+        richiesta = _scritture_richiesta.get()
+        if richiesta is not None:
+            richiesta["scritture"] = True
+
+
+def scrittura_recente(cookie: Optional[str]) -> bool:
+    """True se il cookie COOKIE_SCRITTURA indica una scrittura entro REPLICHE_FINESTRA"""
+    try:
+        return time.time() - float(cookie) < REPLICHE_FINESTRA
+    except (TypeError, ValueError):
+        return False
+
+
+def replica_lettura(cookie: Optional[str] = None) -> Optional[Replica]:
+    """
+    Replica da cui leggere, a rotazione tra quelle con ritardo entro il limite
+
+    Args:
+        cookie: Valore del cookie COOKIE_SCRITTURA del client (opzionale)
+
+    Returns:
+        La replica, oppure None per usare il primario
+    """
+    if not repliche or scrittura_recente(cookie):
+        return None
+    inizio = next(_rotazione)
+    for passo in range(len(repliche)):
+        replica = repliche[(inizio + passo) % len(repliche)]
+        if replica.utilizzabile():
+            return replica
+    return None
+
+
+async def replica_lettura_async(cookie: Optional[str] = None) -> Optional[Replica]:
+    """Come replica_lettura, con le misure del ritardo sull'event loop (solo con DATABASE_ASYNC)"""
+    if not repliche or scrittura_recente(cookie):
+        return None
+    inizio = next(_rotazione)
+    for passo in range(len(repliche)):
+        replica = repliche[(inizio + passo) % len(repliche)]
+        if await replica.utilizzabile_async():
+            return replica
+    return None
+
+
+def get_db_lettura(ultima_scrittura: Optional[str] = Cookie(None, alias=COOKIE_SCRITTURA, include_in_schema=False)):
+    """Dependency per ottenere una sessione per le sole letture (replica o primario)"""
+    replica = replica_lettura(ultima_scrittura)
+    db = SessionLocal() if replica is None else SessionReplica(bind=replica.motore)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db_lettura(
+    ultima_scrittura: Optional[str] = Cookie(None, alias=COOKIE_SCRITTURA, include_in_schema=False)
+):
+    """Dependency per ottenere una sessione async per le sole letture (solo con DATABASE_ASYNC)"""
+    replica = await replica_lettura_async(ultima_scrittura)
+    sessione = AsyncSessionLocal() if replica is None else AsyncSessionLocal(bind=replica.motore_async)
+    async with sessione as db:
+        yield db
+
+
+async def segna_scritture(request: Request, call_next):
+    """
+    Middleware: imposta il cookie COOKIE_SCRITTURA se la richiesta ha fatto commit con scritture
+
+    Il cookie vale REPLICHE_FINESTRA secondi e contiene l'istante della scrittura.
+    """
+    stato = {}
+    token = _scritture_richiesta.set(stato)
+    try:
+        response = await call_next(request)
+    finally:
+        _scritture_richiesta.reset(token)
+    if repliche and stato.get("scritture"):
+        response.set_cookie(
+            COOKIE_SCRITTURA, f"{time.time():.3f}",
+            max_age=max(1, int(REPLICHE_FINESTRA)), httponly=True, samesite="lax"
+        )
+    return response
+
+
+async def sincronizzazione_periodica(intervallo: float = REPLICA_INTERVALLO):
+    """Riallinea la replica locale all'avvio e poi a intervalli regolari"""
+    while True:
+        await run_in_threadpool(replica_locale.sincronizza)
+        await asyncio.sleep(intervallo)
@@ -0,0 +1,151 @@
+"""
+Report KPI di ricavo e occupazione per periodo (occupazione, ADR, RevPAR)
+
+I totali giornalieri sono letti dalla tabella statistiche_giornaliere,
+aggiornata a ogni scrittura delle prenotazioni (una riga per giorno e tipo
+di camera, indipendentemente dal numero di prenotazioni), e raggruppati per
+giorno, settimana o mese con pandas.
+"""
+from datetime import date
+from typing import Dict, List, Optional
+import pandas as pd
+from sqlalchemy import Float, String, func, select, type_coerce
+from sqlalchemy.orm import Session
+from backend.models import Camera, StatisticaGiornaliera, TipoCamera
+
+# Granularità -> frequenza dei periodi pandas
+GRANULARITA = {"giorno": "D", "settimana": "W-SUN", "mese": "M"}
+
+
+def _etichetta(inizio: pd.Timestamp, granularita: str) -> str:
+    """Etichetta del periodo: 2025-03-14, 2025-W11 (settimana ISO) o 2025-03"""
+    if granularita == "settimana":
+        anno, settimana, _ = inizio.isocalendar()
+        return f"{anno}-W{settimana:02d}"
+    if granularita == "mese":
+        return inizio.strftime("%Y-%m")
+    return inizio.strftime("%Y-%m-%d")
+
+
+def _indicatori(
+    camere_notte: float,
+    vendute: float,
+    ricavo: float,
+    arrivi: int,
+    partenze: int,
+    cancellazioni: int
+) -> Dict:
+    """Indicatori di un periodo dai totali"""
+    return {
+        "camere_notte_disponibili": int(camere_notte),
+        "notti_vendute": int(vendute),
+        "ricavo": round(float(ricavo), 2),
+        "occupazione": round(float(vendute / camere_notte * 100), 2) if camere_notte else 0.0,
+        "adr": round(float(ricavo / vendute), 2) if vendute else 0.0,
+        "revpar": round(float(ricavo / camere_notte), 2) if camere_notte else 0.0,
+        "arrivi": int(arrivi),
+        "partenze": int(partenze),
+        "cancellazioni": int(cancellazioni)
+    }
+
+
+def serie_giornaliere(
+    db: Session,
+    da: date,
+    a: date,
+    tipo: Optional[TipoCamera] = None
+) -> pd.DataFrame:
+    """
+    Totali giornalieri del periodo [da, a] (estremi inclusi)
+
+    Args:
+        db: Sessione database
+        da: Primo giorno
+        a: Ultimo giorno
+        tipo: Tipo di camera (opzionale)
+
+    Returns:
+        DataFrame indicizzato per giorno con camere, notti_vendute, ricavo,
+        arrivi, partenze e cancellazioni (per data di check-in)
+    """
+    query_camere = select(func.count(Camera.id))
+    query_statistiche = select(
+        type_coerce(StatisticaGiornaliera.giorno, String),
+        func.sum(StatisticaGiornaliera.camere_vendute),
+        type_coerce(func.sum(StatisticaGiornaliera.ricavo), Float),
+        func.sum(StatisticaGiornaliera.arrivi),
+        func.sum(StatisticaGiornaliera.partenze),
+        func.sum(StatisticaGiornaliera.cancellazioni)
+    ).where(
+        StatisticaGiornaliera.giorno >= da,
+        StatisticaGiornaliera.giorno <= a
+    ).group_by(StatisticaGiornaliera.giorno)
+    if tipo is not None:
+        query_camere = query_camere.where(Camera.tipo == tipo)
+        query_statistiche = query_statistiche.where(StatisticaGiornaliera.tipo == tipo)
+
+    connessione = db.connection()
+    numero_camere = connessione.execute(query_camere).scalar_one()
+    righe = connessione.execute(query_statistiche).all()
+
+    # I giorni senza riga non hanno vendite né eventi
+    giornaliere = pd.DataFrame(
+        righe,
+        columns=["giorno", "notti_vendute", "ricavo", "arrivi", "partenze", "cancellazioni"]
+    )
+    giornaliere.index = pd.to_datetime(giornaliere.pop("giorno"))
+    giornaliere = giornaliere.reindex(pd.date_range(da, a, freq="D"), fill_value=0)
+    giornaliere.insert(0, "camere", numero_camere)
+    return giornaliere
+
+
+def kpi_periodo(
+    giornaliere: pd.DataFrame,
+    granularita: str = "giorno"
+) -> Dict[str, object]:
+    """
+    Raggruppa i totali giornalieri e calcola gli indicatori
+
+    Args:
+        giornaliere: DataFrame prodotto da serie_giornaliere
+        granularita: 'giorno', 'settimana' o 'mese'
+
+    Returns:
+        Dizionario con 'periodi' (indicatori per periodo, con inizio e fine)
+        e 'totale' (indicatori dell'intero intervallo)
+    """
+    totali = giornaliere.assign(
+        camere_notte=giornaliere["camere"],
+        giorno=giornaliere.index
+    ).groupby(giornaliere.index.to_period(GRANULARITA[granularita])).agg(
+        camere_notte=("camere_notte", "sum"),
+        notti_vendute=("notti_vendute", "sum"),
+        ricavo=("ricavo", "sum"),
+        arrivi=("arrivi", "sum"),
+        partenze=("partenze", "sum"),
+        cancellazioni=("cancellazioni", "sum"),
+        inizio=("giorno", "min"),
+        fine=("giorno", "max")
+    )
+
+    periodi: List[Dict] = [
+        {
+            "periodo": _etichetta(riga.inizio, granularita),
+            "inizio": riga.inizio.date().isoformat(),
+            "fine": riga.fine.date().isoformat(),
+            **_indicatori(
+                riga.camere_notte, riga.notti_vendute, riga.ricavo,
+                riga.arrivi, riga.partenze, riga.cancellazioni
+            )
+        }
+        for riga in totali.itertuples()
+    ]
+    totale = _indicatori(
+        totali["camere_notte"].sum(),
+        totali["notti_vendute"].sum(),
+        totali["ricavo"].sum(),
+        totali["arrivi"].sum(),
+        totali["partenze"].sum(),
+        totali["cancellazioni"].sum()
+    )
+    return {"periodi": periodi, "totale": totale}
@@ -0,0 +1,241 @@
+"""
+Ricerca ospiti per prefisso di nome, cognome, documento o email
+
+Su SQLite la ricerca usa la tabella virtuale FTS5 ospiti_fts (contenuto
+esterno sulla tabella ospiti, con indici di prefisso): i trigger sulla
+tabella ospiti la mantengono allineata a ogni inserimento, modifica o
+eliminazione. Sugli altri database, o se FTS5 non è disponibile, la ricerca
+confronta i prefissi delle colonne in minuscolo.
+
+L'ordinamento per cognome e nome è limitato: entrambe leggono i primi
+CANDIDATI_PER_RISULTATO × limite ospiti trovati in ordine di ID (rowid per
+FTS5, che li restituisce già così) e ordinano solo quelli. Finché i trovati
+non superano i candidati il risultato è esattamente quello dei primi ospiti
+per cognome e nome, altrimenti sono i primi tra i candidati: il costo non
+dipende dal numero di ospiti che corrispondono a un prefisso breve. Le due
+ricerche leggono gli stessi candidati e restituiscono gli stessi ospiti.
+
+Ricostruzione dell'indice di ricerca dalla tabella ospiti:
+    python -m backend.ricerca_ospiti
+"""
+import re
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import Select, and_, case, func, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from backend.models import Ospite, Prenotazione, StatoPrenotazione
+
+# True quando la tabella ospiti_fts è disponibile (impostato all'avvio)
+ricerca_fts = False
+
+# Ospiti trovati letti e ordinati per cognome e nome, per ogni risultato richiesto
+CANDIDATI_PER_RISULTATO = 10
+
+_DDL_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS ospiti_fts USING fts5(
+        nome, cognome, documento, email,
+        content='ospiti', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ospiti_fts_inserimento AFTER INSERT ON ospiti BEGIN
+        INSERT INTO ospiti_fts(rowid, nome, cognome, documento, email)
+        VALUES (new.id, new.nome, new.cognome, new.documento, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ospiti_fts_eliminazione AFTER DELETE ON ospiti BEGIN
+        INSERT INTO ospiti_fts(ospiti_fts, rowid, nome, cognome, documento, email)
+        VALUES ('delete', old.id, old.nome, old.cognome, old.documento, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ospiti_fts_modifica
+    AFTER UPDATE OF nome, cognome, documento, email ON ospiti BEGIN
+        INSERT INTO ospiti_fts(ospiti_fts, rowid, nome, cognome, documento, email)
+        VALUES ('delete', old.id, old.nome, old.cognome, old.documento, old.email);
+        INSERT INTO ospiti_fts(rowid, nome, cognome, documento, email)
+        VALUES (new.id, new.nome, new.cognome, new.documento, new.email);
+    END
+    """
+]
+
+
+def inizializza_ricerca_ospiti(engine: Engine) -> bool:
+    """
+    Crea tabella FTS5 e trigger se mancanti; alla prima creazione indicizza gli ospiti esistenti
+
+    Args:
+        engine: Engine del database
+
+    Returns:
+        True se la ricerca full-text è attiva
+    """
+    global ricerca_fts
+    if engine.dialect.name != "sqlite":
+        ricerca_fts = False
+        return False
+
+    try:
+        with engine.begin() as connessione:
+            esistente = connessione.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'ospiti_fts'")
+            ).first()
+            for istruzione in _DDL_FTS:
+                connessione.execute(text(istruzione))
+            if not esistente:
+                connessione.execute(text("INSERT INTO ospiti_fts(ospiti_fts) VALUES ('rebuild')"))
+    except OperationalError:
+        # SQLite compilato senza FTS5: resta la ricerca per prefisso
+        ricerca_fts = False
+        return False
+
+    ricerca_fts = True
+    return True
+
+
+def termini_ricerca(q: str) -> List[str]:
+    """Parole del testo cercato, in minuscolo (punteggiatura e spazi separano i termini)"""
+    return re.findall(r"\w+", q.lower())
+
+
+def _prefisso_like(termine: str) -> str:
+    """Pattern LIKE del prefisso, con i caratteri jolly del termine ('_' è un carattere di parola) come testo"""
+    return re.sub(r"([\\%_])", r"\\\1", termine) + "%"
+
+
+def query_ricerca_ospiti(q: str, limite: int = 20) -> Optional[Select]:
+    """
+    Query degli ospiti in cui ogni termine è il prefisso di una parola di
+    nome, cognome, documento o email
+
+    Args:
+        q: Testo cercato (es. "ross mar", "IT1234", "mario.rossi@")
+        limite: Numero massimo di risultati
+
+    Returns:
+        Select di al più 'limite' ospiti per cognome, nome e ID tra i primi
+        candidati trovati (vedi CANDIDATI_PER_RISULTATO), con FTS5 o senza;
+        None se il testo non contiene termini
+    """
+    candidati = limite * CANDIDATI_PER_RISULTATO
+    termini = termini_ricerca(q)
+    if not termini:
+        return None
+
+    if ricerca_fts:
+        # I termini contengono solo caratteri di parola: niente sintassi FTS5 iniettabile
+        espressione = " ".join(f'"{termine}"*' for termine in termini)
+        # FTS5 restituisce i trovati per rowid: la sottoquery si ferma ai
+        # candidati, e solo questi sono ordinati per cognome e nome
+        return select(Ospite).from_statement(text(
+            "SELECT ospiti.* FROM ("
+            "SELECT rowid FROM ospiti_fts WHERE ospiti_fts MATCH :espressione "
+            "ORDER BY rowid LIMIT :candidati"
+            ") AS trovati JOIN ospiti ON ospiti.id = trovati.rowid "
+            "ORDER BY ospiti.cognome, ospiti.nome, ospiti.id LIMIT :limite"
+        ).bindparams(espressione=espressione, candidati=candidati, limite=limite))
+
+    # Percorso lento su SQLite senza FTS5: lower(colonna) LIKE non usa indici
+    # e legge la tabella per ID fino ai candidati (tutta, se i trovati sono
+    # meno). Su PostgreSQL usa gli indici su lower(colonna) della migrazione 0002.
+    colonne = (Ospite.nome, Ospite.cognome, Ospite.documento, Ospite.email)
+    trovati = select(Ospite.id).where(and_(*(
+        or_(*(func.lower(colonna).like(_prefisso_like(termine), escape="\\") for colonna in colonne))
+        for termine in termini
+    ))).order_by(Ospite.id).limit(candidati).subquery()
+    return (
+        select(Ospite).join(trovati, Ospite.id == trovati.c.id)
+        .order_by(Ospite.cognome, Ospite.nome, Ospite.id).limit(limite)
+    )
+
+
+def cerca_ospiti(db: Session, q: str, limite: int = 20) -> List[Ospite]:
+    """
+    Cerca gli ospiti con query_ricerca_ospiti
+
+    Args:
+        db: Sessione database
+        q: Testo cercato
+        limite: Numero massimo di risultati
+
+    Returns:
+        I primi 'limite' ospiti trovati per cognome, nome e ID
+    """
+    query = query_ricerca_ospiti(q, limite)
+    return db.scalars(query).all() if query is not None else []
+
+
+def query_riepilogo_soggiorni(ospite_ids: List[int]) -> Select:
+    """
+    Query del numero di prenotazioni e dell'ultimo soggiorno di più ospiti
+
+    L'ultimo soggiorno è la prenotazione non cancellata con il check-in più
+    recente non successivo a oggi. Una riga per ospite con prenotazioni.
+    """
+    oggi = date.today()
+    soggiornato = and_(
+        Prenotazione.stato != StatoPrenotazione.CANCELLATA,
+        Prenotazione.data_check_in <= oggi
+    )
+    numerate = select(
+        Prenotazione.ospite_id,
+        Prenotazione.camera_id,
+        Prenotazione.data_check_in,
+        Prenotazione.data_check_out,
+        soggiornato.label("soggiornato"),
+        func.count().over(partition_by=Prenotazione.ospite_id).label("numero"),
+        func.row_number().over(
+            partition_by=Prenotazione.ospite_id,
+            order_by=(case((soggiornato, 0), else_=1), Prenotazione.data_check_in.desc())
+        ).label("posizione")
+    ).where(Prenotazione.ospite_id.in_(ospite_ids)).subquery()
+
+    return select(numerate).where(numerate.c.posizione == 1)
+
+
+def riepilogo_da_righe(righe) -> Dict[int, Dict]:
+    """Riepilogo per ospite dalle righe di query_riepilogo_soggiorni"""
+    return {
+        riga.ospite_id: {
+            "numero_prenotazioni": riga.numero,
+            "ultimo_soggiorno": {
+                "camera_id": riga.camera_id,
+                "data_check_in": riga.data_check_in,
+                "data_check_out": riga.data_check_out
+            } if riga.soggiornato else None
+        }
+        for riga in righe
+    }
+
+
+def riepilogo_soggiorni(db: Session, ospite_ids: List[int]) -> Dict[int, Dict]:
+    """
+    Numero di prenotazioni e ultimo soggiorno di più ospiti con una sola query
+
+    Args:
+        db: Sessione database
+        ospite_ids: ID degli ospiti
+
+    Returns:
+        Per ogni ospite con prenotazioni: {'numero_prenotazioni', 'ultimo_soggiorno'}
+    """
+    if not ospite_ids:
+        return {}
+    return riepilogo_da_righe(db.execute(query_riepilogo_soggiorni(ospite_ids)).all())
+
+
+if __name__ == "__main__":
+    from backend.database import engine, init_database
+
+    init_database()
+    if not inizializza_ricerca_ospiti(engine):
+        print("⚠️  Ricerca full-text non disponibile su questo database")
+    else:
+        with engine.begin() as connessione:
+            connessione.execute(text("INSERT INTO ospiti_fts(ospiti_fts) VALUES ('rebuild')"))
+        print("✅ Indice di ricerca ospiti ricostruito")
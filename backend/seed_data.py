@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, date
 import random
 from backend.database import SessionLocal
 from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione
+from backend.inventario import ricostruisci_inventario
 
 
 def seed_database():
@@ -132,8 +133,12 @@ def seed_database():
             ))
         
         session.add_all(prenotazioni)
+        session.flush()
+        conflitti = ricostruisci_inventario(session)
         session.commit()
         print(f"✅ Aggiunte {len(prenotazioni)} prenotazioni")
+        if conflitti:
+            print(f"⚠️  {len(conflitti)} prenotazioni sovrapposte escluse dall'inventario notti")
         print("🎉 Database popolato con successo!")
         
     except Exception as e:
@@ -0,0 +1,164 @@
+"""
+Statistiche della dashboard calcolate con una sola query aggregata
+
+Il risultato è conservato in una piccola cache in memoria: una voce resta
+valida per STATISTICHE_TTL_SECONDI secondi (default 30) e finché nessun
+commit con scritture, di questo o di altri processi, cambia la versione dei
+dati nel database.
+"""
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+from sqlalchemy import Select, and_, case, distinct, func, select
+from sqlalchemy.orm import Session
+from backend.database import versione_sessione, versione_sessione_async
+from backend.models import Camera, Prenotazione, StatoPrenotazione
+from backend.utils import filtro_stati_attivi
+
+STATISTICHE_TTL = float(os.getenv("STATISTICHE_TTL_SECONDI", "30"))
+
+# giorno -> (versione dei dati, scadenza, statistiche)
+_cache: Dict[date, Tuple[int, float, Dict]] = {}
+_lock_cache = threading.Lock()
+
+
+def query_statistiche(giorno: date) -> Select:
+    """
+    Query GROUP BY delle statistiche di occupazione di un giorno
+
+    Le camere sono unite alle prenotazioni attive non ancora concluse; le
+    espressioni CASE separano i soggiorni in corso (check-in effettuato)
+    dagli arrivi futuri. Una riga per tipo di camera.
+
+    Args:
+        giorno: Giorno di riferimento
+
+    Returns:
+        Select con tipo, totale camere, camere occupate, prenotazioni future e ricavo
+    """
+    in_corso = and_(
+        Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO,
+        Prenotazione.data_check_in <= giorno
+    )
+    futura = and_(
+        Prenotazione.stato == StatoPrenotazione.CONFERMATA,
+        Prenotazione.data_check_in > giorno
+    )
+    return select(
+        Camera.tipo,
+        func.count(distinct(Camera.id)),
+        func.count(distinct(case((in_corso, Camera.id)))),
+        func.count(case((futura, Prenotazione.id))),
+        func.coalesce(func.sum(case((in_corso, Camera.prezzo_per_notte), else_=0)), 0)
+    ).outerjoin(Prenotazione, and_(
+        Prenotazione.camera_id == Camera.id,
+        filtro_stati_attivi(),
+        Prenotazione.data_check_out > giorno
+    )).group_by(Camera.tipo)
+
+
+def statistiche_da_righe(giorno: date, righe) -> Dict:
+    """
+    Statistiche di un giorno dalle righe di query_statistiche
+
+    Returns:
+        Dizionario con totale_camere, camere_occupate, camere_libere,
+        tasso_occupazione (percentuale), prenotazioni_future, ricavo_oggi
+        (prezzo per notte delle camere occupate) e il dettaglio per_tipo
+    """
+    per_tipo = {
+        tipo.value: {
+            "totale_camere": totale,
+            "camere_occupate": occupate,
+            "prenotazioni_future": future,
+            "ricavo_oggi": round(float(ricavo), 2)
+        }
+        for tipo, totale, occupate, future, ricavo in righe
+    }
+    totale_camere = sum(t["totale_camere"] for t in per_tipo.values())
+    camere_occupate = sum(t["camere_occupate"] for t in per_tipo.values())
+
+    return {
+        "data": str(giorno),
+        "totale_camere": totale_camere,
+        "camere_occupate": camere_occupate,
+        "camere_libere": totale_camere - camere_occupate,
+        "tasso_occupazione": round(camere_occupate / totale_camere * 100, 2) if totale_camere else 0.0,
+        "prenotazioni_future": sum(t["prenotazioni_future"] for t in per_tipo.values()),
+        "ricavo_oggi": round(sum(t["ricavo_oggi"] for t in per_tipo.values()), 2),
+        "per_tipo": per_tipo
+    }
+
+
+def calcola_statistiche(db: Session, giorno: date) -> Dict:
+    """
+    Calcola le statistiche di occupazione di un giorno con una query GROUP BY
+
+    Args:
+        db: Sessione database
+        giorno: Giorno di riferimento
+
+    Returns:
+        Dizionario delle statistiche, vedi statistiche_da_righe
+    """
+    return statistiche_da_righe(giorno, db.execute(query_statistiche(giorno)).all())
+
+
+def _voce_valida(giorno: date, versione: int) -> Optional[Dict]:
+    """Statistiche in cache del giorno, se non scadute e calcolate sulla versione indicata"""
+    with _lock_cache:
+        voce = _cache.get(giorno)
+    if voce is not None and voce[0] == versione and time.monotonic() < voce[1]:
+        return voce[2]
+    return None
+
+
+def _salva_voce(giorno: date, versione: int, statistiche: Dict):
+    with _lock_cache:
+        voce = _cache.get(giorno)
+        # Calcolate su una versione precedente (replica in ritardo): non sostituiscono la voce
+        if voce is not None and voce[0] > versione:
+            return
+        # Solo il giorno corrente: le voci dei giorni passati non servono più
+        _cache.clear()
+        _cache[giorno] = (versione, time.monotonic() + STATISTICHE_TTL, statistiche)
+
+
+def statistiche_dashboard(db: Session, giorno: Optional[date] = None) -> Dict:
+    """
+    Statistiche del giorno dalla cache, ricalcolate se scadute o superate
+
+    La versione dei dati è quella letta dalla sessione prima del calcolo
+    (vedi versione_sessione): se un commit avviene durante il calcolo, la
+    voce salvata risulta già superata alla lettura successiva.
+
+    Args:
+        db: Sessione database
+        giorno: Giorno di riferimento (default oggi)
+
+    Returns:
+        Dizionario delle statistiche, vedi statistiche_da_righe
+    """
+    giorno = giorno or date.today()
+    versione = versione_sessione(db)[1]
+    statistiche = _voce_valida(giorno, versione)
+    if statistiche is None:
+        statistiche = calcola_statistiche(db, giorno)
+        _salva_voce(giorno, versione, statistiche)
+    return statistiche
+
+
+async def statistiche_dashboard_async(db, giorno: Optional[date] = None) -> Dict:
+    """
+    Come statistiche_dashboard, con una sessione async (solo con DATABASE_ASYNC)
+    """
+    giorno = giorno or date.today()
+    versione = (await versione_sessione_async(db))[1]
+    statistiche = _voce_valida(giorno, versione)
+    if statistiche is None:
+        righe = (await db.execute(query_statistiche(giorno))).all()
+        statistiche = statistiche_da_righe(giorno, righe)
+        _salva_voce(giorno, versione, statistiche)
+    return statistiche
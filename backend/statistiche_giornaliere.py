@@ -0,0 +1,299 @@
+"""
+Statistiche giornaliere precalcolate (tabella statistiche_giornaliere)
+
+Una riga per giorno e tipo di camera con camere vendute, ricavo, arrivi,
+partenze e cancellazioni. Le righe sono aggiornate nella stessa transazione
+delle prenotazioni: dopo ogni flush il contributo precedente di ogni
+prenotazione modificata è sottratto e quello nuovo aggiunto, con un solo
+INSERT ... ON CONFLICT per flush. Il contributo precedente delle
+prenotazioni scadute o non caricate è letto dal database prima del flush.
+
+Gli UPDATE diretti sulle prenotazioni (istruzioni bulk) non passano dal
+flush: i cambi di stato multipli tra confermata, check-in e check-out non
+modificano le statistiche, per le altre modifiche serve la ricostruzione.
+
+Ricostruzione di un periodo dalla tabella prenotazioni:
+    python -m backend.statistiche_giornaliere --da 2025-01-01 --a 2025-12-31
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import Float, String, case, delete, event, exists, func, insert, inspect, select, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from backend.database import SessionLocal
+from backend.inventario import notti_soggiorno
+from backend.models import Camera, Prenotazione, StatisticaGiornaliera, StatoPrenotazione, TipoCamera, STATI_VENDUTI
+
+CAMPI = ("camere_vendute", "ricavo", "arrivi", "partenze", "cancellazioni")
+_TIPI = list(TipoCamera)
+# Attributi della prenotazione da cui dipende il suo contributo
+ATTRIBUTI = ("camera_id", "data_check_in", "data_check_out", "stato", "prezzo_totale")
+
+# (giorno, tipo) -> variazione di ciascun campo di CAMPI
+Variazioni = Dict[Tuple[date, TipoCamera], List[float]]
+
+
+def _aggiungi_contributo(
+    variazioni: Variazioni,
+    segno: int,
+    tipo: TipoCamera,
+    data_check_in: date,
+    data_check_out: date,
+    stato: StatoPrenotazione,
+    prezzo_totale: float
+):
+    """Somma (segno +1) o sottrae (segno -1) il contributo di una prenotazione"""
+    if stato == StatoPrenotazione.CANCELLATA:
+        variazioni[(data_check_in, tipo)][4] += segno
+        return
+    if stato not in STATI_VENDUTI:
+        return
+
+    notti = notti_soggiorno(data_check_in, data_check_out)
+    for notte in notti:
+        riga = variazioni[(notte, tipo)]
+        riga[0] += segno
+        riga[1] += segno * prezzo_totale / len(notti)
+    variazioni[(data_check_in, tipo)][2] += segno
+    variazioni[(data_check_out, tipo)][3] += segno
+
+
+def _valori(prenotazione: Prenotazione, salvati: Dict[int, tuple], precedenti: bool) -> tuple:
+    """Camera, date, stato e prezzo della prenotazione, prima o dopo le modifiche non salvate"""
+    if precedenti and prenotazione.id in salvati:
+        return salvati[prenotazione.id]
+    stato = inspect(prenotazione)
+    valori = []
+    for attributo in ATTRIBUTI:
+        storia = stato.attrs[attributo].history
+        if precedenti and storia.deleted:
+            valori.append(storia.deleted[0])
+        else:
+            valori.append(getattr(prenotazione, attributo))
+    return tuple(valori)
+
+
+def applica_variazioni(connessione, variazioni: Variazioni):
+    """
+    Somma le variazioni alle righe esistenti con un solo INSERT ... ON CONFLICT
+
+    Args:
+        connessione: Connessione della transazione in corso
+        variazioni: Variazioni per (giorno, tipo)
+    """
+    righe = [
+        {"giorno": giorno, "tipo": tipo, **dict(zip(CAMPI, valori))}
+        for (giorno, tipo), valori in variazioni.items()
+        if any(valori)
+    ]
+    if not righe:
+        return
+
+    dialetto = postgresql if connessione.dialect.name == "postgresql" else sqlite
+    inserimento = dialetto.insert(StatisticaGiornaliera)
+    connessione.execute(
+        inserimento.on_conflict_do_update(
+            index_elements=[StatisticaGiornaliera.giorno, StatisticaGiornaliera.tipo],
+            set_={
+                campo: getattr(StatisticaGiornaliera, campo) + inserimento.excluded[campo]
+                for campo in CAMPI
+            }
+        ),
+        righe
+    )
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _leggi_valori_salvati(session, flush_context, instances):
+    """
+    Legge dal database i valori salvati delle prenotazioni modificate o
+    eliminate il cui valore precedente non è in memoria
+
+    Succede per le prenotazioni scadute dopo un commit o mai caricate del
+    tutto: un'assegnazione su un attributo non caricato non conserva il
+    valore sostituito. Dopo il flush il database contiene già i valori nuovi,
+    quindi quelli salvati sono letti prima, con una sola query.
+    """
+    ids = []
+    for prenotazione in (*session.dirty, *session.deleted):
+        if not isinstance(prenotazione, Prenotazione):
+            continue
+        stato = inspect(prenotazione)
+        if stato.key is None:
+            continue
+        for attributo in ATTRIBUTI:
+            storia = stato.attrs[attributo].history
+            if attributo in stato.unloaded or (storia.added and not storia.deleted):
+                ids.append(prenotazione.id)
+                break
+    if ids:
+        righe = session.connection().execute(
+            select(Prenotazione.id, *(getattr(Prenotazione, attributo) for attributo in ATTRIBUTI))
+            .where(Prenotazione.id.in_(ids))
+        ).all()
+        session.info["prenotazioni_salvate"] = {riga[0]: tuple(riga[1:]) for riga in righe}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _aggiorna_statistiche(session, flush_context):
+    salvati = session.info.pop("prenotazioni_salvate", {})
+    modifiche = []
+    for prenotazione in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(prenotazione, Prenotazione):
+            continue
+        if prenotazione in session.new:
+            modifiche.append((None, _valori(prenotazione, salvati, precedenti=False)))
+        elif prenotazione in session.deleted:
+            modifiche.append((_valori(prenotazione, salvati, precedenti=True), None))
+        elif session.is_modified(prenotazione, include_collections=False):
+            modifiche.append((_valori(prenotazione, salvati, precedenti=True), _valori(prenotazione, salvati, precedenti=False)))
+    if not modifiche:
+        return
+
+    connessione = session.connection()
+    camera_ids = {valori[0] for modifica in modifiche for valori in modifica if valori}
+    tipi = dict(connessione.execute(select(Camera.id, Camera.tipo).where(Camera.id.in_(camera_ids))).all())
+
+    variazioni: Variazioni = defaultdict(lambda: [0] * len(CAMPI))
+    for precedenti, nuovi in modifiche:
+        if precedenti:
+            _aggiungi_contributo(variazioni, -1, tipi[precedenti[0]], *precedenti[1:])
+        if nuovi:
+            _aggiungi_contributo(variazioni, 1, tipi[nuovi[0]], *nuovi[1:])
+    applica_variazioni(connessione, variazioni)
+
+
+def ricostruisci_statistiche(db: Session, da: Optional[date] = None, a: Optional[date] = None) -> int:
+    """
+    Ricalcola le statistiche del periodo [da, a] dalla tabella prenotazioni
+
+    Le prenotazioni con le stesse date, stato venduto o cancellato e tipo di
+    camera sono aggregate da una sola query; ogni gruppo è poi ripartito
+    sulle sue notti con un array alle differenze NumPy per tipo. Non esegue
+    il commit.
+
+    Args:
+        db: Sessione database
+        da: Primo giorno (default il primo check-in)
+        a: Ultimo giorno incluso (default l'ultimo check-out)
+
+    Returns:
+        Numero di righe scritte
+    """
+    if da is None or a is None:
+        primo, ultimo = db.execute(
+            select(func.min(Prenotazione.data_check_in), func.max(Prenotazione.data_check_out))
+        ).one()
+        if primo is None:
+            return 0
+        da, a = da or primo, a or ultimo
+
+    giorni = (a - da).days + 1
+    cancellata = case((Prenotazione.stato == StatoPrenotazione.CANCELLATA, 1), else_=0)
+    # Anche le partenze del primo giorno: soggiorni terminati il giorno 'da'
+    righe = db.execute(
+        select(
+            type_coerce(Camera.tipo, String),
+            type_coerce(Prenotazione.data_check_in, String),
+            type_coerce(Prenotazione.data_check_out, String),
+            cancellata,
+            func.count(),
+            type_coerce(func.sum(Prenotazione.prezzo_totale), Float)
+        ).join(Camera, Camera.id == Prenotazione.camera_id).where(
+            Prenotazione.stato.in_(STATI_VENDUTI + (StatoPrenotazione.CANCELLATA,)),
+            Prenotazione.data_check_in <= a,
+            Prenotazione.data_check_out >= da
+        ).group_by(Camera.tipo, Prenotazione.data_check_in, Prenotazione.data_check_out, cancellata)
+    ).all()
+
+    # Una riga per tipo, un elemento in più per le differenze oltre l'ultimo giorno
+    vendute = np.zeros((len(_TIPI), giorni + 1))
+    ricavo = np.zeros((len(_TIPI), giorni + 1))
+    arrivi = np.zeros((len(_TIPI), giorni + 1), dtype=np.int64)
+    partenze = np.zeros((len(_TIPI), giorni + 1), dtype=np.int64)
+    cancellazioni = np.zeros((len(_TIPI), giorni + 1), dtype=np.int64)
+
+    if righe:
+        tipi, check_in, check_out, cancellate, numeri, prezzi = zip(*righe)
+        # Gli enum sono salvati per nome
+        indice_tipo = {t.name: i for i, t in enumerate(_TIPI)}
+        tipo = np.fromiter((indice_tipo[t] for t in tipi), dtype=np.int64, count=len(tipi))
+        origine = np.datetime64(da, "D")
+        arrivo = (np.asarray(check_in, dtype="datetime64[D]") - origine).astype(np.int64)
+        partenza = (np.asarray(check_out, dtype="datetime64[D]") - origine).astype(np.int64)
+        cancellata = np.asarray(cancellate, dtype=bool)
+        numeri = np.asarray(numeri, dtype=np.int64)
+        prezzi = np.asarray(prezzi, dtype=np.float64)
+
+        venduta = ~cancellata & (partenza > arrivo)
+        per_notte = prezzi[venduta] / (partenza[venduta] - arrivo[venduta])
+        inizio = np.clip(arrivo[venduta], 0, giorni)
+        termine = np.clip(partenza[venduta], 0, giorni)
+        np.add.at(vendute, (tipo[venduta], inizio), numeri[venduta])
+        np.add.at(vendute, (tipo[venduta], termine), -numeri[venduta])
+        np.add.at(ricavo, (tipo[venduta], inizio), per_notte)
+        np.add.at(ricavo, (tipo[venduta], termine), -per_notte)
+
+        # Eventi di un giorno: fuori dal periodo finiscono nell'elemento in più
+        fuori = giorni
+        np.add.at(arrivi, (tipo[venduta], np.where(arrivo[venduta] >= 0, arrivo[venduta], fuori)), numeri[venduta])
+        np.add.at(partenze, (tipo[venduta], np.where(partenza[venduta] < giorni, partenza[venduta], fuori)), numeri[venduta])
+        np.add.at(
+            cancellazioni,
+            (tipo[cancellata], np.where(arrivo[cancellata] >= 0, arrivo[cancellata], fuori)),
+            numeri[cancellata]
+        )
+
+    colonne = {
+        "camere_vendute": np.cumsum(vendute, axis=1)[:, :-1].round().astype(np.int64),
+        "ricavo": np.cumsum(ricavo, axis=1)[:, :-1].round(2),
+        "arrivi": arrivi[:, :-1],
+        "partenze": partenze[:, :-1],
+        "cancellazioni": cancellazioni[:, :-1]
+    }
+    # Solo i giorni con almeno un valore: le righe mancanti valgono zero
+    indici_tipo, indici_giorno = np.nonzero(np.any([c != 0 for c in colonne.values()], axis=0))
+    nuove = [
+        {
+            "giorno": da + timedelta(days=int(g)),
+            "tipo": _TIPI[t],
+            **{campo: valori[t, g].item() for campo, valori in colonne.items()}
+        }
+        for t, g in zip(indici_tipo, indici_giorno)
+    ]
+
+    db.execute(delete(StatisticaGiornaliera).where(
+        StatisticaGiornaliera.giorno >= da,
+        StatisticaGiornaliera.giorno <= a
+    ))
+    if nuove:
+        db.execute(insert(StatisticaGiornaliera), nuove)
+    return len(nuove)
+
+
+def statistiche_da_inizializzare(db: Session) -> bool:
+    """True se statistiche_giornaliere è vuota ma esistono prenotazioni"""
+    if db.scalar(select(exists().select_from(StatisticaGiornaliera))):
+        return False
+    return bool(db.scalar(select(exists().select_from(Prenotazione))))
+
+
+if __name__ == "__main__":
+    import argparse
+    from backend.database import init_database
+
+    parser = argparse.ArgumentParser(description="Ricostruzione delle statistiche giornaliere")
+    parser.add_argument("--da", type=date.fromisoformat, help="Primo giorno (AAAA-MM-GG, default il primo check-in)")
+    parser.add_argument("--a", type=date.fromisoformat, help="Ultimo giorno (AAAA-MM-GG, default l'ultimo check-out)")
+    argomenti = parser.parse_args()
+
+    init_database()
+    session = SessionLocal()
+    try:
+        righe = ricostruisci_statistiche(session, argomenti.da, argomenti.a)
+        session.commit()
+        print(f"✅ Statistiche giornaliere ricostruite ({righe} righe)")
+    finally:
+        session.close()
@@ -1,11 +1,16 @@
 """
 Funzioni di utilità
 """
+import base64
+import json
 from datetime import date
 from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from backend.models import Prenotazione, StatoPrenotazione
+from sqlalchemy import and_, bindparam, exists, func, select, text, Select
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione, STATI_ATTIVI
+from backend.indice_disponibilita import indice
+from backend.inventario import notti_libere
 
 
 def calcola_prezzo_totale(prezzo_per_notte: float, data_check_in: date, data_check_out: date) -> float:
@@ -24,6 +29,154 @@ def calcola_prezzo_totale(prezzo_per_notte: float, data_check_in: date, data_che
     return round(prezzo_per_notte * giorni, 2)
 
 
+def filtro_sovrapposizione(data_check_in: date, data_check_out: date):
+    """
+    Predicato di sovrapposizione tra una prenotazione e il periodo richiesto
+    
+    Gli intervalli sono semiaperti [check-in, check-out): due soggiorni si
+    sovrappongono se ciascuno inizia prima che l'altro finisca, quindi una
+    partenza e un arrivo nello stesso giorno non sono in conflitto.
+    
+    Args:
+        data_check_in: Data di check-in desiderata
+        data_check_out: Data di check-out desiderata
+        
+    Returns:
+        Espressione SQLAlchemy utilizzabile in un filtro
+    """
+    return and_(
+        Prenotazione.data_check_in < data_check_out,
+        Prenotazione.data_check_out > data_check_in
+    )
+
+
+def filtro_stati_attivi():
+    """
+    Predicato sugli stati attivi con i valori scritti nel testo della query
+    
+    SQLite usa gli indici parziali sulle prenotazioni attive (migrazione
+    0001) solo se la query contiene la stessa condizione dell'indice, con gli
+    stessi valori letterali nello stesso ordine: con i parametri il
+    pianificatore non può verificarla.
+    
+    Returns:
+        Espressione SQLAlchemy utilizzabile in un filtro
+    """
+    return Prenotazione.stato.in_(
+        bindparam("stati_attivi", list(STATI_ATTIVI), type_=Prenotazione.stato.type, expanding=True, literal_execute=True)
+    )
+
+
+def query_camere_disponibili(
+    data_check_in: date,
+    data_check_out: date,
+    tipo: Optional[TipoCamera] = None
+) -> Select:
+    """
+    Costruisce la query delle camere libere nel periodo richiesto
+    
+    Una sola query con NOT EXISTS: restituisce le camere per cui non esiste
+    alcuna prenotazione attiva sovrapposta al periodo.
+    
+    Args:
+        data_check_in: Data di check-in desiderata
+        data_check_out: Data di check-out desiderata
+        tipo: Tipo di camera (opzionale)
+        
+    Returns:
+        Select sulle camere disponibili, ordinate per numero
+    """
+    occupata = exists().where(
+        Prenotazione.camera_id == Camera.id,
+        filtro_stati_attivi(),
+        filtro_sovrapposizione(data_check_in, data_check_out)
+    )
+    query = select(Camera).where(~occupata)
+    if tipo is not None:
+        query = query.where(Camera.tipo == tipo)
+    return query.order_by(Camera.numero)
+
+
+def query_stato_occupazione(
+    giorno: date,
+    piano: Optional[int] = None,
+    tipo: Optional[TipoCamera] = None
+) -> Select:
+    """
+    Costruisce la query dello stato di occupazione delle camere in un giorno
+    
+    Una sola query: ogni camera in LEFT JOIN con la prenotazione in corso
+    (check-in effettuato) e il suo ospite; le camere libere hanno le colonne
+    dell'ospite a NULL. La condizione sugli stati attivi, già implicata dal
+    check-in effettuato, permette di usare l'indice parziale per camera.
+    
+    Args:
+        giorno: Giorno di riferimento
+        piano: Piano delle camere (opzionale)
+        tipo: Tipo di camera (opzionale)
+        
+    Returns:
+        Select con le colonne della camera, nome e cognome dell'ospite e
+        data di check-out, ordinate per id camera
+    """
+    query = select(
+        Camera.id,
+        Camera.numero,
+        Camera.tipo,
+        Camera.piano,
+        Camera.prezzo_per_notte,
+        Camera.servizi_inclusi,
+        Ospite.nome,
+        Ospite.cognome,
+        Prenotazione.data_check_out
+    ).outerjoin(Prenotazione, and_(
+        Prenotazione.camera_id == Camera.id,
+        filtro_stati_attivi(),
+        Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO,
+        Prenotazione.data_check_in <= giorno,
+        Prenotazione.data_check_out > giorno
+    )).outerjoin(Ospite, Ospite.id == Prenotazione.ospite_id)
+    if piano is not None:
+        query = query.where(Camera.piano == piano)
+    if tipo is not None:
+        query = query.where(Camera.tipo == tipo)
+    return query.order_by(Camera.id)
+
+
+def cerca_camere_libere(
+    db: Session,
+    data_check_in: date,
+    data_check_out: date,
+    tipo: Optional[TipoCamera] = None
+) -> list[Camera]:
+    """
+    Restituisce le camere libere nel periodo richiesto
+    
+    Con l'indice in memoria attivo carica solo le camere e filtra senza SQL,
+    altrimenti esegue la query NOT EXISTS.
+    
+    Args:
+        db: Sessione database
+        data_check_in: Data di check-in desiderata
+        data_check_out: Data di check-out desiderata
+        tipo: Tipo di camera (opzionale)
+        
+    Returns:
+        Lista delle camere disponibili, ordinate per numero
+    """
+    if not indice.attivo:
+        return db.scalars(query_camere_disponibili(data_check_in, data_check_out, tipo)).all()
+    
+    indice.allinea(db)
+    query = select(Camera).order_by(Camera.numero)
+    if tipo is not None:
+        query = query.where(Camera.tipo == tipo)
+    return [
+        camera for camera in db.scalars(query)
+        if indice.disponibile(camera.id, data_check_in, data_check_out)
+    ]
+
+
 def verifica_disponibilita_camera(
     db: Session,
     camera_id: int,
@@ -44,35 +197,113 @@ def verifica_disponibilita_camera(
     Returns:
         True se disponibile, False altrimenti
     """
-    query = db.query(Prenotazione).filter(
-        Prenotazione.camera_id == camera_id,
-        Prenotazione.stato.in_([
-            StatoPrenotazione.CONFERMATA,
-            StatoPrenotazione.CHECK_IN_EFFETTUATO
-        ]),
-        or_(
-            # Caso 1: check-in richiesto durante prenotazione esistente
-            and_(
-                Prenotazione.data_check_in <= data_check_in,
-                Prenotazione.data_check_out > data_check_in
-            ),
-            # Caso 2: check-out richiesto durante prenotazione esistente
-            and_(
-                Prenotazione.data_check_in < data_check_out,
-                Prenotazione.data_check_out >= data_check_out
-            ),
-            # Caso 3: prenotazione richiesta contiene prenotazione esistente
-            and_(
-                Prenotazione.data_check_in >= data_check_in,
-                Prenotazione.data_check_out <= data_check_out
-            )
+    if indice.attivo:
+        indice.allinea(db)
+        return indice.disponibile(camera_id, data_check_in, data_check_out, escludi_prenotazione_id)
+    
+    # Ricerca indicizzata sulle notti del soggiorno in camera_notte
+    return notti_libere(db, camera_id, data_check_in, data_check_out, escludi_prenotazione_id)
+
+
+def blocca_camere(db: Session, camera_ids: list[int]):
+    """
+    Apre la transazione di scrittura bloccando le camere coinvolte
+    
+    Va chiamata prima di verificare la disponibilità, così verifica e
+    inserimento avvengono sotto lo stesso lock. Su SQLite BEGIN IMMEDIATE
+    prende subito il lock di scrittura del database (con le transazioni
+    differite due scrittori possono verificare insieme e poi confliggere);
+    sugli altri database blocca le righe delle camere con SELECT ... FOR UPDATE,
+    in ordine di ID per evitare deadlock.
+    
+    Args:
+        db: Sessione database, senza scritture ancora eseguite
+        camera_ids: ID delle camere da bloccare
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("BEGIN IMMEDIATE"))
+    else:
+        db.execute(
+            select(Camera.id)
+            .where(Camera.id.in_(camera_ids))
+            .order_by(Camera.id)
+            .with_for_update()
         )
-    )
+
+
+def upsert_ospiti(db: Session, ospiti: list[dict]) -> dict[str, Ospite]:
+    """
+    Inserisce o aggiorna gli ospiti con un solo INSERT ... ON CONFLICT ... RETURNING
+    
+    La chiave è il documento: gli ospiti nuovi vengono inseriti, quelli già
+    presenti aggiornano i recapiti forniti (email e telefono) senza perdere
+    quelli non indicati. Una sola istruzione, senza SELECT preventiva e senza
+    errori di unicità con richieste concorrenti per lo stesso ospite.
     
-    if escludi_prenotazione_id:
-        query = query.filter(Prenotazione.id != escludi_prenotazione_id)
+    Args:
+        db: Sessione database
+        ospiti: Dati degli ospiti, un dizionario per ospite
+        
+    Returns:
+        Dizionario documento -> Ospite
+    """
+    if not ospiti:
+        return {}
+    
+    dialetto = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    # Un documento ripetuto nella stessa istruzione non è ammesso: vale la prima occorrenza
+    per_documento = {ospite["documento"]: ospite for ospite in reversed(ospiti)}
+    
+    inserimento = dialetto.insert(Ospite).values(list(per_documento.values()))
+    inserimento = inserimento.on_conflict_do_update(
+        index_elements=[Ospite.documento],
+        set_={
+            "email": func.coalesce(inserimento.excluded.email, Ospite.email),
+            "telefono": func.coalesce(inserimento.excluded.telefono, Ospite.telefono)
+        }
+    ).returning(Ospite)
+    
+    return {
+        ospite.documento: ospite
+        for ospite in db.scalars(inserimento, execution_options={"populate_existing": True})
+    }
+
+
+def codifica_cursore(*valori) -> str:
+    """
+    Codifica la chiave dell'ultimo elemento di una pagina come cursore opaco
+    
+    Args:
+        valori: Valori della chiave di ordinamento (date come ISO)
+        
+    Returns:
+        Cursore base64 URL-safe
+    """
+    testo = json.dumps([str(v) if isinstance(v, date) else v for v in valori], separators=(",", ":"))
+    return base64.urlsafe_b64encode(testo.encode("utf-8")).decode("ascii")
+
+
+def decodifica_cursore(cursore: str, numero_valori: int) -> list:
+    """
+    Decodifica un cursore prodotto da codifica_cursore
     
-    return query.count() == 0
+    Args:
+        cursore: Cursore ricevuto dal client
+        numero_valori: Numero di valori attesi nella chiave
+        
+    Returns:
+        Lista dei valori della chiave
+        
+    Raises:
+        ValueError: Se il cursore non è valido
+    """
+    try:
+        valori = json.loads(base64.urlsafe_b64decode(cursore.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Cursore non valido: {cursore}")
+    if not isinstance(valori, list) or len(valori) != numero_valori:
+        raise ValueError(f"Cursore non valido: {cursore}")
+    return valori
 
 
 def valida_date_prenotazione(data_check_in: date, data_check_out: date) -> tuple[bool, Optional[str]]:
@@ -2,9 +2,10 @@
 Client per interagire con l'API Backend
 """
 import requests
+import uuid
 from datetime import date
-from typing import List, Dict, Optional
-from frontend.config import API_URL
+from typing import Any, List, Dict, Optional
+from frontend.config import API_URL, API_URL_PUBBLICO
 
 
 class APIClient:
@@ -12,6 +13,10 @@ class APIClient:
     
     def __init__(self, base_url: str = API_URL):
         self.base_url = base_url
+        # Connessione e cookie riusati (letture sul primario dopo una scrittura,
+        # vedi backend/repliche.py) e ultima risposta delle GET con ETag, per URL e parametri
+        self._http = requests.Session()
+        self._risposte_etag: Dict[tuple, tuple] = {}
     
     def _handle_response(self, response: requests.Response):
         """Gestisce la risposta dell'API"""
@@ -20,19 +25,67 @@ class APIClient:
             return None, error_detail
         return response.json(), None
     
+    def _get_condizionale(
+        self,
+        percorso: str,
+        params: Optional[Dict] = None
+    ) -> tuple[Optional[Any], Optional[str], Dict]:
+        """
+        GET con If-None-Match: se i dati non sono cambiati (304) riusa l'ultimo corpo
+        
+        Returns:
+            Tupla (dati, errore, header della risposta che ha prodotto i dati)
+        """
+        chiave = (percorso, tuple(sorted((params or {}).items())))
+        salvata = self._risposte_etag.get(chiave)
+        headers = {"If-None-Match": salvata[0]} if salvata else {}
+        
+        response = self._http.get(f"{self.base_url}{percorso}", params=params, headers=headers)
+        if response.status_code == 304 and salvata:
+            return salvata[1], None, salvata[2]
+        
+        dati, errore = self._handle_response(response)
+        if errore is None and "ETag" in response.headers:
+            self._risposte_etag[chiave] = (response.headers["ETag"], dati, response.headers)
+        return dati, errore, response.headers
+    
+    def _richiesta_idempotente(self, metodo: str, url: str, tentativi: int = 3, **kwargs) -> requests.Response:
+        """
+        Esegue una scrittura con Idempotency-Key, ritentando sugli errori di rete
+        
+        Tutti i tentativi usano la stessa chiave: se il primo è arrivato al
+        backend, i successivi ricevono la sua risposta invece di ripeterlo.
+        """
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        for tentativo in range(tentativi):
+            try:
+                return self._http.request(metodo, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if tentativo == tentativi - 1:
+                    raise
+    
     # ========== CAMERE ==========
     def get_camere(self) -> tuple[Optional[List[Dict]], Optional[str]]:
-        """Ottiene tutte le camere"""
+        """Ottiene tutte le camere, seguendo il cursore delle pagine"""
         try:
-            response = requests.get(f"{self.base_url}/camere")
-            return self._handle_response(response)
+            camere = []
+            params = {"limite": 500}
+            while True:
+                pagina, errore, headers = self._get_condizionale("/camere", dict(params))
+                if errore:
+                    return None, errore
+                camere.extend(pagina)
+                cursore = headers.get("X-Cursore-Successivo")
+                if not cursore:
+                    return camere, None
+                params["cursore"] = cursore
         except Exception as e:
             return None, str(e)
     
     def get_camera(self, camera_id: int) -> tuple[Optional[Dict], Optional[str]]:
         """Ottiene una camera specifica"""
         try:
-            response = requests.get(f"{self.base_url}/camere/{camera_id}")
+            response = self._http.get(f"{self.base_url}/camere/{camera_id}")
             return self._handle_response(response)
         except Exception as e:
             return None, str(e)
@@ -52,7 +105,7 @@ class APIClient:
             if tipo and tipo != "Tutte":
                 payload["tipo"] = tipo.lower()
             
-            response = requests.post(
+            response = self._http.post(
                 f"{self.base_url}/camere/disponibili",
                 json=payload
             )
@@ -60,6 +113,33 @@ class APIClient:
         except Exception as e:
             return None, str(e)
     
+    # ========== EXPORT ==========
+    def url_export_prenotazioni(
+        self,
+        formato: str = "csv",
+        da: Optional[date] = None,
+        a: Optional[date] = None
+    ) -> str:
+        """URL dell'export in streaming, da aprire direttamente nel browser"""
+        params = {"formato": formato}
+        if da:
+            params["da"] = str(da)
+        if a:
+            params["a"] = str(a)
+        return requests.Request("GET", f"{API_URL_PUBBLICO}/export/prenotazioni", params=params).prepare().url
+    
+    # ========== OSPITI ==========
+    def cerca_ospiti(self, q: str, limite: int = 20) -> tuple[Optional[List[Dict]], Optional[str]]:
+        """Cerca ospiti per prefisso di nome, cognome, documento o email"""
+        try:
+            response = self._http.get(
+                f"{self.base_url}/ospiti/search",
+                params={"q": q, "limite": limite}
+            )
+            return self._handle_response(response)
+        except Exception as e:
+            return None, str(e)
+    
     # ========== PRENOTAZIONI ==========
     def crea_prenotazione(
         self,
@@ -78,7 +158,8 @@ class APIClient:
                 "data_check_out": str(data_check_out),
                 "numero_ospiti": numero_ospiti
             }
-            response = requests.post(
+            response = self._richiesta_idempotente(
+                "POST",
                 f"{self.base_url}/prenotazioni",
                 json=payload
             )
@@ -86,10 +167,40 @@ class APIClient:
         except Exception as e:
             return None, str(e)
     
+    def get_prenotazioni(
+        self,
+        cursore: Optional[str] = None,
+        limite: int = 50,
+        **filtri
+    ) -> tuple[Optional[Dict], Optional[str]]:
+        """
+        Ottiene una pagina dell'elenco prenotazioni
+        
+        I filtri sono quelli di GET /prenotazioni (stato, camera_id, ospite_id,
+        cognome, check_in_da, check_in_a, check_out_da, check_out_a). Il
+        risultato contiene 'prenotazioni' e 'cursore_successivo' (None
+        sull'ultima pagina).
+        """
+        try:
+            params = {k: str(v) for k, v in filtri.items() if v is not None}
+            params["limite"] = limite
+            if cursore:
+                params["cursore"] = cursore
+            response = self._http.get(f"{self.base_url}/prenotazioni", params=params)
+            prenotazioni, errore = self._handle_response(response)
+            if errore:
+                return None, errore
+            return {
+                "prenotazioni": prenotazioni,
+                "cursore_successivo": response.headers.get("X-Cursore-Successivo")
+            }, None
+        except Exception as e:
+            return None, str(e)
+    
     def get_prenotazione(self, prenotazione_id: int) -> tuple[Optional[Dict], Optional[str]]:
         """Ottiene una prenotazione specifica"""
         try:
-            response = requests.get(f"{self.base_url}/prenotazioni/{prenotazione_id}")
+            response = self._http.get(f"{self.base_url}/prenotazioni/{prenotazione_id}")
             return self._handle_response(response)
         except Exception as e:
             return None, str(e)
@@ -101,7 +212,7 @@ class APIClient:
     ) -> tuple[Optional[Dict], Optional[str]]:
         """Modifica una prenotazione"""
         try:
-            response = requests.put(
+            response = self._http.put(
                 f"{self.base_url}/prenotazioni/{prenotazione_id}",
                 json=aggiornamento
             )
@@ -112,7 +223,8 @@ class APIClient:
     def effettua_check_in(self, prenotazione_id: int) -> tuple[Optional[Dict], Optional[str]]:
         """Effettua check-in"""
         try:
-            response = requests.post(
+            response = self._richiesta_idempotente(
+                "POST",
                 f"{self.base_url}/prenotazioni/{prenotazione_id}/check-in"
             )
             return self._handle_response(response)
@@ -122,17 +234,41 @@ class APIClient:
     def effettua_check_out(self, prenotazione_id: int) -> tuple[Optional[Dict], Optional[str]]:
         """Effettua check-out"""
         try:
-            response = requests.post(
+            response = self._richiesta_idempotente(
+                "POST",
                 f"{self.base_url}/prenotazioni/{prenotazione_id}/check-out"
             )
             return self._handle_response(response)
         except Exception as e:
             return None, str(e)
     
+    def effettua_check_in_multiplo(self, prenotazione_ids: List[int]) -> tuple[Optional[Dict], Optional[str]]:
+        """Effettua il check-in di più prenotazioni con una sola chiamata"""
+        try:
+            response = self._http.post(
+                f"{self.base_url}/prenotazioni/check-in",
+                json={"ids": prenotazione_ids}
+            )
+            return self._handle_response(response)
+        except Exception as e:
+            return None, str(e)
+    
+    def effettua_check_out_multiplo(self, prenotazione_ids: List[int]) -> tuple[Optional[Dict], Optional[str]]:
+        """Effettua il check-out di più prenotazioni con una sola chiamata"""
+        try:
+            response = self._http.post(
+                f"{self.base_url}/prenotazioni/check-out",
+                json={"ids": prenotazione_ids}
+            )
+            return self._handle_response(response)
+        except Exception as e:
+            return None, str(e)
+    
     def cancella_prenotazione(self, prenotazione_id: int) -> tuple[Optional[Dict], Optional[str]]:
         """Cancella una prenotazione"""
         try:
-            response = requests.delete(
+            response = self._richiesta_idempotente(
+                "DELETE",
                 f"{self.base_url}/prenotazioni/{prenotazione_id}"
             )
             return self._handle_response(response)
@@ -143,31 +279,59 @@ class APIClient:
     def get_arrivi_oggi(self) -> tuple[Optional[List[Dict]], Optional[str]]:
         """Ottiene arrivi di oggi"""
         try:
-            response = requests.get(f"{self.base_url}/dashboard/arrivi-oggi")
-            return self._handle_response(response)
+            dati, errore, _ = self._get_condizionale("/dashboard/arrivi-oggi")
+            return dati, errore
         except Exception as e:
             return None, str(e)
     
     def get_partenze_oggi(self) -> tuple[Optional[List[Dict]], Optional[str]]:
         """Ottiene partenze di oggi"""
         try:
-            response = requests.get(f"{self.base_url}/dashboard/partenze-oggi")
-            return self._handle_response(response)
+            dati, errore, _ = self._get_condizionale("/dashboard/partenze-oggi")
+            return dati, errore
         except Exception as e:
             return None, str(e)
     
-    def get_stato_occupazione(self) -> tuple[Optional[List[Dict]], Optional[str]]:
-        """Ottiene stato occupazione"""
+    def get_stato_occupazione(
+        self,
+        piano: Optional[int] = None,
+        tipo: Optional[str] = None
+    ) -> tuple[Optional[List[Dict]], Optional[str]]:
+        """Ottiene stato occupazione, eventualmente di un solo piano o tipo"""
         try:
-            response = requests.get(f"{self.base_url}/dashboard/occupazione")
-            return self._handle_response(response)
+            params = {}
+            if piano is not None:
+                params["piano"] = piano
+            if tipo and tipo != "Tutte":
+                params["tipo"] = tipo.lower()
+            
+            dati, errore, _ = self._get_condizionale("/dashboard/occupazione", params)
+            return dati, errore
+        except Exception as e:
+            return None, str(e)
+    
+    def get_kpi(
+        self,
+        da: date,
+        a: date,
+        granularita: str = "mese",
+        tipo: Optional[str] = None
+    ) -> tuple[Optional[Dict], Optional[str]]:
+        """Ottiene i KPI di ricavo e occupazione (occupazione, ADR, RevPAR) per periodo"""
+        try:
+            params = {"da": str(da), "a": str(a), "granularita": granularita}
+            if tipo and tipo != "Tutte":
+                params["tipo"] = tipo.lower()
+            
+            dati, errore, _ = self._get_condizionale("/report/kpi", params)
+            return dati, errore
         except Exception as e:
             return None, str(e)
     
     def get_statistiche(self) -> tuple[Optional[Dict], Optional[str]]:
         """Ottiene statistiche generali"""
         try:
-            response = requests.get(f"{self.base_url}/dashboard/statistiche")
-            return self._handle_response(response)
+            dati, errore, _ = self._get_condizionale("/dashboard/statistiche")
+            return dati, errore
         except Exception as e:
             return None, str(e)
@@ -74,7 +74,7 @@ def mostra_statistiche(stats: Dict):
     Args:
         stats: Dizionario con le statistiche
     """
-    col1, col2, col3, col4, col5 = st.columns(5)
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
     
     with col1:
         st.metric("Totale Camere", stats['totale_camere'])
@@ -86,6 +86,8 @@ def mostra_statistiche(stats: Dict):
         st.metric("Tasso Occupazione", f"{stats['tasso_occupazione']:.1f}%")
     with col5:
         st.metric("Prenotazioni Future", stats['prenotazioni_future'])
+    with col6:
+        st.metric("Ricavo Oggi", f"€{stats['ricavo_oggi']:.2f}")
 
 
 def mostra_prenotazione_expander(prenotazione: Dict, tipo: str = "arrivo"):
@@ -132,4 +134,40 @@ def mostra_prenotazione_expander(prenotazione: Dict, tipo: str = "arrivo"):
                 type="primary"
             )
     
-    return False
\ No newline at end of file
+    return False
+
+
+def seleziona_prenotazioni(prenotazioni: List[Dict], chiave: str) -> List[int]:
+    """
+    Selezione multipla di prenotazioni per le operazioni di gruppo
+    
+    Args:
+        prenotazioni: Prenotazioni selezionabili
+        chiave: Chiave univoca del widget
+    
+    Returns:
+        ID delle prenotazioni selezionate
+    """
+    etichette = {
+        p['id']: f"Camera {p['camera']['numero']} - {p['ospite']['nome']} {p['ospite']['cognome']}"
+        for p in prenotazioni
+    }
+    return st.multiselect(
+        "Seleziona prenotazioni",
+        options=list(etichette),
+        format_func=etichette.get,
+        key=f"selezione_{chiave}"
+    )
+
+
+def mostra_esiti_multipli(risultato: Dict):
+    """
+    Mostra l'esito di un check-in/check-out multiplo
+    
+    Args:
+        risultato: Risposta dell'operazione multipla
+    """
+    st.success(f"✅ Operazioni completate: {risultato['completate']}")
+    for esito in risultato['risultati']:
+        if esito['esito'] != "ok":
+            st.warning(f"Prenotazione {esito['prenotazione_id']}: {esito['messaggio']}")
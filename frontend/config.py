@@ -9,6 +9,9 @@ load_dotenv()
 # URL API Backend
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# URL del backend raggiungibile dal browser, per i download diretti
+API_URL_PUBBLICO = os.getenv("API_URL_PUBBLICO", API_URL)
+
 # Configurazione pagina Streamlit
 PAGE_CONFIG = {
     "page_title": "Hotel Management System",
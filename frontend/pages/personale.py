@@ -1,12 +1,15 @@
 """
 Pagina Dashboard Personale
 """
+from datetime import date
 import streamlit as st
 from frontend.api_client import APIClient
 from frontend.components.visualizations import (
     mostra_prenotazione_expander,
     mostra_stato_camera,
-    mostra_statistiche
+    mostra_statistiche,
+    seleziona_prenotazioni,
+    mostra_esiti_multipli
 )
 
 
@@ -26,14 +29,18 @@ def render(api_client: APIClient):
         st.markdown("---")
     
     # Tab per diverse funzionalità
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3, tab4 = st.tabs([
         "📅 Arrivi e Partenze",
         "🏠 Stato Camere",
-        "💰 Report"
+        "💰 Report",
+        "🔎 Ospiti"
     ])
     
     # ========== TAB ARRIVI E PARTENZE ==========
     with tab1:
+        if 'esiti_multipli' in st.session_state:
+            mostra_esiti_multipli(st.session_state.pop('esiti_multipli'))
+        
         col1, col2 = st.columns(2)
         
         # Arrivi
@@ -44,6 +51,16 @@ def render(api_client: APIClient):
             if errore_arrivi:
                 st.error(f"Errore: {errore_arrivi}")
             elif arrivi:
+                selezionate = seleziona_prenotazioni(arrivi, "arrivi")
+                if st.button("✅ Check-in selezionati", disabled=not selezionate, key="checkin_multiplo"):
+                    risultato, errore = api_client.effettua_check_in_multiplo(selezionate)
+                    if errore:
+                        st.error(f"Errore: {errore}")
+                    else:
+                        # Mostrato dopo il ricaricamento della pagina
+                        st.session_state['esiti_multipli'] = risultato
+                        st.rerun()
+                
                 for prenotazione in arrivi:
                     if mostra_prenotazione_expander(prenotazione, "arrivo"):
                         # Effettua check-in
@@ -64,6 +81,16 @@ def render(api_client: APIClient):
             if errore_partenze:
                 st.error(f"Errore: {errore_partenze}")
             elif partenze:
+                selezionate = seleziona_prenotazioni(partenze, "partenze")
+                if st.button("🚪 Check-out selezionati", disabled=not selezionate, key="checkout_multiplo"):
+                    risultato, errore = api_client.effettua_check_out_multiplo(selezionate)
+                    if errore:
+                        st.error(f"Errore: {errore}")
+                    else:
+                        # Mostrato dopo il ricaricamento della pagina
+                        st.session_state['esiti_multipli'] = risultato
+                        st.rerun()
+                
                 for prenotazione in partenze:
                     if mostra_prenotazione_expander(prenotazione, "partenza"):
                         # Effettua check-out
@@ -81,29 +108,33 @@ def render(api_client: APIClient):
     with tab2:
         st.subheader("🏠 Stato di Occupazione Camere")
         
-        stato, errore_stato = api_client.get_stato_occupazione()
+        # Camere con GET condizionale (304 se invariate): i piani seguono le
+        # camere aggiunte o modificate; la griglia carica un piano alla volta
+        camere, _ = api_client.get_camere()
+        piani = sorted({c['piano'] for c in camere or []})
         
-        if errore_stato:
-            st.error(f"Errore: {errore_stato}")
-        elif stato:
-            # Raggruppa per piano
-            piani = {}
-            for camera_stato in stato:
-                piano = camera_stato['camera']['piano']
-                if piano not in piani:
-                    piani[piano] = []
-                piani[piano].append(camera_stato)
+        if not piani:
+            st.info("Nessuna camera registrata.")
+        else:
+            piano = st.selectbox(
+                "Piano",
+                piani,
+                format_func=lambda p: f"Piano {p}",
+                key="piano_occupazione"
+            )
+            
+            stato, errore_stato = api_client.get_stato_occupazione(piano=piano)
             
-            # Mostra per piano
-            for piano in sorted(piani.keys()):
-                st.markdown(f"### Piano {piano}")
+            if errore_stato:
+                st.error(f"Errore: {errore_stato}")
+            elif stato:
+                occupate = sum(1 for camera_stato in stato if camera_stato['occupata'])
+                st.markdown(f"### Piano {piano} · {occupate}/{len(stato)} occupate")
                 
                 cols = st.columns(4)
-                for idx, camera_stato in enumerate(piani[piano]):
+                for idx, camera_stato in enumerate(stato):
                     with cols[idx % 4]:
                         mostra_stato_camera(camera_stato)
-                
-                st.markdown("<br>", unsafe_allow_html=True)
     
     # ========== TAB REPORT ==========
     with tab3:
@@ -117,12 +148,91 @@ def render(api_client: APIClient):
                 st.json(stats)
         
         with col_rep2:
-            st.markdown("#### 🔄 Funzionalità Future")
-            st.info("""
-            In questa sezione saranno disponibili:
-            - Report di fatturazione
-            - Statistiche per periodo
-            - Export dati Excel/CSV
-            - Grafici occupazione
-            - Analisi revenue
-            """)
\ No newline at end of file
+            st.markdown("#### 📥 Export Prenotazioni")
+            oggi = date.today()
+            col_da, col_a = st.columns(2)
+            with col_da:
+                export_da = st.date_input("Check-in dal", value=date(oggi.year, 1, 1), key="export_da")
+            with col_a:
+                export_a = st.date_input("Check-in al", value=date(oggi.year, 12, 31), key="export_a")
+            formato = st.radio("Formato", ["csv", "ndjson", "parquet", "arrow"], horizontal=True, key="export_formato")
+            
+            # Il browser scarica direttamente dal backend in streaming: il file
+            # non passa dal processo Streamlit
+            st.link_button(
+                "⬇️ Scarica export",
+                api_client.url_export_prenotazioni(formato, export_da, export_a),
+                use_container_width=True
+            )
+        
+        st.markdown("---")
+        st.markdown("#### 📈 KPI per Periodo")
+        col_kpi1, col_kpi2, col_kpi3, col_kpi4 = st.columns(4)
+        with col_kpi1:
+            kpi_da = st.date_input("Dal", value=date(oggi.year, 1, 1), key="kpi_da")
+        with col_kpi2:
+            kpi_a = st.date_input("Al", value=date(oggi.year, 12, 31), key="kpi_a")
+        with col_kpi3:
+            granularita = st.selectbox("Raggruppa per", ["mese", "settimana", "giorno"], key="kpi_granularita")
+        with col_kpi4:
+            tipo_kpi = st.selectbox("Tipo camera", ["Tutte", "Singola", "Doppia", "Suite"], key="kpi_tipo")
+        
+        kpi, errore_kpi = api_client.get_kpi(kpi_da, kpi_a, granularita, tipo_kpi)
+        if errore_kpi:
+            st.error(f"Errore: {errore_kpi}")
+        elif kpi:
+            totale = kpi['totale']
+            col_t1, col_t2, col_t3, col_t4, col_t5 = st.columns(5)
+            col_t1.metric("Occupazione", f"{totale['occupazione']}%")
+            col_t2.metric("ADR", f"€{totale['adr']:.2f}")
+            col_t3.metric("RevPAR", f"€{totale['revpar']:.2f}")
+            col_t4.metric("Notti Vendute", totale['notti_vendute'])
+            col_t5.metric("Cancellazioni", totale['cancellazioni'])
+            
+            periodi = {p['periodo']: p for p in kpi['periodi']}
+            st.line_chart({
+                "Occupazione %": {periodo: p['occupazione'] for periodo, p in periodi.items()},
+                "RevPAR €": {periodo: p['revpar'] for periodo, p in periodi.items()}
+            })
+            st.dataframe([
+                {
+                    "Periodo": p['periodo'],
+                    "Occupazione %": p['occupazione'],
+                    "ADR €": p['adr'],
+                    "RevPAR €": p['revpar'],
+                    "Ricavo €": p['ricavo'],
+                    "Notti Vendute": p['notti_vendute'],
+                    "Arrivi": p['arrivi'],
+                    "Partenze": p['partenze'],
+                    "Cancellazioni": p['cancellazioni']
+                }
+                for p in kpi['periodi']
+            ], use_container_width=True, hide_index=True)
+    
+    # ========== TAB OSPITI ==========
+    with tab4:
+        st.subheader("🔎 Ricerca Ospiti")
+        
+        q = st.text_input("Cognome, nome, documento o email", key="ricerca_ospiti")
+        if q.strip():
+            ospiti, errore_ospiti = api_client.cerca_ospiti(q.strip())
+            
+            if errore_ospiti:
+                st.error(f"Errore: {errore_ospiti}")
+            elif ospiti:
+                st.dataframe([
+                    {
+                        "Cognome": o['cognome'],
+                        "Nome": o['nome'],
+                        "Documento": o['documento'],
+                        "Email": o['email'] or "",
+                        "Prenotazioni": o['numero_prenotazioni'],
+                        "Ultimo soggiorno": (
+                            f"{o['ultimo_soggiorno']['data_check_in']} → {o['ultimo_soggiorno']['data_check_out']}"
+                            if o['ultimo_soggiorno'] else "-"
+                        )
+                    }
+                    for o in ospiti
+                ], use_container_width=True, hide_index=True)
+            else:
+                st.info("Nessun ospite trovato.")
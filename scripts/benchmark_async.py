@@ -0,0 +1,129 @@
+"""
+Benchmark delle letture in modalità sincrona e async (DATABASE_ASYNC)
+
+Per ciascuna modalità avvia un processo con la stessa configurazione,
+popola un database SQLite su file e invia richieste concorrenti alle letture
+più frequenti (arrivi di oggi, elenco prenotazioni, ricerca ospiti)
+direttamente all'app ASGI, senza rete. Riporta richieste al secondo e
+latenza al 95° percentile.
+
+Uso:
+    python scripts/benchmark_async.py [richieste_concorrenti]
+"""
+import os
+import sys
+import asyncio
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RADICE)
+
+CONCORRENZA = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+RICHIESTE = 1000
+NUMERO_CAMERE = 300
+NUMERO_OSPITI = 20_000
+PRENOTAZIONI = 10_000
+PERCORSI = [
+    "/dashboard/arrivi-oggi",
+    "/prenotazioni?limite=50&stato=confermata",
+    "/ospiti/search?q=ross",
+]
+
+
+def popola_database():
+    """Camere, ospiti e prenotazioni nel database configurato da DATABASE_URL"""
+    from sqlalchemy import insert
+    from backend.database import engine
+    from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione
+
+    random.seed(42)
+    tipi = list(TipoCamera)
+    oggi = date.today()
+    with engine.begin() as connessione:
+        connessione.execute(insert(Camera), [
+            {"numero": str(1000 + i), "tipo": tipi[i % len(tipi)], "piano": i // 50,
+             "prezzo_per_notte": 100, "servizi_inclusi": "WiFi, TV"}
+            for i in range(NUMERO_CAMERE)
+        ])
+        connessione.execute(insert(Ospite), [
+            {"nome": "Mario", "cognome": f"{random.choice(['Rossi', 'Russo', 'Bianchi'])}{i}",
+             "documento": f"BENCH{i:06d}", "nazionalita": "Italiana"}
+            for i in range(NUMERO_OSPITI)
+        ])
+        connessione.execute(insert(Prenotazione), [
+            {
+                "camera_id": random.randint(1, NUMERO_CAMERE), "ospite_id": random.randint(1, NUMERO_OSPITI),
+                "data_check_in": oggi + timedelta(days=giorno), "data_check_out": oggi + timedelta(days=giorno + 2),
+                "numero_ospiti": 1, "prezzo_totale": 200, "stato": StatoPrenotazione.CONFERMATA
+            }
+            for giorno in (random.randint(-60, 60) for _ in range(PRENOTAZIONI))
+        ])
+
+
+async def carico(app):
+    """Invia RICHIESTE richieste con CONCORRENZA in volo; restituisce le latenze in secondi"""
+    import httpx
+
+    latenze = []
+    semaforo = asyncio.Semaphore(CONCORRENZA)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://hotel") as client:
+        async def richiesta(indice: int):
+            async with semaforo:
+                inizio = time.perf_counter()
+                risposta = await client.get(PERCORSI[indice % len(PERCORSI)])
+                risposta.raise_for_status()
+                latenze.append(time.perf_counter() - inizio)
+
+        await asyncio.gather(*(richiesta(i) for i in range(RICHIESTE)))
+    return latenze
+
+
+def misura():
+    """Processo figlio: la modalità è già fissata da DATABASE_ASYNC nell'ambiente"""
+    from backend.main import app
+    from backend.database import DATABASE_ASYNC
+
+    async def riscaldamento_e_misura():
+        # Stesso event loop per le due fasi: il pool async è legato al loop
+        await carico(app)  # Riscaldamento: connessioni e cache dei piani SQLite
+        inizio = time.perf_counter()
+        latenze = await carico(app)
+        return sorted(latenze), time.perf_counter() - inizio
+
+    popola_database()
+    latenze, durata = asyncio.run(riscaldamento_e_misura())
+
+    modalita = "async" if DATABASE_ASYNC else "sincrona"
+    p95 = latenze[int(len(latenze) * 0.95)] * 1000
+    print(f"{modalita:<9} | {RICHIESTE / durata:>11.0f} | {p95:>8.1f}")
+
+
+def main():
+    print(f"{RICHIESTE} richieste, {CONCORRENZA} concorrenti")
+    print(f"{'modalita':<9} | {'richieste/s':>11} | {'p95 ms':>8}")
+    print("-" * 34)
+    for modalita in ("0", "1"):
+        with tempfile.TemporaryDirectory() as cartella:
+            ambiente = {
+                **os.environ,
+                "DATABASE_ASYNC": modalita,
+                "DATABASE_URL": f"sqlite:///{os.path.join(cartella, 'hotel.db')}",
+                "PYTHONPATH": RADICE,
+            }
+            figlio = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), str(CONCORRENZA), "--misura"],
+                env=ambiente, cwd=cartella, check=True, capture_output=True, text=True
+            )
+            # Solo la riga dei risultati, senza i messaggi di inizializzazione
+            print(figlio.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if "--misura" in sys.argv:
+        misura()
+    else:
+        main()
@@ -0,0 +1,85 @@
+"""
+Benchmark della ricerca camere disponibili
+
+Confronta la verifica camera per camera (una COUNT per camera) con la query
+unica NOT EXISTS usata da POST /camere/disponibili, al crescere del numero
+di camere. Per ogni dimensione riporta numero di query e latenza media.
+
+Uso:
+    python scripts/benchmark_disponibilita.py
+"""
+import os
+import sys
+import random
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.models import Camera, Ospite, Prenotazione, StatoPrenotazione
+from backend.utils import verifica_disponibilita_camera, query_camere_disponibili
+from utils_benchmark import conta_query, misura, prepara_database
+
+DIMENSIONI = [50, 100, 200, 400, 800]
+PRENOTAZIONI_PER_CAMERA = 5
+
+
+def aggiungi_prenotazioni(session, camere):
+    """Aggiunge prenotazioni casuali consecutive a ogni camera"""
+    ospite = Ospite(nome="Mario", cognome="Rossi", documento="BENCH0001", nazionalita="Italiana")
+    session.add(ospite)
+    session.flush()
+
+    oggi = date.today()
+    prenotazioni = []
+    for camera in camere:
+        inizio = oggi
+        for _ in range(PRENOTAZIONI_PER_CAMERA):
+            inizio += timedelta(days=random.randint(0, 20))
+            durata = random.randint(1, 7)
+            prenotazioni.append(Prenotazione(
+                camera_id=camera.id,
+                ospite_id=ospite.id,
+                data_check_in=inizio,
+                data_check_out=inizio + timedelta(days=durata),
+                numero_ospiti=1,
+                prezzo_totale=camera.prezzo_per_notte * durata,
+                stato=StatoPrenotazione.CONFERMATA
+            ))
+            inizio += timedelta(days=durata)
+    session.add_all(prenotazioni)
+    session.commit()
+
+
+def ricerca_per_camera(session, data_check_in, data_check_out):
+    """Strategia precedente: una verifica di disponibilità per ogni camera"""
+    camere = session.query(Camera).all()
+    return [
+        c for c in camere
+        if verifica_disponibilita_camera(session, c.id, data_check_in, data_check_out)
+    ]
+
+
+def ricerca_unica(session, data_check_in, data_check_out):
+    """Strategia attuale: una sola query NOT EXISTS"""
+    return session.scalars(query_camere_disponibili(data_check_in, data_check_out)).all()
+
+
+def main():
+    random.seed(42)
+    print(f"{'camere':>8} | {'strategia':<12} | {'query':>6} | {'ms/ricerca':>10} | {'libere':>6}")
+    print("-" * 56)
+    for numero_camere in DIMENSIONI:
+        engine, session, camere = prepara_database(numero_camere)
+        aggiungi_prenotazioni(session, camere)
+        contatore = conta_query(engine)
+        data_check_in = date.today() + timedelta(days=10)
+        data_check_out = data_check_in + timedelta(days=3)
+        for nome, strategia in (("per camera", ricerca_per_camera), ("NOT EXISTS", ricerca_unica)):
+            query, latenza, libere = misura(session, contatore, strategia, data_check_in, data_check_out)
+            print(f"{numero_camere:>8} | {nome:<12} | {query:>6} | {latenza:>10.2f} | {len(libere):>6}")
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark del report KPI (GET /report/kpi)
+
+Popola un database SQLite su file con un anno di soggiorni e cancellazioni,
+misura la ricostruzione delle statistiche giornaliere dalle prenotazioni e
+poi il report KPI (occupazione, ADR, RevPAR) per giorno, settimana e mese
+sull'intero anno, letto dalle statistiche precalcolate.
+
+Uso:
+    python scripts/benchmark_kpi.py [numero_camere]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione
+from backend.report import GRANULARITA, kpi_periodo, serie_giornaliere
+from backend.statistiche_giornaliere import ricostruisci_statistiche
+
+NUMERO_CAMERE = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+INIZIO = date(2025, 1, 1)
+FINE = date(2025, 12, 31)
+QUOTA_CANCELLATE = 0.08
+RIPETIZIONI = 10
+
+
+def prepara_database(percorso: str):
+    """Crea il database: ogni camera ha soggiorni consecutivi di 1-7 notti per tutto l'anno"""
+    engine = create_engine(f"sqlite:///{percorso}")
+    Base.metadata.create_all(bind=engine)
+
+    tipi = list(TipoCamera)
+    with engine.begin() as connessione:
+        connessione.execute(insert(Camera), [
+            {"numero": str(1000 + i), "tipo": tipi[i % len(tipi)], "piano": i // 50,
+             "prezzo_per_notte": 80 + (i % 5) * 20, "servizi_inclusi": "WiFi, TV"}
+            for i in range(NUMERO_CAMERE)
+        ])
+        connessione.execute(insert(Ospite), [
+            {"nome": "Mario", "cognome": f"Rossi{i}", "documento": f"BENCH{i:05d}", "nazionalita": "Italiana"}
+            for i in range(NUMERO_CAMERE)
+        ])
+
+        prenotazioni = []
+        for camera_id in range(1, NUMERO_CAMERE + 1):
+            arrivo = INIZIO - timedelta(days=random.randint(0, 5))
+            while arrivo <= FINE:
+                notti = random.randint(1, 7)
+                partenza = arrivo + timedelta(days=notti)
+                cancellata = random.random() < QUOTA_CANCELLATE
+                prenotazioni.append({
+                    "camera_id": camera_id, "ospite_id": camera_id,
+                    "data_check_in": arrivo, "data_check_out": partenza,
+                    "numero_ospiti": 1, "prezzo_totale": notti * random.choice((80, 100, 120, 150)),
+                    "stato": StatoPrenotazione.CANCELLATA if cancellata else StatoPrenotazione.CHECK_OUT_COMPLETATO
+                })
+                # Dopo una cancellazione la camera resta libera qualche giorno
+                arrivo = partenza + timedelta(days=random.randint(0, 3) if cancellata else random.randint(0, 1))
+        connessione.execute(insert(Prenotazione), prenotazioni)
+
+    print(f"{NUMERO_CAMERE} camere, {len(prenotazioni)} prenotazioni dal {INIZIO} al {FINE}")
+    return engine
+
+
+def main():
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as cartella:
+        engine = prepara_database(os.path.join(cartella, "kpi.db"))
+        session = sessionmaker(bind=engine)()
+
+        inizio = time.perf_counter()
+        righe = ricostruisci_statistiche(session)
+        session.commit()
+        print(f"Statistiche giornaliere ricostruite: {righe} righe in {(time.perf_counter() - inizio) * 1000:.0f} ms")
+
+        print(f"{'granularita':<12} | {'periodi':>7} | {'occupazione':>11} | {'RevPAR':>8} | {'ms/report':>9}")
+        print("-" * 60)
+        for granularita in GRANULARITA:
+            inizio = time.perf_counter()
+            for _ in range(RIPETIZIONI):
+                report = kpi_periodo(serie_giornaliere(session, INIZIO, FINE), granularita)
+                session.rollback()
+            latenza = (time.perf_counter() - inizio) / RIPETIZIONI * 1000
+            totale = report["totale"]
+            print(f"{granularita:<12} | {len(report['periodi']):>7} | {totale['occupazione']:>10.2f}% | "
+                  f"{totale['revpar']:>8.2f} | {latenza:>9.1f}")
+
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
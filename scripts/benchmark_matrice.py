@@ -0,0 +1,108 @@
+"""
+Benchmark della matrice di disponibilità camere × giorni (GET /disponibilita/matrice)
+
+Confronta la costruzione riga per riga in Python (prenotazioni caricate come
+oggetti ORM, un ciclo per notte) con matrice_occupazione, che legge le
+prenotazioni in una query e riempie la matrice con NumPy. Periodo di un anno
+su 500 camere con una quota di occupazione realistica; obiettivo < 50 ms.
+
+Uso:
+    python scripts/benchmark_matrice.py [numero_camere] [giorni]
+"""
+import os
+import sys
+import random
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.disponibilita import codifica_bitmap, matrice_occupazione
+from backend.models import Camera, Ospite, Prenotazione, StatoPrenotazione
+from backend.utils import filtro_sovrapposizione
+from utils_benchmark import conta_query, misura, prepara_database
+
+NUMERO_CAMERE = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+GIORNI = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+OBIETTIVO_MS = 50
+
+
+def aggiungi_prenotazioni(session, camere, giorni: int):
+    """Soggiorni consecutivi per camera su tutto il periodo, con pause casuali e qualche cancellazione"""
+    ospite = Ospite(nome="Mario", cognome="Rossi", documento="BENCH0001", nazionalita="Italiana")
+    session.add(ospite)
+    session.flush()
+
+    oggi = date.today()
+    fine = oggi + timedelta(days=giorni)
+    prenotazioni = []
+    for camera in camere:
+        inizio = oggi - timedelta(days=random.randint(0, 5))
+        while inizio < fine:
+            durata = random.randint(1, 7)
+            prenotazioni.append(dict(
+                camera_id=camera.id,
+                ospite_id=ospite.id,
+                data_check_in=inizio,
+                data_check_out=inizio + timedelta(days=durata),
+                numero_ospiti=1,
+                prezzo_totale=camera.prezzo_per_notte * durata,
+                stato=(StatoPrenotazione.CANCELLATA if random.random() < 0.1
+                       else StatoPrenotazione.CONFERMATA)
+            ))
+            inizio += timedelta(days=durata + random.randint(0, 3))
+    session.bulk_insert_mappings(Prenotazione, prenotazioni)
+    session.commit()
+    return len(prenotazioni)
+
+
+def matrice_python(session, da: date, a: date):
+    """Strategia di riferimento: oggetti ORM e un ciclo per ogni notte occupata"""
+    giorni = (a - da).days
+    camere = session.query(Camera).order_by(Camera.id).all()
+    righe = {camera.id: [False] * giorni for camera in camere}
+    for prenotazione in session.query(Prenotazione).filter(
+        Prenotazione.stato.in_([StatoPrenotazione.CONFERMATA, StatoPrenotazione.CHECK_IN_EFFETTUATO]),
+        filtro_sovrapposizione(da, a)
+    ):
+        riga = righe[prenotazione.camera_id]
+        for giorno in range(max(0, (prenotazione.data_check_in - da).days),
+                            min(giorni, (prenotazione.data_check_out - da).days)):
+            riga[giorno] = True
+    return [righe[camera.id] for camera in camere]
+
+
+def matrice_numpy(session, da: date, a: date):
+    """Strategia attuale: matrice_occupazione"""
+    return matrice_occupazione(session, da, a)[1]
+
+
+def matrice_e_bitmap(session, da: date, a: date):
+    """Strategia attuale con la codifica della risposta (bitmap base64)"""
+    return codifica_bitmap(matrice_occupazione(session, da, a)[1])
+
+
+def main():
+    random.seed(42)
+    engine, session, camere = prepara_database(NUMERO_CAMERE)
+    numero_prenotazioni = aggiungi_prenotazioni(session, camere, GIORNI)
+    contatore = conta_query(engine)
+    da = date.today()
+    a = da + timedelta(days=GIORNI)
+
+    print(f"{NUMERO_CAMERE} camere × {GIORNI} giorni, {numero_prenotazioni} prenotazioni")
+    print(f"{'strategia':<18} | {'query':>6} | {'ms/matrice':>10}")
+    print("-" * 40)
+    for nome, strategia in (
+        ("Python per notte", matrice_python),
+        ("NumPy", matrice_numpy),
+        ("NumPy + bitmap", matrice_e_bitmap),
+    ):
+        query, latenza, _ = misura(session, contatore, strategia, da, a)
+        esito = "" if strategia is matrice_python else ("  ✅" if latenza < OBIETTIVO_MS else "  ❌")
+        print(f"{nome:<18} | {query:>6} | {latenza:>10.2f}{esito}")
+    session.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark dello stato di occupazione camere (GET /dashboard/occupazione)
+
+Confronta la lettura precedente (una query per camera più il caricamento
+dell'ospite per ogni camera occupata) con la query unica in LEFT JOIN, al
+crescere del numero di camere. Per ogni dimensione riporta numero di query
+e latenza media.
+
+Uso:
+    python scripts/benchmark_occupazione.py
+"""
+import os
+import sys
+import random
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.models import Camera, Ospite, Prenotazione, StatoPrenotazione
+from backend.utils import query_stato_occupazione
+from utils_benchmark import conta_query, misura, prepara_database
+
+DIMENSIONI = [100, 250, 500, 1000]
+QUOTA_OCCUPATE = 0.7
+
+
+def aggiungi_soggiorni(session, camere):
+    """Aggiunge un ospite per camera, un soggiorno concluso e quello in corso per le occupate"""
+    ospiti = [
+        Ospite(nome="Mario", cognome=f"Rossi{i}", documento=f"BENCH{i:05d}", nazionalita="Italiana")
+        for i in range(len(camere))
+    ]
+    session.add_all(ospiti)
+    session.flush()
+
+    oggi = date.today()
+    prenotazioni = []
+    for camera, ospite in zip(camere, ospiti):
+        # Un soggiorno concluso per camera, più quello in corso per le occupate
+        prenotazioni.append(Prenotazione(
+            camera_id=camera.id, ospite_id=ospite.id,
+            data_check_in=oggi - timedelta(days=10), data_check_out=oggi - timedelta(days=7),
+            numero_ospiti=1, prezzo_totale=camera.prezzo_per_notte * 3,
+            stato=StatoPrenotazione.CHECK_OUT_COMPLETATO
+        ))
+        if random.random() < QUOTA_OCCUPATE:
+            arrivo = oggi - timedelta(days=random.randint(0, 3))
+            prenotazioni.append(Prenotazione(
+                camera_id=camera.id, ospite_id=ospite.id,
+                data_check_in=arrivo, data_check_out=oggi + timedelta(days=random.randint(1, 5)),
+                numero_ospiti=1, prezzo_totale=camera.prezzo_per_notte * 5,
+                stato=StatoPrenotazione.CHECK_IN_EFFETTUATO
+            ))
+    session.add_all(prenotazioni)
+    session.commit()
+
+
+def occupazione_per_camera(session):
+    """Strategia precedente: una query per camera e l'ospite caricato in lazy loading"""
+    oggi = date.today()
+    stato = []
+    for camera in session.query(Camera).all():
+        attuale = session.query(Prenotazione).filter(
+            Prenotazione.camera_id == camera.id,
+            Prenotazione.data_check_in <= oggi,
+            Prenotazione.data_check_out > oggi,
+            Prenotazione.stato == StatoPrenotazione.CHECK_IN_EFFETTUATO
+        ).first()
+        stato.append((camera.id, f"{attuale.ospite.nome} {attuale.ospite.cognome}" if attuale else None))
+    return stato
+
+
+def occupazione_unica(session):
+    """Strategia attuale: una sola query in LEFT JOIN"""
+    return session.connection().execute(query_stato_occupazione(date.today())).all()
+
+
+def main():
+    random.seed(42)
+    print(f"{'camere':>8} | {'strategia':<12} | {'query':>6} | {'ms/lettura':>10}")
+    print("-" * 46)
+    for numero_camere in DIMENSIONI:
+        engine, session, camere = prepara_database(numero_camere)
+        aggiungi_soggiorni(session, camere)
+        contatore = conta_query(engine)
+        for nome, strategia in (("per camera", occupazione_per_camera), ("LEFT JOIN", occupazione_unica)):
+            query, latenza, _ = misura(session, contatore, strategia)
+            print(f"{numero_camere:>8} | {nome:<12} | {query:>6} | {latenza:>10.2f}")
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
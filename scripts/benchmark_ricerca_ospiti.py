@@ -0,0 +1,80 @@
+"""
+Benchmark della ricerca ospiti (GET /ospiti/search)
+
+Popola un database SQLite su file con molti ospiti e misura la latenza
+della ricerca per prefisso tramite la tabella FTS5 (con il riepilogo dei
+soggiorni) per alcuni testi tipici della reception.
+
+Uso:
+    python scripts/benchmark_ricerca_ospiti.py [numero_ospiti]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Ospite
+from backend.ricerca_ospiti import cerca_ospiti, inizializza_ricerca_ospiti, riepilogo_soggiorni
+
+NUMERO_OSPITI = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BLOCCO = 50_000
+RIPETIZIONI = 50
+NOMI = ["Mario", "Laura", "Giuseppe", "Anna", "Marco", "Giulia", "Luca", "Sara", "Paolo", "Elena"]
+COGNOMI = ["Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci",
+           "Marino", "Greco", "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa"]
+RICERCHE = ["ross", "esposito mar", "IT00123", "ab", "mario.rossi12", "zzz"]
+
+
+def prepara_database(percorso: str):
+    """Crea il database con gli ospiti; l'indice FTS5 è popolato dai trigger"""
+    engine = create_engine(f"sqlite:///{percorso}")
+    Base.metadata.create_all(bind=engine)
+    inizializza_ricerca_ospiti(engine)
+
+    inizio = time.perf_counter()
+    with engine.begin() as connessione:
+        for partenza in range(0, NUMERO_OSPITI, BLOCCO):
+            connessione.execute(insert(Ospite), [
+                {
+                    "nome": random.choice(NOMI),
+                    "cognome": f"{random.choice(COGNOMI)}{random.randint(0, 999)}",
+                    "documento": f"IT{i:08d}",
+                    "nazionalita": "Italiana",
+                    "email": f"{random.choice(NOMI).lower()}.{random.choice(COGNOMI).lower()}{i}@email.it"
+                }
+                for i in range(partenza, min(partenza + BLOCCO, NUMERO_OSPITI))
+            ])
+    print(f"{NUMERO_OSPITI} ospiti inseriti e indicizzati in {time.perf_counter() - inizio:.1f}s")
+    return engine
+
+
+def main():
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as cartella:
+        engine = prepara_database(os.path.join(cartella, "ospiti.db"))
+        session = sessionmaker(bind=engine)()
+
+        print(f"{'ricerca':<16} | {'risultati':>9} | {'ms/ricerca':>10}")
+        print("-" * 42)
+        for q in RICERCHE:
+            inizio = time.perf_counter()
+            for _ in range(RIPETIZIONI):
+                ospiti = cerca_ospiti(session, q)
+                riepilogo_soggiorni(session, [o.id for o in ospiti])
+                session.expire_all()
+            latenza = (time.perf_counter() - inizio) / RIPETIZIONI * 1000
+            print(f"{q:<16} | {len(ospiti):>9} | {latenza:>10.2f}")
+
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark del profilo prestazioni SQLite (backend/database.py)
+
+Esegue lo stesso carico misto su un database SQLite su file con le
+impostazioni predefinite di SQLite (journal rollback, sync FULL) e con il
+profilo SQLITE_PRAGMA (WAL, sync NORMAL, cache, mmap, busy timeout): alcuni
+thread leggono gli arrivi di giorni casuali (lettura breve su indice, come
+le pagine della dashboard), altri inseriscono prenotazioni con un commit
+ciascuna. Riporta operazioni al secondo per tipo ed errori di lock.
+
+Uso:
+    python scripts/benchmark_sqlite.py [secondi_per_profilo]
+"""
+import os
+import sys
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base, SQLITE_PRAGMA, applica_pragma
+from backend.models import Camera, Ospite, Prenotazione, TipoCamera, StatoPrenotazione
+
+DURATA = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+NUMERO_CAMERE = 200
+PRENOTAZIONI_INIZIALI = 20_000
+LETTORI = 6
+SCRITTORI = 2
+PROFILI = {
+    # Solo l'attesa sui lock del driver, come prima del profilo
+    "predefinito": {},
+    "prestazioni": SQLITE_PRAGMA,
+}
+
+
+def prepara_database(percorso: str, pragma: dict):
+    """Crea il database con camere, un ospite e uno storico di prenotazioni"""
+    engine = create_engine(f"sqlite:///{percorso}", connect_args={"check_same_thread": False})
+    applica_pragma(engine, pragma)
+    Base.metadata.create_all(bind=engine)
+
+    tipi = list(TipoCamera)
+    oggi = date.today()
+    with engine.begin() as connessione:
+        connessione.execute(insert(Camera), [
+            {"numero": str(1000 + i), "tipo": tipi[i % len(tipi)], "piano": i // 50,
+             "prezzo_per_notte": 100, "servizi_inclusi": "WiFi, TV"}
+            for i in range(NUMERO_CAMERE)
+        ])
+        connessione.execute(insert(Ospite), [
+            {"nome": "Mario", "cognome": "Rossi", "documento": "BENCH", "nazionalita": "Italiana"}
+        ])
+        connessione.execute(insert(Prenotazione), [
+            {
+                "camera_id": random.randint(1, NUMERO_CAMERE), "ospite_id": 1,
+                "data_check_in": oggi + timedelta(days=giorno), "data_check_out": oggi + timedelta(days=giorno + 3),
+                "numero_ospiti": 1, "prezzo_totale": 300, "stato": StatoPrenotazione.CONFERMATA
+            }
+            for giorno in (random.randint(-365, 365) for _ in range(PRENOTAZIONI_INIZIALI))
+        ])
+    return engine
+
+
+def lettore(Sessione, fine: float, contatori: dict, lock: threading.Lock):
+    """Arrivi di giorni casuali"""
+    session = Sessione()
+    eseguite = errori = 0
+    while time.perf_counter() < fine:
+        giorno = date.today() + timedelta(days=random.randint(0, 300))
+        try:
+            session.execute(select(Prenotazione).where(Prenotazione.data_check_in == giorno)).all()
+            session.rollback()
+            eseguite += 1
+        except OperationalError:
+            session.rollback()
+            errori += 1
+    session.close()
+    with lock:
+        contatori["letture"] += eseguite
+        contatori["errori"] += errori
+
+
+def scrittore(Sessione, fine: float, contatori: dict, lock: threading.Lock):
+    """Una prenotazione per transazione, con commit"""
+    session = Sessione()
+    eseguite = errori = 0
+    while time.perf_counter() < fine:
+        check_in = date.today() + timedelta(days=random.randint(0, 300))
+        try:
+            session.add(Prenotazione(
+                camera_id=random.randint(1, NUMERO_CAMERE), ospite_id=1,
+                data_check_in=check_in, data_check_out=check_in + timedelta(days=2),
+                numero_ospiti=1, prezzo_totale=200, stato=StatoPrenotazione.CONFERMATA
+            ))
+            session.commit()
+            eseguite += 1
+        except OperationalError:
+            session.rollback()
+            errori += 1
+    session.close()
+    with lock:
+        contatori["scritture"] += eseguite
+        contatori["errori"] += errori
+
+
+def misura(pragma: dict, cartella: str, nome: str) -> dict:
+    """Esegue il carico misto per DURATA secondi e restituisce i contatori"""
+    engine = prepara_database(os.path.join(cartella, f"{nome}.db"), pragma)
+    Sessione = sessionmaker(bind=engine)
+    contatori = {"letture": 0, "scritture": 0, "errori": 0}
+    lock = threading.Lock()
+
+    fine = time.perf_counter() + DURATA
+    thread = [
+        threading.Thread(target=lettore, args=(Sessione, fine, contatori, lock)) for _ in range(LETTORI)
+    ] + [
+        threading.Thread(target=scrittore, args=(Sessione, fine, contatori, lock)) for _ in range(SCRITTORI)
+    ]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    engine.dispose()
+    return contatori
+
+
+def main():
+    random.seed(42)
+    print(f"{LETTORI} lettori, {SCRITTORI} scrittori, {DURATA:.0f}s per profilo")
+    print(f"{'profilo':<12} | {'letture/s':>9} | {'scritture/s':>11} | {'errori lock':>11}")
+    print("-" * 54)
+    with tempfile.TemporaryDirectory() as cartella:
+        for nome, pragma in PROFILI.items():
+            contatori = misura(pragma, cartella, nome)
+            print(f"{nome:<12} | {contatori['letture'] / DURATA:>9.0f} | "
+                  f"{contatori['scritture'] / DURATA:>11.0f} | {contatori['errori']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark dell'incremento della versione dei dati nei commit (backend/database.py)
+
+Ogni commit con scritture esegue UPDATE versione_dati ... RETURNING sulla
+stessa riga subito prima del COMMIT: i commit concorrenti si accodano sul
+lock di quella riga per il tempo del solo commit. Il benchmark esegue gli
+stessi commit brevi (un ospite ciascuno) da più thread senza e con
+l'incremento e riporta i commit al secondo.
+
+Su SQLite i commit sono già serializzati dal lock del database; su
+PostgreSQL l'attesa sulla riga si somma alla durata del commit (fsync).
+
+Uso:
+    python scripts/benchmark_versione.py [secondi_per_variante]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from backend.database import Base, crea_motore, errore_di_lock, tabella_versione_dati
+from backend.models import Ospite
+
+DURATA = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+SCRITTORI = 8
+
+
+def scrittore(motore, incrementa: bool, fine: float, contatori: dict, lock: threading.Lock):
+    """Commit di un ospite ciascuno, con o senza l'incremento della versione"""
+    eseguiti = errori = 0
+    while time.perf_counter() < fine:
+        with Session(bind=motore) as session:
+            try:
+                session.execute(insert(Ospite).values(
+                    nome="Mario", cognome="Rossi", documento=uuid.uuid4().hex[:20], nazionalita="Italiana"
+                ))
+                if incrementa:
+                    session.execute(
+                        update(tabella_versione_dati)
+                        .where(tabella_versione_dati.c.id == 1)
+                        .values(versione=tabella_versione_dati.c.versione + 1)
+                        .returning(tabella_versione_dati.c.versione)
+                    ).scalar()
+                session.commit()
+                eseguiti += 1
+            except OperationalError as errore:
+                session.rollback()
+                if not errore_di_lock(errore):
+                    raise
+                errori += 1
+    with lock:
+        contatori["commit"] += eseguiti
+        contatori["errori"] += errori
+
+
+def misura(motore, incrementa: bool) -> dict:
+    contatori = {"commit": 0, "errori": 0}
+    lock = threading.Lock()
+    fine = time.perf_counter() + DURATA
+    thread = [
+        threading.Thread(target=scrittore, args=(motore, incrementa, fine, contatori, lock))
+        for _ in range(SCRITTORI)
+    ]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    return contatori
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cartella:
+        motore = crea_motore(f"sqlite:///{os.path.join(cartella, 'versione.db')}")
+        Base.metadata.create_all(bind=motore)
+        with motore.begin() as connessione:
+            connessione.execute(insert(tabella_versione_dati).values(id=1, versione=0, istanza="bench"))
+
+        print(f"{motore.dialect.name}, {SCRITTORI} scrittori, {DURATA:.0f}s per variante")
+        print(f"{'variante':<22} | {'commit/s':>9} | {'errori lock':>11}")
+        print("-" * 48)
+        for nome, incrementa in (("senza versione", False), ("con UPDATE versione", True)):
+            contatori = misura(motore, incrementa)
+            print(f"{nome:<22} | {contatori['commit'] / DURATA:>9.0f} | {contatori['errori']:>11}")
+        motore.dispose()
+
+
+if __name__ == "__main__":
+    main()
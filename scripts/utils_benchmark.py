@@ -0,0 +1,79 @@
+"""
+Funzioni comuni ai benchmark su database in memoria
+
+Usate da benchmark_disponibilita.py, benchmark_occupazione.py e
+benchmark_matrice.py: database SQLite in memoria con le camere, contatore
+delle query e misura della latenza media di una strategia.
+"""
+import os
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.database import Base
+from backend.models import Camera, TipoCamera
+
+RIPETIZIONI = 20
+
+
+def prepara_database(numero_camere: int):
+    """
+    Crea un database in memoria con 'numero_camere' camere (50 per piano)
+
+    Returns:
+        Tupla (engine, sessione, camere); le camere hanno già l'ID
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    tipi = list(TipoCamera)
+    camere: List[Camera] = [
+        Camera(numero=str(1000 + i), tipo=tipi[i % len(tipi)], piano=i // 50,
+               prezzo_per_notte=80 + (i % 5) * 20, servizi_inclusi="WiFi, TV")
+        for i in range(numero_camere)
+    ]
+    session.add_all(camere)
+    session.flush()
+    return engine, session, camere
+
+
+def conta_query(engine):
+    """Registra un contatore delle query eseguite sull'engine"""
+    contatore = {"query": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _conta(conn, cursor, statement, parameters, context, executemany):
+        contatore["query"] += 1
+
+    return contatore
+
+
+def misura(session, contatore, strategia: Callable, *argomenti, ripetizioni: int = RIPETIZIONI):
+    """
+    Esegue strategia(session, *argomenti) una volta contando le query, poi
+    'ripetizioni' volte misurando il tempo
+
+    Returns:
+        Tupla (query per esecuzione, latenza media in ms, risultato della prima esecuzione)
+    """
+    contatore["query"] = 0
+    risultato = strategia(session, *argomenti)
+    query = contatore["query"]
+
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        strategia(session, *argomenti)
+        session.expire_all()
+    latenza = (time.perf_counter() - inizio) / ripetizioni * 1000
+    return query, latenza, risultato
@@ -0,0 +1,891 @@
+"""
+Test delle API del backend
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import count
+
+# Database di test isolato: va configurato prima di importare il backend
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test_hotel.db"
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only
+from backend.database import THREADPOOL_THREAD, Base, SessionLocal, async_engine, crea_motore, engine
+from backend.export import _colonna_arrow
+from backend.indice_disponibilita import indice
+from backend.main import app
+from backend.migrazioni import MIGRAZIONI, applica_migrazioni, versioni_applicate, verifica_indici
+from backend import idempotenza, migrazioni, repliche, ricerca_ospiti
+from backend.models import Camera, Ospite, Prenotazione, StatisticaGiornaliera, StatoPrenotazione, TipoCamera
+
+_progressivo = count(1)
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def camera():
+    """Crea una camera nuova per ogni test"""
+    db = SessionLocal()
+    try:
+        nuova = Camera(
+            numero=f"T{next(_progressivo)}",
+            tipo=TipoCamera.DOPPIA,
+            piano=1,
+            prezzo_per_notte=100,
+            servizi_inclusi="WiFi"
+        )
+        db.add(nuova)
+        db.commit()
+        db.refresh(nuova)
+        return nuova
+    finally:
+        db.close()
+
+
+def dati_prenotazione(camera_id, giorni_da_oggi=10, notti=3, documento=None):
+    check_in = date.today() + timedelta(days=giorni_da_oggi)
+    return {
+        "camera_id": camera_id,
+        "data_check_in": str(check_in),
+        "data_check_out": str(check_in + timedelta(days=notti)),
+        "numero_ospiti": 2,
+        "ospite": {
+            "nome": "Mario",
+            "cognome": "Rossi",
+            "documento": documento or f"DOC{next(_progressivo):06d}",
+            "nazionalita": "Italiana"
+        }
+    }
+
+
+def test_prenotazioni_concorrenti_stessa_camera(client, camera):
+    """Centinaia di prenotazioni parallele per la stessa camera e date: ne vince una sola"""
+    richieste = [dati_prenotazione(camera.id) for _ in range(200)]
+
+    inizio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=40) as executor:
+        risposte = list(executor.map(lambda dati: client.post("/prenotazioni", json=dati), richieste))
+    durata = time.perf_counter() - inizio
+
+    stati = [r.status_code for r in risposte]
+    print(f"\n{len(richieste)} prenotazioni concorrenti in {durata:.2f}s "
+          f"({len(richieste) / durata:.0f} richieste/s)")
+
+    assert stati.count(200) == 1
+    assert stati.count(409) == len(richieste) - 1
+
+    db = SessionLocal()
+    try:
+        assert db.query(Prenotazione).filter(Prenotazione.camera_id == camera.id).count() == 1
+    finally:
+        db.close()
+
+
+def test_modifiche_concorrenti_stesse_date(client, camera):
+    """Due prenotazioni spostate in parallelo sulle stesse notti: una sola modifica riesce"""
+    prima = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 10)).json()
+    seconda = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 20)).json()
+    nuove_date = {
+        "data_check_in": str(date.today() + timedelta(days=15)),
+        "data_check_out": str(date.today() + timedelta(days=18))
+    }
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        risposte = list(executor.map(
+            lambda p: client.put(f"/prenotazioni/{p['id']}", json=nuove_date),
+            [prima, seconda] * 10
+        ))
+
+    stati = [r.status_code for r in risposte]
+    modificate = {r.json()["id"] for r in risposte if r.status_code == 200}
+    assert len(modificate) == 1
+    assert set(stati) <= {200, 409}
+
+
+@pytest.fixture
+def indice_attivo(monkeypatch):
+    """Indice di disponibilità caricato come con INDICE_DISPONIBILITA=1; conta le ricariche"""
+    attivo = indice.attivo
+    db = SessionLocal()
+    try:
+        indice.carica(db)
+    finally:
+        db.close()
+    ricariche = []
+    carica = indice.carica
+    monkeypatch.setattr(indice, "carica", lambda db: ricariche.append(1) or carica(db))
+    yield ricariche
+    # Senza versione, se resta attivo l'indice si ricarica alla prossima verifica
+    indice.attivo = attivo
+    indice.versione = None
+
+
+def date_soggiorno(giorni_da_oggi, notti=3):
+    check_in = date.today() + timedelta(days=giorni_da_oggi)
+    return {"data_check_in": str(check_in), "data_check_out": str(check_in + timedelta(days=notti))}
+
+
+def test_indice_disponibilita_sovrapposizioni_e_modifiche(client, camera, indice_attivo):
+    """Con l'indice attivo: sovrapposizioni rifiutate, soggiorni adiacenti ammessi, la prenotazione modificata esclusa"""
+    prima = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 10)).json()
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 12)).status_code == 409
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 8)).status_code == 409
+
+    # Il giorno di check-out di un soggiorno è libero per il check-in del successivo
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 13)).status_code == 200
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 7)).status_code == 200
+
+    percorso = f"/prenotazioni/{prima['id']}"
+    assert client.put(percorso, json=date_soggiorno(10, 2)).status_code == 200
+    assert client.put(percorso, json=date_soggiorno(11, 3)).status_code == 409
+    assert client.put(percorso, json=date_soggiorno(11, 2)).status_code == 200
+
+    verifica = client.get("/admin/indice-disponibilita/verifica").json()
+    assert verifica["attivo"] and verifica["mancanti"] == verifica["superflue"] == []
+    # Le scritture di questo processo aggiornano l'indice senza ricaricarlo
+    assert indice_attivo == []
+
+
+def test_indice_disponibilita_libera_e_si_ricarica_dopo_scritture_esterne(client, camera, indice_attivo):
+    """Cancellazione e check-out liberano le notti; una scrittura di un altro processo ricarica l'indice"""
+    oggi = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0)).json()
+    client.post(f"/prenotazioni/{oggi['id']}/check-in")
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 1)).status_code == 409
+    assert client.post(f"/prenotazioni/{oggi['id']}/check-out").status_code == 200
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 1)).status_code == 200
+
+    futura = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 20)).json()
+    assert client.delete(f"/prenotazioni/{futura['id']}").status_code == 200
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 20)).status_code == 200
+    assert indice_attivo == []
+
+    # Scrittura senza passare dall'API di questo processo (altro worker, CLI)
+    db = SessionLocal()
+    try:
+        esterna = Prenotazione(
+            camera_id=camera.id, ospite_id=oggi["ospite_id"], numero_ospiti=2, prezzo_totale=300,
+            stato=StatoPrenotazione.CONFERMATA,
+            data_check_in=date.today() + timedelta(days=30), data_check_out=date.today() + timedelta(days=33)
+        )
+        db.add(esterna)
+        db.commit()
+        esterna_id = esterna.id
+    finally:
+        db.close()
+    verifica = client.get("/admin/indice-disponibilita/verifica").json()
+    assert [voce["prenotazione_id"] for voce in verifica["mancanti"]] == [esterna_id]
+
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 31)).status_code == 409
+    assert indice_attivo == [1]
+    verifica = client.get("/admin/indice-disponibilita/verifica").json()
+    assert verifica["mancanti"] == verifica["superflue"] == []
+
+def test_ricerca_flessibile_finestre_tipo_prezzo_e_limiti(client, camera):
+    """Soggiorni liberi intorno a una prenotazione, filtro per tipo, ordine per prezzo e limiti dell'intervallo"""
+    db = SessionLocal()
+    try:
+        # L'unica suite e la camera più economica: le sue finestre vengono per prime
+        suite = db.get(Camera, camera.id)
+        suite.tipo = TipoCamera.SUITE
+        suite.prezzo_per_notte = 1
+        db.commit()
+    finally:
+        db.close()
+    assert client.post("/prenotazioni", json=dati_prenotazione(camera.id, 10)).status_code == 200
+
+    def cerca(giorno_inizio, giorno_fine, notti, **altri):
+        return client.post("/camere/disponibili/flessibile", json={
+            "data_inizio": str(date.today() + timedelta(days=giorno_inizio)),
+            "data_fine": str(date.today() + timedelta(days=giorno_fine)),
+            "notti": notti,
+            "limite": 200,
+            **altri
+        })
+
+    soggiorni = cerca(8, 16, 2).json()
+    # Check-in possibile il giorno del check-out (13), non la notte del check-in (9 → 11)
+    assert [
+        (s["data_check_in"], s["data_check_out"]) for s in soggiorni if s["camera"]["id"] == camera.id
+    ] == [(str(date.today() + timedelta(days=g)), str(date.today() + timedelta(days=g + 2))) for g in (8, 13, 14)]
+    assert soggiorni[0]["camera"]["id"] == camera.id and soggiorni[0]["prezzo_totale"] == 2
+    prezzi = [s["prezzo_totale"] for s in soggiorni]
+    assert prezzi == sorted(prezzi)
+
+    suite = cerca(8, 16, 2, tipo="suite").json()
+    assert {s["camera"]["id"] for s in suite} == {camera.id}
+    doppie = cerca(8, 16, 2, tipo="doppia").json()
+    assert doppie and {s["camera"]["tipo"] for s in doppie} == {"doppia"}
+    assert cerca(8, 16, 2, tipo="attico").status_code == 400
+
+    # Soggiorno più lungo dell'intervallo: nessun risultato
+    assert cerca(8, 11, 5).json() == []
+    assert cerca(0, 366, 2).status_code == 200
+    assert cerca(0, 367, 2).status_code == 400
+
+def test_pool_con_una_connessione_per_thread(tmp_path):
+    """Ogni thread del threadpool può tenere la connessione della sua sessione senza attendere il pool"""
+    motore = crea_motore(f"sqlite:///{tmp_path / 'pool.db'}")
+    connessioni = [motore.connect() for _ in range(THREADPOOL_THREAD)]
+    try:
+        assert motore.pool.size() == THREADPOOL_THREAD
+        assert motore.pool.checkedout() == THREADPOOL_THREAD
+    finally:
+        for connessione in connessioni:
+            connessione.close()
+        motore.dispose()
+
+
+def test_prenotazione_di_gruppo_tutto_o_niente(client, camera):
+    """Un conflitto nel gruppo annulla tutte le prenotazioni e l'errore indica l'indice"""
+    gruppo = [dati_prenotazione(camera.id, 10), dati_prenotazione(camera.id, 12)]
+
+    risposta = client.post("/prenotazioni/bulk", json=gruppo)
+    assert risposta.status_code == 409
+    assert [e["indice"] for e in risposta.json()["detail"]["errori"]] == [1]
+
+    gruppo[1] = dati_prenotazione(camera.id, 13)
+    risposta = client.post("/prenotazioni/bulk", json=gruppo)
+    assert risposta.status_code == 200
+    assert [p["data_check_in"] for p in risposta.json()] == [g["data_check_in"] for g in gruppo]
+
+
+def test_idempotency_key_ripete_la_prima_risposta(client, camera):
+    """Un nuovo tentativo con la stessa chiave riceve la risposta salvata senza duplicare"""
+    dati = dati_prenotazione(camera.id)
+    intestazioni = {"Idempotency-Key": f"test-{camera.id}"}
+
+    prima = client.post("/prenotazioni", json=dati, headers=intestazioni)
+    seconda = client.post("/prenotazioni", json=dati, headers=intestazioni)
+    assert prima.status_code == seconda.status_code == 200
+    assert seconda.json() == prima.json()
+    assert seconda.headers["Idempotency-Replayed"] == "true"
+
+    diversa = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 30), headers=intestazioni)
+    assert diversa.status_code == 422
+
+    percorso = f"/prenotazioni/{prima.json()['id']}"
+    chiave_cancellazione = {"Idempotency-Key": f"test-cancella-{camera.id}"}
+    assert client.delete(percorso, headers=chiave_cancellazione).status_code == 200
+    assert client.delete(percorso, headers=chiave_cancellazione).status_code == 200
+
+
+def test_pulizia_periodica_continua_dopo_un_errore(monkeypatch, caplog):
+    """Un errore della pulizia è registrato e il ciclo riprova all'intervallo successivo"""
+    tentativi = []
+
+    def pulisci(db):
+        tentativi.append(db)
+        if len(tentativi) == 1:
+            raise OperationalError("DELETE", {}, Exception("database is locked"))
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(idempotenza, "pulisci_risposte_scadute", pulisci)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(idempotenza.pulizia_periodica(SessionLocal, intervallo=0))
+    assert len(tentativi) == 2
+    assert "Pulizia delle risposte idempotenti scadute non riuscita" in caplog.text
+
+def test_prenotazioni_con_lo_stesso_documento_aggiornano_i_recapiti(client, camera):
+    """Lo stesso documento riusa l'ospite e aggiorna i recapiti indicati, senza perdere gli altri"""
+    documento = f"UPS{next(_progressivo):06d}"
+    prima = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 10, documento=documento)).json()
+
+    dati = dati_prenotazione(camera.id, 20, documento=documento)
+    dati["ospite"].update(email="mario.rossi@example.com", telefono="+39 333 0000001")
+    seconda = client.post("/prenotazioni", json=dati).json()
+
+    gruppo = [dati_prenotazione(camera.id, 30, documento=documento)]
+    gruppo[0]["ospite"]["telefono"] = "+39 333 0000002"
+    terza = client.post("/prenotazioni/bulk", json=gruppo).json()[0]
+
+    assert prima["ospite_id"] == seconda["ospite_id"] == terza["ospite_id"]
+    assert seconda["ospite"]["email"] == "mario.rossi@example.com"
+    db = SessionLocal()
+    try:
+        ospite = db.get(Ospite, prima["ospite_id"])
+        assert (ospite.email, ospite.telefono) == ("mario.rossi@example.com", "+39 333 0000002")
+        assert db.query(Ospite).filter(Ospite.documento == documento).count() == 1
+    finally:
+        db.close()
+
+def test_check_in_multiplo_esito_per_id(client, camera):
+    """Il check-in multiplo aggiorna le prenotazioni valide e segnala le altre per ID"""
+    prenotazioni = [
+        client.post("/prenotazioni", json=dati_prenotazione(camera.id, giorni)).json()["id"]
+        for giorni in (0, 3)
+    ]
+    client.post(f"/prenotazioni/{prenotazioni[1]}/check-in")
+
+    risposta = client.post("/prenotazioni/check-in", json={"ids": prenotazioni + [999999]})
+    assert risposta.status_code == 200
+    esiti = {r["prenotazione_id"]: r["esito"] for r in risposta.json()["risultati"]}
+    assert esiti == {prenotazioni[0]: "ok", prenotazioni[1]: "errore", 999999: "errore"}
+
+    risposta = client.post("/prenotazioni/check-out", json={"ids": prenotazioni})
+    assert risposta.json()["completate"] == 2
+    assert all(r["importo_totale"] == 300 for r in risposta.json()["risultati"])
+
+
+def conta_query(client, percorso, stato=200, **kwargs):
+    """
+    Numero di query SQL eseguite da una richiesta GET (anche in modalità async)
+
+    Escluse le letture della versione dei dati (ETag e cache), una chiave
+    primaria per richiesta.
+    """
+    istruzioni = []
+    ascolta = lambda *args: "FROM versione_dati" in args[2] or istruzioni.append(args[2])
+    motori = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+    for motore in motori:
+        event.listen(motore, "before_cursor_execute", ascolta)
+    try:
+        assert client.get(percorso, **kwargs).status_code == stato
+    finally:
+        for motore in motori:
+            event.remove(motore, "before_cursor_execute", ascolta)
+    return len(istruzioni)
+
+
+def test_arrivi_oggi_numero_query_costante(client):
+    """Camera e ospite sono caricati con le prenotazioni: le query non crescono con gli arrivi"""
+    def nuovo_arrivo():
+        db = SessionLocal()
+        try:
+            nuova = Camera(numero=f"A{next(_progressivo)}", tipo=TipoCamera.SINGOLA, piano=2,
+                           prezzo_per_notte=80, servizi_inclusi="WiFi")
+            db.add(nuova)
+            db.commit()
+            camera_id = nuova.id
+        finally:
+            db.close()
+        client.post("/prenotazioni", json=dati_prenotazione(camera_id, 0, 1))
+
+    nuovo_arrivo()
+    con_un_arrivo = conta_query(client, "/dashboard/arrivi-oggi")
+    for _ in range(5):
+        nuovo_arrivo()
+    assert conta_query(client, "/dashboard/arrivi-oggi") == con_un_arrivo
+
+
+def test_occupazione_una_query_con_filtro_piano(client, camera):
+    """Lo stato camere di un piano arriva da una sola query e riporta l'ospite in casa"""
+    prenotazione = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0, 2)).json()
+    client.post(f"/prenotazioni/{prenotazione['id']}/check-in")
+
+    assert conta_query(client, "/dashboard/occupazione?piano=1") == 1
+    stato = {s["camera"]["id"]: s for s in client.get("/dashboard/occupazione?piano=1").json()}
+    assert stato[camera.id]["occupata"] is True
+    assert stato[camera.id]["ospite"] == "Mario Rossi"
+    assert all(s["camera"]["piano"] == 1 for s in stato.values())
+
+
+def test_statistiche_dalla_cache_e_invalidate_dalle_scritture(client, camera):
+    """Le statistiche sono servite dalla cache finché una scrittura non le rende superate"""
+    prima = client.get("/dashboard/statistiche").json()
+    assert conta_query(client, "/dashboard/statistiche") == 0
+
+    prenotazione = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0, 2)).json()
+    client.post(f"/prenotazioni/{prenotazione['id']}/check-in")
+
+    dopo = client.get("/dashboard/statistiche").json()
+    assert dopo["totale_camere"] == prima["totale_camere"]
+    assert dopo["camere_occupate"] == prima["camere_occupate"] + 1
+    assert dopo["camere_libere"] == dopo["totale_camere"] - dopo["camere_occupate"]
+    assert dopo["ricavo_oggi"] == prima["ricavo_oggi"] + 100
+
+
+def test_elenco_prenotazioni_paginato_a_cursore(client, camera):
+    """Le pagine seguono (data_check_in, id) senza salti né duplicati, con i filtri applicati"""
+    create = [
+        client.post("/prenotazioni", json=dati_prenotazione(camera.id, giorni, 1)).json()["id"]
+        for giorni in (40, 42, 44, 46, 48)
+    ]
+    client.delete(f"/prenotazioni/{create[2]}")
+
+    lette, cursore = [], None
+    while True:
+        parametri = {"camera_id": camera.id, "stato": "confermata", "cognome": "ros", "limite": 2}
+        if cursore:
+            parametri["cursore"] = cursore
+        risposta = client.get("/prenotazioni", params=parametri)
+        assert risposta.status_code == 200
+        lette += [p["id"] for p in risposta.json()]
+        cursore = risposta.headers.get("X-Cursore-Successivo")
+        if not cursore:
+            break
+    assert lette == [create[0], create[1], create[3], create[4]]
+
+    assert client.get("/prenotazioni", params={"cursore": "non-valido"}).status_code == 400
+    assert client.get("/prenotazioni", params={"stato": "sconosciuto"}).status_code == 400
+
+    prima_pagina = client.get("/camere", params={"limite": 1})
+    seconda_pagina = client.get("/camere", params={"limite": 1, "cursore": prima_pagina.headers["X-Cursore-Successivo"]})
+    assert seconda_pagina.json()[0]["id"] > prima_pagina.json()[0]["id"]
+
+    # Senza parametri di paginazione tutte le camere, senza cursore
+    db = SessionLocal()
+    try:
+        db.add_all(
+            Camera(numero=f"P{next(_progressivo)}", tipo=TipoCamera.SINGOLA, piano=9, prezzo_per_notte=80, servizi_inclusi="WiFi")
+            for _ in range(101)
+        )
+        db.commit()
+        totale_camere = db.query(Camera).count()
+    finally:
+        db.close()
+    tutte = client.get("/camere")
+    assert len(tutte.json()) == totale_camere
+    assert "X-Cursore-Successivo" not in tutte.headers
+
+    cursore_non_intero = base64.urlsafe_b64encode(json.dumps([[1]]).encode()).decode()
+    assert client.get("/camere", params={"cursore": cursore_non_intero}).status_code == 400
+    cursore_non_intero = base64.urlsafe_b64encode(json.dumps(["2025-01-01", "x"]).encode()).decode()
+    assert client.get("/prenotazioni", params={"cursore": cursore_non_intero}).status_code == 400
+
+
+def test_ricerca_ospiti_per_prefisso_con_soggiorni(client, camera):
+    """La ricerca trova l'ospite per prefisso di cognome, documento o email e riporta i soggiorni"""
+    documento = f"RIC{next(_progressivo):06d}"
+    dati = dati_prenotazione(camera.id, 0, 2, documento=documento)
+    dati["ospite"].update(cognome="Esposìto", email=f"{documento.lower()}@esempio.it")
+    client.post("/prenotazioni", json=dati)
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 30, 2, documento=documento))
+
+    for q in (documento[:6], f"esposito {documento}", f"{documento.lower()}@esem"):
+        trovati = {o["documento"]: o for o in client.get("/ospiti/search", params={"q": q}).json()}
+        assert documento in trovati, q
+
+    ospite = trovati[documento]
+    assert ospite["numero_prenotazioni"] == 2
+    assert ospite["ultimo_soggiorno"]["data_check_in"] == dati["data_check_in"]
+    assert client.get("/ospiti/search", params={"q": "zzzinesistente"}).json() == []
+
+
+def test_ricerca_ospiti_stessi_risultati_con_e_senza_fts(client, monkeypatch):
+    """FTS5 e ricerca per prefisso ordinano per cognome e nome gli stessi candidati, i primi trovati per ID"""
+    nome = f"Ordine{next(_progressivo)}"
+    db = SessionLocal()
+
+    def cerca(q, limite):
+        risultati = {}
+        for fts in (True, False):
+            monkeypatch.setattr(ricerca_ospiti, "ricerca_fts", fts)
+            risultati[fts] = [o.cognome for o in ricerca_ospiti.cerca_ospiti(db, q, limite=limite)]
+        assert risultati[True] == risultati[False]
+        return risultati[True]
+
+    try:
+        for cognome in ("Zanardi", "Bianchi", "Amato", "Under_score", "Underxscore"):
+            db.add(Ospite(nome=nome, cognome=cognome, documento=f"ORD{next(_progressivo):06d}", nazionalita="Italiana"))
+        db.commit()
+        assert ricerca_ospiti.ricerca_fts
+
+        # Trovati entro i candidati: i primi per cognome tra tutti
+        assert cerca(nome, 2) == ["Amato", "Bianchi"]
+        # Candidati limitati: ordinati solo i primi trovati per ID
+        monkeypatch.setattr(ricerca_ospiti, "CANDIDATI_PER_RISULTATO", 1)
+        assert cerca(nome, 2) == ["Bianchi", "Zanardi"]
+
+        # '_' nel termine è un carattere e non il jolly di LIKE
+        monkeypatch.setattr(ricerca_ospiti, "ricerca_fts", False)
+        assert [o.cognome for o in ricerca_ospiti.cerca_ospiti(db, f"{nome} under_score")] == ["Under_score"]
+    finally:
+        db.close()
+
+
+def test_get_condizionale_con_etag(client, camera):
+    """If-None-Match con l'ETag corrente risponde 304 senza query; una scrittura cambia l'ETag"""
+    prima = client.get("/dashboard/arrivi-oggi")
+    etag = prima.headers["ETag"]
+
+    assert conta_query(client, "/dashboard/arrivi-oggi", 304, headers={"If-None-Match": etag}) == 0
+
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0, 1))
+    dopo = client.get("/dashboard/arrivi-oggi", headers={"If-None-Match": etag})
+    assert dopo.status_code == 200
+    assert dopo.headers["ETag"] != etag
+    assert len(dopo.json()) == len(prima.json()) + 1
+
+
+def test_versione_letta_una_volta_con_la_connessione_della_richiesta(client, camera):
+    """ETag, cache e statistiche riusano la versione letta dalla sessione della richiesta"""
+    motori = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+    for percorso in ("/camere", "/camere?limite=1", "/dashboard/statistiche"):
+        letture, connessioni = [], []
+        ascolta = lambda *args: "FROM versione_dati" in args[2] and letture.append(1)
+        conta_connessioni = lambda *args: connessioni.append(1)
+        for motore in motori:
+            event.listen(motore, "before_cursor_execute", ascolta)
+            event.listen(motore, "checkout", conta_connessioni)
+        try:
+            assert client.get(percorso).status_code == 200
+        finally:
+            for motore in motori:
+                event.remove(motore, "before_cursor_execute", ascolta)
+                event.remove(motore, "checkout", conta_connessioni)
+        assert (len(letture), len(connessioni)) == (1, 1), percorso
+
+
+@pytest.mark.skipif(async_engine is None, reason="solo con DATABASE_ASYNC=1 (eseguito da test_async.py)")
+def test_letture_async_con_sessione_e_cache_async(client, camera, monkeypatch):
+    """Con DATABASE_ASYNC=1 le GET di lettura sono coroutine sulla sessione async, con ETag e cache async"""
+    from backend import main
+
+    def dipendenze(dependant):
+        for dipendenza in dependant.dependencies:
+            yield dipendenza.call
+            yield from dipendenze(dipendenza)
+
+    percorsi = {rotta.path for rotta in main.letture_async.routes}
+    sostituite = [r for r in app.routes if isinstance(r, APIRoute) and r.path in percorsi and "GET" in r.methods]
+    assert {rotta.path for rotta in sostituite} == percorsi
+    for rotta in sostituite:
+        assert asyncio.iscoroutinefunction(rotta.endpoint), rotta.path
+        assert repliche.get_async_db_lettura in set(dipendenze(rotta.dependant)), rotta.path
+
+    chiavi = []
+    leggi_o_calcola_async = main.leggi_o_calcola_async
+
+    async def conta_cache(chiave, *argomenti, **opzioni):
+        chiavi.append(chiave)
+        return await leggi_o_calcola_async(chiave, *argomenti, **opzioni)
+
+    monkeypatch.setattr(main, "leggi_o_calcola_async", conta_cache)
+    prenotazione = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0)).json()
+
+    camere = client.get("/camere")
+    assert camere.status_code == 200 and camera.id in {c["id"] for c in camere.json()}
+    assert client.get("/camere", headers={"If-None-Match": camere.headers["ETag"]}).status_code == 304
+    assert chiavi
+    assert len(client.get("/camere?limite=1").json()) == 1
+    assert [p["id"] for p in client.get(f"/prenotazioni?camera_id={camera.id}").json()] == [prenotazione["id"]]
+    assert client.get(f"/prenotazioni/{prenotazione['id']}").json()["ospite"]["cognome"] == "Rossi"
+    assert prenotazione["id"] in {p["id"] for p in client.get("/dashboard/arrivi-oggi").json()}
+    assert client.get("/dashboard/partenze-oggi").status_code == 200
+    assert camera.id in {c["camera"]["id"] for c in client.get("/dashboard/occupazione").json()}
+    assert client.get("/dashboard/statistiche").json()["totale_camere"] >= 1
+    assert prenotazione["ospite_id"] in {o["id"] for o in client.get(
+        "/ospiti/search", params={"q": prenotazione["ospite"]["documento"]}
+    ).json()}
+
+def test_scritture_di_un_altro_processo_superano_etag_e_cache(client):
+    """Una camera aggiunta da un altro processo cambia l'ETag e svuota le cache del catalogo e delle statistiche"""
+    ricerca = {"data_check_in": str(date.today() + timedelta(days=700)), "data_check_out": str(date.today() + timedelta(days=702))}
+    camere = client.get("/camere")
+    statistiche = client.get("/dashboard/statistiche").json()
+    client.post("/camere/disponibili", json=ricerca)
+
+    numero = f"X{next(_progressivo)}"
+    subprocess.run([sys.executable, "-c", (
+        "from backend.database import SessionLocal\n"
+        "from backend.models import Camera, TipoCamera\n"
+        "db = SessionLocal()\n"
+        f"db.add(Camera(numero='{numero}', tipo=TipoCamera.SINGOLA, piano=3, prezzo_per_notte=70, servizi_inclusi='WiFi'))\n"
+        "db.commit()\n"
+    )], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    dopo = client.get("/camere", headers={"If-None-Match": camere.headers["ETag"]})
+    assert dopo.status_code == 200
+    assert numero in {c["numero"] for c in dopo.json()}
+    assert client.get("/dashboard/statistiche").json()["totale_camere"] == statistiche["totale_camere"] + 1
+    assert numero in {c["numero"] for c in client.post("/camere/disponibili", json=ricerca).json()}
+
+
+def test_cache_ricerca_invalidata_solo_sulle_date_toccate(client, camera):
+    """Una prenotazione invalida le ricerche sovrapposte alle sue date e lascia in cache le altre"""
+    def ricerca(giorni):
+        check_in = date.today() + timedelta(days=giorni)
+        return {"data_check_in": str(check_in), "data_check_out": str(check_in + timedelta(days=2))}
+
+    vicina, lontana = ricerca(60), ricerca(90)
+    for dati in (vicina, lontana):
+        client.post("/camere/disponibili", json=dati)
+    prima = client.get("/admin/cache/statistiche").json()
+
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 61, 1))
+    libere_vicina = client.post("/camere/disponibili", json=vicina).json()
+    client.post("/camere/disponibili", json=lontana)
+    dopo = client.get("/admin/cache/statistiche").json()
+
+    assert camera.id not in {c["id"] for c in libere_vicina}
+    assert dopo["invalidate"] - prima["invalidate"] == 1
+    assert dopo["hit"] - prima["hit"] == 1
+    assert dopo["miss"] - prima["miss"] == 1
+
+
+def test_export_prenotazioni_csv_e_ndjson(client, camera):
+    """L'export in streaming include camera e ospite e filtra per data di check-in"""
+    prenotazione = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 200, 2)).json()
+    giorno = prenotazione["data_check_in"]
+
+    risposta = client.get("/export/prenotazioni", params={"formato": "csv", "da": giorno, "a": giorno})
+    assert risposta.status_code == 200
+    assert risposta.headers["content-type"].startswith("text/csv")
+    righe = risposta.text.splitlines()
+    assert righe[0].startswith("id,data_check_in,data_check_out,stato")
+    assert len(righe) == 2 and righe[1].startswith(f"{prenotazione['id']},{giorno}")
+
+    risposta = client.get("/export/prenotazioni", params={"formato": "ndjson", "da": giorno, "a": giorno})
+    (riga,) = [json.loads(r) for r in risposta.text.splitlines()]
+    assert riga["camera_numero"] == camera.numero
+    assert riga["ospite_cognome"] == "Rossi"
+    assert riga["stato"] == "confermata"
+
+    assert client.get("/export/prenotazioni", params={"formato": "xml"}).status_code == 400
+
+
+def test_export_parquet_colonne_tipizzate(client, camera):
+    """L'export Parquet ha date, enum a dizionario e prezzi decimali"""
+    prenotazione = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 210, 2)).json()
+    giorno = prenotazione["data_check_in"]
+
+    risposta = client.get("/export/prenotazioni", params={"formato": "parquet", "da": giorno, "a": giorno})
+    tabella = pq.read_table(io.BytesIO(risposta.content))
+
+    assert tabella.schema.field("data_check_in").type == pa.date32()
+    assert pa.types.is_dictionary(tabella.schema.field("stato").type)
+    assert pa.types.is_decimal(tabella.schema.field("prezzo_totale").type)
+    (riga,) = tabella.to_pylist()
+    assert str(riga["data_check_in"]) == giorno
+    assert riga["camera_tipo"] == "doppia"
+    assert riga["prezzo_totale"] == Decimal("200.00")
+
+
+def test_matrice_disponibilita_segmenti_per_camera(client, camera):
+    """La matrice riporta i soggiorni attivi tagliati sul periodo e filtra per tipo di camera"""
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 598, 2))
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 600, 3))
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 605, 1))
+    cancellata = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 607, 2)).json()
+    client.delete(f"/prenotazioni/{cancellata['id']}")
+    periodo = {"da": str(date.today() + timedelta(days=599)), "a": str(date.today() + timedelta(days=610))}
+
+    matrice = client.get("/disponibilita/matrice", params={**periodo, "formato": "segmenti", "tipo": "doppia"}).json()
+    righe = {c["id"]: c["occupazione"] for c in matrice["camere"]}
+    assert righe[camera.id] == [[0, 4], [6, 1]]
+
+    suite = client.get("/disponibilita/matrice", params={**periodo, "tipo": "suite"}).json()
+    assert camera.id not in {c["id"] for c in suite["camere"]}
+
+
+def test_export_colonna_date_da_testo_e_da_date():
+    """Le date diventano date32 sia come testo (SQLite) sia come datetime.date (PostgreSQL)"""
+    giorno = date(2025, 3, 1)
+    for valori in (("2025-03-01", None), (giorno, None)):
+        colonna = _colonna_arrow("data_check_in", valori, pa.date32())
+        assert colonna.type == pa.date32()
+        assert colonna.to_pylist() == [giorno, None]
+
+
+def test_report_kpi_ripartisce_il_prezzo_sulle_notti(client, camera):
+    """Il prezzo è ripartito sulle notti: ADR per notte, ricavo diviso tra i mesi, cancellazioni per check-in"""
+    # Soggiorno di 4 notti a cavallo di due mesi, lontano dagli altri test
+    giorno = date.today() + timedelta(days=400)
+    giorni_al_mese = (date(giorno.year + giorno.month // 12, giorno.month % 12 + 1, 1) - giorno).days
+    arrivo = 400 + giorni_al_mese - 2
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, arrivo, 4))
+    cancellata = client.post("/prenotazioni", json=dati_prenotazione(camera.id, arrivo + 10, 1)).json()
+    client.delete(f"/prenotazioni/{cancellata['id']}")
+
+    da = date.today() + timedelta(days=arrivo - 5)
+    a = date.today() + timedelta(days=arrivo + 15)
+    risposta = client.get("/report/kpi", params={"da": str(da), "a": str(a), "granularita": "mese", "tipo": "doppia"})
+    assert risposta.status_code == 200
+    report = risposta.json()
+
+    assert [p["notti_vendute"] for p in report["periodi"]] == [2, 2]
+    assert [p["ricavo"] for p in report["periodi"]] == [200.0, 200.0]
+    totale = report["totale"]
+    assert totale["notti_vendute"] == 4
+    assert totale["adr"] == 100.0
+    assert totale["revpar"] == round(400 / totale["camere_notte_disponibili"], 2)
+    assert totale["cancellazioni"] == 1
+
+    assert client.get("/report/kpi", params={"da": str(a), "a": str(da)}).status_code == 400
+    assert client.get("/report/kpi", params={"da": str(da), "a": str(a), "granularita": "anno"}).status_code == 400
+
+
+def test_statistiche_giornaliere_incrementali_uguali_alla_ricostruzione(client, camera):
+    """Creazione, modifica e cancellazione aggiornano le righe come una ricostruzione completa"""
+    def righe(da, a):
+        db = SessionLocal()
+        try:
+            return {
+                (r.giorno, r.tipo): (r.camere_vendute, round(r.ricavo, 2), r.arrivi, r.partenze, r.cancellazioni)
+                for r in db.query(StatisticaGiornaliera).filter(
+                    StatisticaGiornaliera.giorno >= da, StatisticaGiornaliera.giorno <= a
+                )
+            }
+        finally:
+            db.close()
+
+    spostata = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 500, 3)).json()
+    cancellata = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 510, 2)).json()
+    nuovo_arrivo = date.today() + timedelta(days=502)
+    client.put(f"/prenotazioni/{spostata['id']}", json={
+        "data_check_in": str(nuovo_arrivo),
+        "data_check_out": str(nuovo_arrivo + timedelta(days=4))
+    })
+    client.delete(f"/prenotazioni/{cancellata['id']}")
+
+    # Modifiche di una prenotazione scaduta dopo il commit e di una con i soli id caricati
+    scaduta = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 507, 2)).json()
+    non_caricata = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 512, 2)).json()
+    db = SessionLocal()
+    try:
+        prenotazione = db.get(Prenotazione, scaduta["id"])
+        db.commit()
+        prenotazione.stato = StatoPrenotazione.CANCELLATA
+        db.commit()
+        db.get(Prenotazione, non_caricata["id"], options=[load_only(Prenotazione.id)]).prezzo_totale = 50.0
+        db.commit()
+    finally:
+        db.close()
+
+    da, a = date.today() + timedelta(days=495), date.today() + timedelta(days=515)
+    incrementali = righe(da, a)
+    assert incrementali[(nuovo_arrivo, TipoCamera.DOPPIA)][0] >= 1
+    assert incrementali[(nuovo_arrivo + timedelta(days=4), TipoCamera.DOPPIA)][3] >= 1
+    assert incrementali[(date.fromisoformat(cancellata["data_check_in"]), TipoCamera.DOPPIA)][4] >= 1
+
+    risposta = client.post("/admin/statistiche-giornaliere/ricostruisci", params={"da": str(da), "a": str(a)})
+    assert risposta.status_code == 200
+    # La ricostruzione non scrive le righe a zero lasciate dalle sottrazioni
+    assert {k: v for k, v in incrementali.items() if any(v)} == righe(da, a)
+
+
+def test_migrazioni_registrate_e_indici_usati(client, camera, tmp_path, monkeypatch):
+    """Le migrazioni sono registrate una volta, atomiche, e le query frequenti usano gli indici composti"""
+    client.post("/prenotazioni", json=dati_prenotazione(camera.id, 0, 2))
+
+    assert set(versioni_applicate(engine)) == {versione for versione, _, _ in MIGRAZIONI}
+    assert applica_migrazioni(engine) == []
+
+    db = SessionLocal()
+    try:
+        assert verifica_indici(db) == []
+    finally:
+        db.close()
+
+    # Una migrazione fallita non lascia né il suo DDL né la registrazione
+    def fallita(connessione):
+        connessione.execute(text("CREATE TABLE prova_migrazione (id INTEGER)"))
+        raise RuntimeError("migrazione fallita")
+
+    motore = crea_motore(f"sqlite:///{tmp_path / 'migrazioni.db'}")
+    monkeypatch.setattr(migrazioni, "MIGRAZIONI", [("9999", "Prova", fallita)])
+    with pytest.raises(RuntimeError):
+        applica_migrazioni(motore)
+    assert "prova_migrazione" not in inspect(motore).get_table_names()
+    assert versioni_applicate(motore) == {}
+    motore.dispose()
+
+
+def test_migrazioni_portano_lo_schema_iniziale_agli_indici_del_modello(tmp_path):
+    """Un database con lo schema iniziale, migrato, ha gli stessi indici di uno nuovo"""
+    def indici(motore):
+        with motore.connect() as connessione:
+            return {
+                tabella: {tuple(riga[1:]) for riga in connessione.exec_driver_sql(f"PRAGMA index_list('{tabella}')")}
+                for tabella in inspect(motore).get_table_names()
+            }
+
+    nuovo = crea_motore(f"sqlite:///{tmp_path / 'nuovo.db'}")
+    Base.metadata.create_all(nuovo)
+    applica_migrazioni(nuovo)
+
+    # Schema iniziale: solo camere, ospiti e prenotazioni, con gli indici sulle singole colonne
+    aggiornato = crea_motore(f"sqlite:///{tmp_path / 'aggiornato.db'}")
+    Base.metadata.create_all(aggiornato)
+    with aggiornato.begin() as connessione:
+        for tabella in reversed(Base.metadata.sorted_tables):
+            if tabella.name not in ("camere", "ospiti", "prenotazioni"):
+                connessione.execute(text(f"DROP TABLE {tabella.name}"))
+        for indice in ("ix_prenotazioni_check_in_id", "ix_prenotazioni_attive_camera", "ix_prenotazioni_stato_check_in",
+                       "ix_prenotazioni_camera_id", "ix_prenotazioni_ospite_id"):
+            connessione.execute(text(f"DROP INDEX {indice}"))
+        connessione.execute(text("CREATE INDEX ix_prenotazioni_data_check_in ON prenotazioni (data_check_in)"))
+        connessione.execute(text("CREATE INDEX ix_prenotazioni_stato ON prenotazioni (stato)"))
+
+    Base.metadata.create_all(aggiornato)
+    assert applica_migrazioni(aggiornato) == [versione for versione, _, _ in MIGRAZIONI]
+    assert indici(aggiornato) == indici(nuovo)
+    nuovo.dispose()
+    aggiornato.dispose()
+
+
+def test_letture_su_replica_entro_il_ritardo_e_sul_primario_dopo_una_scrittura(client, camera, tmp_path, monkeypatch):
+    """Chi ha scritto legge dal primario per la finestra del cookie, gli altri dalla replica entro il ritardo ammesso"""
+    replica = repliche.ReplicaLocale(str(tmp_path / "replica.db"))
+    monkeypatch.setattr(repliche, "repliche", [replica])
+    monkeypatch.setattr(repliche, "REPLICHE_CONTROLLO", 0)
+    letture = []
+    for motore in (replica.motore, replica.motore_async and replica.motore_async.sync_engine):
+        if motore is not None:
+            event.listen(
+                motore, "before_cursor_execute",
+                lambda conn, cursor, istruzione, *argomenti: "versione_dati" not in istruzione and letture.append(1)
+            )
+    percorso = f"/prenotazioni?camera_id={camera.id}"
+
+    try:
+        # Replica non ancora copiata: primario
+        assert client.get(percorso).json() == []
+        assert letture == []
+
+        assert replica.sincronizza()
+        assert client.get(percorso).json() == []
+        assert letture
+
+        # Chi ha scritto legge dal primario grazie al cookie
+        risposta = client.post("/prenotazioni", json=dati_prenotazione(camera.id, 20))
+        assert risposta.status_code == 200
+        assert repliche.COOKIE_SCRITTURA in risposta.cookies
+        letture.clear()
+        assert len(client.get(percorso).json()) == 1
+        assert letture == []
+
+        # Gli altri client leggono la replica, indietro di una versione entro il limite
+        client.cookies.clear()
+        assert client.get(percorso).json() == []
+        assert letture
+        letture.clear()
+        esportate = client.get("/export/prenotazioni?formato=ndjson").text.splitlines()
+        assert letture
+        assert not any(f'"camera_id": {camera.id},' in riga for riga in esportate)
+
+        # Oltre il ritardo ammesso: primario
+        monkeypatch.setattr(repliche, "REPLICHE_RITARDO_VERSIONI", 0)
+        letture.clear()
+        assert len(client.get(percorso).json()) == 1
+        assert letture == []
+
+        # Riallineata: di nuovo la replica
+        assert replica.sincronizza()
+        assert not replica.sincronizza()
+        assert len(client.get(percorso).json()) == 1
+        assert letture
+    finally:
+        client.cookies.clear()
+        replica.motore.dispose()
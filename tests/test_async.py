@@ -0,0 +1,29 @@
+"""
+Test delle letture in modalità async (DATABASE_ASYNC=1)
+
+DATABASE_ASYNC è letto all'import di backend.database e le rotte async
+sostituiscono quelle sincrone all'import di backend.main: i test delle API
+sono rieseguiti in un processo separato con la variabile impostata.
+"""
+import os
+import subprocess
+import sys
+import pytest
+
+CARTELLA_TEST = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.skipif(os.getenv("DATABASE_ASYNC") == "1", reason="test delle API già eseguiti in modalità async")
+def test_api_in_modalita_async():
+    """Tutti i test delle API passano anche con le letture async (sessione, ETag e cache async)"""
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    esito = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", os.path.join(CARTELLA_TEST, "test_api.py")],
+        cwd=os.path.dirname(CARTELLA_TEST),
+        env={**os.environ, "DATABASE_ASYNC": "1"},
+        capture_output=True,
+        text=True
+    )
+    assert esito.returncode == 0, esito.stdout[-4000:]
+    assert " skipped" not in esito.stdout.splitlines()[-1], esito.stdout.splitlines()[-1]